@@ -0,0 +1,77 @@
+"""
+Uploaded audio handling for STT.
+
+Uploads are decoded straight from the request bytes into the 16 kHz mono
+float32 buffer Whisper works on, so transcription never waits for the upload
+to be written to disk and read back. The original file is archived for the
+history afterwards (archive_upload, run as a background task once the
+response has been sent).
+"""
+import io
+
+import numpy as np
+
+from tracing import span
+
+WHISPER_SAMPLE_RATE = 16000
+LOWPASS_TAPS = 101
+
+
+def _lowpass(audio: np.ndarray, sample_rate: int, cutoff: float) -> np.ndarray:
+    """Windowed-sinc FIR low-pass filter."""
+    n = np.arange(LOWPASS_TAPS) - (LOWPASS_TAPS - 1) / 2
+    kernel = np.sinc(2 * cutoff / sample_rate * n) * np.hamming(LOWPASS_TAPS)
+    return np.convolve(audio, kernel / kernel.sum(), mode="same")
+
+
+def _resample(audio: np.ndarray, sample_rate: int) -> np.ndarray:
+    if sample_rate == WHISPER_SAMPLE_RATE:
+        return audio
+    if sample_rate % WHISPER_SAMPLE_RATE == 0:
+        # 32/48 kHz: averaging each group of samples doubles as the low-pass filter
+        factor = sample_rate // WHISPER_SAMPLE_RATE
+        usable = len(audio) - len(audio) % factor
+        return audio[:usable].reshape(-1, factor).mean(axis=1)
+    if sample_rate > WHISPER_SAMPLE_RATE:
+        # Remove what 16 kHz can't represent, or it folds back into speech frequencies
+        audio = _lowpass(audio, sample_rate, 0.45 * WHISPER_SAMPLE_RATE)
+    target = int(round(len(audio) * WHISPER_SAMPLE_RATE / sample_rate))
+    positions = np.linspace(0, len(audio) - 1, num=target, dtype=np.float64)
+    return np.interp(positions, np.arange(len(audio)), audio)
+
+
+def decode_upload(data: bytes):
+    """
+    16 kHz mono float32 samples of an uploaded file. WAV/FLAC/OGG/MP3 at 16 kHz
+    or a multiple of it are read with libsndfile; anything else (e.g. 44.1 kHz
+    WAV, WebM/Opus from browser recorders) with PyAV through faster-whisper,
+    whose resampler filters properly. If neither can decode it, the encoded
+    bytes are returned unchanged for the transcriber to handle.
+    """
+    audio = sample_rate = None
+    try:
+        import soundfile as sf
+        audio, sample_rate = sf.read(io.BytesIO(data), dtype="float32", always_2d=True)
+        audio = audio.mean(axis=1)
+        if sample_rate % WHISPER_SAMPLE_RATE == 0:
+            return np.ascontiguousarray(_resample(audio, sample_rate), dtype=np.float32)
+    except Exception:
+        pass
+    try:
+        from faster_whisper import decode_audio
+        return decode_audio(io.BytesIO(data), sampling_rate=WHISPER_SAMPLE_RATE)
+    except Exception:
+        if audio is not None:
+            return np.ascontiguousarray(_resample(audio, sample_rate), dtype=np.float32)
+        return data
+
+
+def archive_upload(path: str, data: bytes) -> bool:
+    """Write an upload to its history path (run after the response). False if it failed."""
+    try:
+        with span("upload.archive", bytes=len(data)), open(path, "wb") as f:
+            f.write(data)
+        return True
+    except OSError as e:
+        print(f"Warning: Could not archive audio to {path}: {e}")
+        return False
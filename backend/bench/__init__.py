@@ -0,0 +1,4 @@
+"""
+Offline benchmark and load-test harness for the AI Playground API.
+Run from the backend directory: python -m bench.run --help
+"""
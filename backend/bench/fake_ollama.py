@@ -0,0 +1,247 @@
+"""
+Fake Ollama HTTP server for offline benchmarks.
+Implements the subset of the Ollama REST API the backend uses, with a
+configurable time-to-first-token and token rate so LLM-bound endpoints
+can be load-tested without a GPU or real models.
+"""
+import argparse
+import hashlib
+import json
+import math
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_MODELS = [
+    {"name": "llama3.2-vision:latest", "family": "mllama", "capabilities": ["completion", "vision"]},
+    {"name": "llama3.2:latest", "family": "llama", "capabilities": ["completion", "tools"]},
+    {"name": "nomic-embed-text:latest", "family": "nomic-bert", "capabilities": ["embedding"]},
+]
+
+FILLER_WORDS = (
+    "the quick brown fox jumps over the lazy dog while local models "
+    "stream tokens back to the playground one word at a time"
+).split()
+
+
+class FakeOllamaConfig:
+    def __init__(self, token_rate=50.0, first_token_ms=100.0, response_tokens=64,
+                 embedding_dim=768, embed_ms=5.0):
+        self.token_rate = token_rate            # tokens per second per request
+        self.first_token_ms = first_token_ms    # simulated prompt-eval time
+        self.response_tokens = response_tokens  # tokens per generated answer
+        self.embedding_dim = embedding_dim
+        self.embed_ms = embed_ms                # simulated latency per embedded text
+
+
+def fake_embedding(text: str, dim: int) -> list:
+    """
+    Deterministic bag-of-hashed-words embedding.
+    Texts sharing words get similar vectors, so RAG retrieval still behaves sensibly.
+    """
+    vec = [0.0] * dim
+    for word in text.lower().split():
+        h = int.from_bytes(hashlib.md5(word.encode()).digest()[:8], "little")
+        vec[h % dim] += 1.0 if (h >> 32) & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _model_entry(model: dict) -> dict:
+    return {
+        "name": model["name"],
+        "model": model["name"],
+        "modified_at": _now(),
+        "size": 1_000_000,
+        "digest": hashlib.sha256(model["name"].encode()).hexdigest(),
+        "details": {
+            "format": "gguf",
+            "family": model["family"],
+            "families": [model["family"]],
+            "parameter_size": "1B",
+            "quantization_level": "Q4_0",
+        },
+    }
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    server_version = "FakeOllama/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def config(self) -> FakeOllamaConfig:
+        return self.server.config
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        return json.loads(body or b"{}")
+
+    def _send_json(self, payload: dict, status: int = 200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _tokens(self):
+        for i in range(self.config.response_tokens):
+            yield FILLER_WORDS[i % len(FILLER_WORDS)] + " "
+
+    def _generate(self, request: dict, key: str):
+        """Shared implementation for /api/chat (key='message') and /api/generate (key='response')."""
+        model = request.get("model", "")
+        stream = request.get("stream", True)
+        start = time.perf_counter()
+        time.sleep(self.config.first_token_ms / 1000)
+        interval = 1.0 / self.config.token_rate if self.config.token_rate > 0 else 0.0
+
+        def wrap(content, done):
+            body = {"model": model, "created_at": _now(), "done": done}
+            if key == "message":
+                body["message"] = {"role": "assistant", "content": content}
+            else:
+                body["response"] = content
+            if done:
+                body.update({
+                    "done_reason": "stop",
+                    "total_duration": int((time.perf_counter() - start) * 1e9),
+                    "prompt_eval_count": 16,
+                    "eval_count": self.config.response_tokens,
+                })
+            return body
+
+        if not stream:
+            time.sleep(interval * self.config.response_tokens)
+            self._send_json(wrap("".join(self._tokens()), True))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in self._tokens():
+                time.sleep(interval)
+                self._write_chunk(json.dumps(wrap(token, False)) + "\n")
+            self._write_chunk(json.dumps(wrap("", True)) + "\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # Client went away mid-stream, exactly like real Ollama we stop generating.
+            pass
+
+    def _write_chunk(self, text: str):
+        data = text.encode()
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [_model_entry(m) for m in self.server.models]})
+        elif self.path == "/api/ps":
+            self._send_json({"models": [_model_entry(m) for m in self.server.models[:1]]})
+        elif self.path == "/api/version":
+            self._send_json({"version": "0.0.0-fake"})
+        elif self.path in ("/", ""):
+            data = b"Ollama is running"
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path == "/api/chat":
+            self._generate(request, "message")
+        elif self.path == "/api/generate":
+            self._generate(request, "response")
+        elif self.path == "/api/embeddings":
+            time.sleep(self.config.embed_ms / 1000)
+            self._send_json({"embedding": fake_embedding(request.get("prompt", ""), self.config.embedding_dim)})
+        elif self.path == "/api/embed":
+            inputs = request.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(self.config.embed_ms * len(inputs) / 1000)
+            self._send_json({
+                "model": request.get("model", ""),
+                "embeddings": [fake_embedding(t, self.config.embedding_dim) for t in inputs],
+            })
+        elif self.path == "/api/show":
+            name = request.get("model") or request.get("name", "")
+            model = next((m for m in self.server.models if m["name"] == name or m["name"].split(":")[0] == name), None)
+            if model is None:
+                self._send_json({"error": f"model '{name}' not found"}, status=404)
+                return
+            entry = _model_entry(model)
+            self._send_json({
+                "details": entry["details"],
+                "model_info": {"general.architecture": model["family"]},
+                "capabilities": model["capabilities"],
+            })
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+
+class FakeOllamaServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config: FakeOllamaConfig, models=None):
+        super().__init__(address, FakeOllamaHandler)
+        self.config = config
+        self.models = models or DEFAULT_MODELS
+
+
+def start_fake_ollama(host: str = "127.0.0.1", port: int = 0, config: FakeOllamaConfig = None) -> FakeOllamaServer:
+    """
+    Start the fake server on a background thread. Use port=0 to pick a free port;
+    the bound address is available as server.server_address.
+    """
+    server = FakeOllamaServer((host, port), config or FakeOllamaConfig())
+    thread = threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake Ollama server for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Generated tokens per second")
+    parser.add_argument("--first-token-ms", type=float, default=100.0)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--embedding-dim", type=int, default=768)
+    args = parser.parse_args()
+
+    config = FakeOllamaConfig(
+        token_rate=args.token_rate,
+        first_token_ms=args.first_token_ms,
+        response_tokens=args.response_tokens,
+        embedding_dim=args.embedding_dim,
+    )
+    server = FakeOllamaServer((args.host, args.port), config)
+    print(f"Fake Ollama listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
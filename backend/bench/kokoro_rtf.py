@@ -0,0 +1,113 @@
+"""
+Real-time factor benchmark for Kokoro ONNX Runtime configurations.
+
+RTF = synthesis wall time / duration of the produced audio (lower is better,
+below 1.0 is faster than real time). Every combination of the given options is
+loaded as its own session and measured at each concurrency level, so thread
+over-subscription under parallel requests shows up directly.
+
+Needs the real model files in backend/models. From the backend directory:
+    python -m bench.kokoro_rtf --intra 0,1,2,4 --concurrency 1,4
+    python -m bench.kokoro_rtf --quantized 0,1 --graph-optimization basic,all --output rtf.json
+"""
+import argparse
+import itertools
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench.synthetic import SENTENCES
+from kokoro_runtime import SESSION_CONFIG, VoiceStyleCache, load_kokoro, model_path_for
+from ollama_scheduler import percentile
+from speech_models import KOKORO_VOICES_BIN
+
+
+def _csv(cast):
+    return lambda value: [cast(v) for v in value.split(",") if v]
+
+
+def measure(kokoro, text, voice, concurrency, rounds, style_cache):
+    styles = VoiceStyleCache()
+
+    def one(_):
+        voice_arg = styles.get(kokoro, voice) if style_cache else voice
+        start = time.perf_counter()
+        samples, sample_rate = kokoro.create(text, voice=voice_arg, speed=1.0, lang="en-us")
+        elapsed = time.perf_counter() - start
+        return elapsed, len(samples) / sample_rate
+
+    one(None)  # warm-up, not measured
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        runs = list(pool.map(one, range(rounds * concurrency)))
+    wall = time.perf_counter() - start
+
+    rtfs = [elapsed / audio for elapsed, audio in runs]
+    audio_total = sum(audio for _, audio in runs)
+    return {
+        "rtf_p50": percentile(rtfs, 50),
+        "rtf_p95": percentile(rtfs, 95),
+        "latency_p50_s": percentile([e for e, _ in runs], 50),
+        # Seconds of audio produced per wall-clock second across all threads
+        "throughput_x_realtime": audio_total / wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kokoro real-time factor per ONNX Runtime configuration")
+    parser.add_argument("--intra", type=_csv(int), default=[SESSION_CONFIG["intra_op_threads"]],
+                        help="Intra-op thread counts (0 = ONNX Runtime default)")
+    parser.add_argument("--inter", type=_csv(int), default=[SESSION_CONFIG["inter_op_threads"]])
+    parser.add_argument("--execution-mode", type=_csv(str), default=[SESSION_CONFIG["execution_mode"]])
+    parser.add_argument("--graph-optimization", type=_csv(str), default=[SESSION_CONFIG["graph_optimization"]])
+    parser.add_argument("--cpu-arena", type=_csv(int), default=[int(SESSION_CONFIG["cpu_arena"])])
+    parser.add_argument("--quantized", type=_csv(int), default=[int(SESSION_CONFIG["quantized"])])
+    parser.add_argument("--style-cache", type=_csv(int), default=[1], help="1 = pre-resolved voice styles, 0 = by name")
+    parser.add_argument("--concurrency", type=_csv(int), default=[1])
+    parser.add_argument("--rounds", type=int, default=5, help="Syntheses per thread")
+    parser.add_argument("--voice", default="af_sarah")
+    parser.add_argument("--sentences", type=int, default=3, help="Length of the test text")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    text = " ".join(SENTENCES[:args.sentences])
+    results = []
+    grid = itertools.product(args.intra, args.inter, args.execution_mode, args.graph_optimization,
+                             args.cpu_arena, args.quantized)
+    for intra, inter, mode, opt, arena, quantized in grid:
+        config = {
+            **SESSION_CONFIG,
+            "intra_op_threads": intra,
+            "inter_op_threads": inter,
+            "execution_mode": mode,
+            "graph_optimization": opt,
+            "cpu_arena": bool(arena),
+            "quantized": bool(quantized),
+        }
+        try:
+            start = time.perf_counter()
+            kokoro = load_kokoro(KOKORO_VOICES_BIN, config)
+            load_seconds = time.perf_counter() - start
+        except Exception as e:
+            print(f"skip {model_path_for(config)} ({config}): {e}")
+            continue
+
+        for style_cache, concurrency in itertools.product(args.style_cache, args.concurrency):
+            stats = measure(kokoro, text, args.voice, concurrency, args.rounds, bool(style_cache))
+            row = {"config": config, "style_cache": bool(style_cache), "concurrency": concurrency,
+                   "load_seconds": load_seconds, **stats}
+            results.append(row)
+            print(
+                f"intra={intra:<2} inter={inter:<2} mode={mode:<10} opt={opt:<8} arena={arena} "
+                f"quant={quantized} styles={style_cache} c={concurrency:<2} "
+                f"rtf p50={stats['rtf_p50']:.3f} p95={stats['rtf_p95']:.3f} "
+                f"throughput={stats['throughput_x_realtime']:.1f}x realtime"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
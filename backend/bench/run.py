@@ -0,0 +1,403 @@
+"""
+Benchmark / load-test driver.
+
+Starts a fake Ollama server and the API (in a subprocess, with stand-in
+STT/TTS models by default), drives each endpoint at the requested
+concurrency levels and writes a JSON report that can be compared across runs.
+
+Examples (from the backend directory):
+    python -m bench.run --endpoints chat,stt,tts --concurrency 1,4,16 --requests 100
+    python -m bench.run --token-rate 200 --real-models
+    python -m bench.run compare bench/results/old.json bench/results/new.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import httpx
+
+from bench import synthetic
+from bench.fake_ollama import FakeOllamaConfig, start_fake_ollama
+# Same nearest-rank percentiles as the scheduler's queue-wait stats
+from ollama_scheduler import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "bench", "results")
+ALL_ENDPOINTS = ["chat", "stt", "tts", "voice_chat", "rag_upload", "rag_chat", "vision"]
+
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values),
+        "max": max(values),
+    }
+
+
+def rss_mb(pid: int):
+    """Resident set size of a process in MB (psutil if available, /proc otherwise)."""
+    try:
+        import psutil
+        return psutil.Process(pid).memory_info().rss / 1e6
+    except ImportError:
+        pass
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1e3
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler:
+    """Polls a process's RSS on a background thread while a scenario runs."""
+
+    def __init__(self, pid: int, interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            value = rss_mb(self.pid)
+            if value is not None:
+                self.samples.append(value)
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.baseline = rss_mb(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end = rss_mb(self.pid)
+
+    def report(self):
+        return {
+            "baseline": self.baseline,
+            "peak": max(self.samples) if self.samples else None,
+            "end": self.end,
+        }
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- Scenarios ---------------------------------------------------------------
+# Each scenario is an async callable (client, i) -> (ok, ttfb_seconds or None).
+
+class Scenarios:
+    def __init__(self, args):
+        self.args = args
+        self.wav = synthetic.make_wav(seconds=args.audio_seconds)
+        self.png = synthetic.make_png()
+        self.pdf = synthetic.make_pdf(pages=args.pdf_pages)
+        self.tts_text = " ".join(synthetic.SENTENCES[:3])
+        self.rag_doc_id = None
+
+    async def setup(self, client: httpx.AsyncClient, endpoints):
+        if "rag_chat" in endpoints:
+            r = await client.post("/api/rag/upload", files={"file": ("manual.pdf", self.pdf, "application/pdf")})
+            r.raise_for_status()
+            self.rag_doc_id = r.json()["doc_id"]
+
+    async def chat(self, client, i):
+        payload = {"model": self.args.model, "messages": [{"role": "user", "content": synthetic.make_question(i)}]}
+        start = time.perf_counter()
+        ttfb = None
+        async with client.stream("POST", "/api/chat", json=payload) as r:
+            async for _ in r.aiter_bytes():
+                if ttfb is None:
+                    ttfb = time.perf_counter() - start
+        return r.status_code == 200, ttfb
+
+    async def stt(self, client, i):
+        r = await client.post("/api/stt", files={"file": ("clip.wav", self.wav, "audio/wav")})
+        return r.status_code == 200, None
+
+    async def tts(self, client, i):
+        r = await client.post("/api/tts", json={"text": self.tts_text, "voice": "af_sarah", "speed": 1.0})
+        return r.status_code == 200, None
+
+    async def voice_chat(self, client, i):
+        r = await client.post(
+            "/api/voice/chat",
+            files={"audio_file": ("clip.wav", self.wav, "audio/wav")},
+            data={"model": self.args.model, "voice": "af_sarah"},
+        )
+        return r.status_code == 200, None
+
+    async def rag_upload(self, client, i):
+        r = await client.post("/api/rag/upload", files={"file": (f"doc_{i}.pdf", self.pdf, "application/pdf")})
+        return r.status_code == 200, None
+
+    async def rag_chat(self, client, i):
+        payload = {"message": synthetic.make_question(i), "doc_id": self.rag_doc_id, "model": self.args.model}
+        r = await client.post("/api/rag/chat", json=payload)
+        return r.status_code == 200, None
+
+    async def vision(self, client, i):
+        r = await client.post(
+            "/api/vision",
+            files={"file": ("image.png", self.png, "image/png")},
+            data={"prompt": "Describe this image", "model": self.args.model},
+        )
+        return r.status_code == 200, None
+
+
+async def run_scenario(base_url, scenario, concurrency, total, warmup, timeout):
+    latencies, ttfbs, errors = [], [], []
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        for i in range(warmup):
+            await scenario(client, -1 - i)
+
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    ok, ttfb = await scenario(client, i)
+                except Exception as e:
+                    errors.append(repr(e))
+                    continue
+                if not ok:
+                    errors.append("non-200 response")
+                    continue
+                latencies.append(time.perf_counter() - start)
+                if ttfb is not None:
+                    ttfbs.append(ttfb)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+
+    return latencies, ttfbs, errors, duration
+
+
+def wait_for_server(base_url, proc, timeout=300.0):
+    """Wait until the API reports ready, i.e. models are loaded and warmed up."""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"API server exited with code {proc.returncode}")
+        try:
+            if httpx.get(f"{base_url}/ready", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("API server did not become ready in time")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+def run(args):
+    endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(endpoints) - set(ALL_ENDPOINTS)
+    if unknown:
+        raise SystemExit(f"Unknown endpoints: {', '.join(sorted(unknown))}")
+    concurrency_levels = [int(c) for c in args.concurrency.split(",")]
+
+    ollama_config = FakeOllamaConfig(
+        token_rate=args.token_rate,
+        first_token_ms=args.first_token_ms,
+        response_tokens=args.response_tokens,
+    )
+    fake_ollama = None
+    ollama_host = args.ollama_host
+    if not ollama_host:
+        fake_ollama = start_fake_ollama(config=ollama_config)
+        ollama_host = "http://%s:%d" % fake_ollama.server_address
+
+    base_url = args.url
+    proc = None
+    workdir = None
+    if not base_url:
+        workdir = tempfile.mkdtemp(prefix="ai-playground-bench-")
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = {
+            **os.environ,
+            "OLLAMA_HOST": ollama_host,
+            "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+            "CHROMA_DB_PATH": os.path.join(workdir, "chroma_db"),
+        }
+        cmd = [sys.executable, "-m", "bench.serve", "--port", str(port), "--workdir", workdir,
+               "--whisper-rtf", str(args.whisper_rtf), "--kokoro-rtf", str(args.kokoro_rtf)]
+        if args.real_models:
+            cmd.append("--real-models")
+        proc = subprocess.Popen(cmd, cwd=BACKEND_DIR, env=env)
+
+    results = []
+    try:
+        if proc:
+            wait_for_server(base_url, proc)
+        scenarios = Scenarios(args)
+
+        async def setup():
+            async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout) as client:
+                await scenarios.setup(client, endpoints)
+        asyncio.run(setup())
+
+        for endpoint in endpoints:
+            for concurrency in concurrency_levels:
+                scenario = getattr(scenarios, endpoint)
+                sampler = MemorySampler(proc.pid) if proc else None
+                with sampler or contextlib.nullcontext():
+                    latencies, ttfbs, errors, duration = asyncio.run(run_scenario(
+                        base_url, scenario, concurrency, args.requests, args.warmup, args.timeout
+                    ))
+                result = {
+                    "endpoint": endpoint,
+                    "concurrency": concurrency,
+                    "requests": args.requests,
+                    "ok": len(latencies),
+                    "errors": len(errors),
+                    "error_samples": sorted(set(errors))[:5],
+                    "duration_s": duration,
+                    "throughput_rps": len(latencies) / duration if duration else None,
+                    "latency_ms": summarize([l * 1000 for l in latencies]),
+                    "ttfb_ms": summarize([t * 1000 for t in ttfbs]),
+                    "rss_mb": sampler.report() if sampler else None,
+                }
+                results.append(result)
+                print_result(result)
+    finally:
+        if proc:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        if fake_ollama:
+            fake_ollama.shutdown()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {k: v for k, v in vars(args).items() if k != "func"},
+        },
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+
+
+def _fmt(value, spec=".1f"):
+    return "-" if value is None else format(value, spec)
+
+
+def print_result(r):
+    lat = r["latency_ms"] or {}
+    mem = r["rss_mb"] or {}
+    print(
+        f"{r['endpoint']:<11} c={r['concurrency']:<3} ok={r['ok']:<4} err={r['errors']:<3} "
+        f"rps={_fmt(r['throughput_rps'], '.2f'):>7}  "
+        f"p50={_fmt(lat.get('p50')):>8}ms p95={_fmt(lat.get('p95')):>8}ms p99={_fmt(lat.get('p99')):>8}ms  "
+        f"rss_peak={_fmt(mem.get('peak'))}MB"
+    )
+
+
+def compare(args):
+    """Print per-endpoint deltas between two result files (baseline -> candidate)."""
+    with open(args.baseline) as f:
+        baseline = {(r["endpoint"], r["concurrency"]): r for r in json.load(f)["results"]}
+    with open(args.candidate) as f:
+        candidate = {(r["endpoint"], r["concurrency"]): r for r in json.load(f)["results"]}
+
+    def delta(old, new):
+        if old is None or new is None or old == 0:
+            return "-"
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    print(f"{'endpoint':<11} {'c':>3}  {'rps':>9}  {'p50':>9}  {'p95':>9}  {'p99':>9}  {'rss_peak':>9}")
+    for key in sorted(baseline.keys() & candidate.keys()):
+        old, new = baseline[key], candidate[key]
+        old_lat, new_lat = old["latency_ms"] or {}, new["latency_ms"] or {}
+        old_mem, new_mem = old["rss_mb"] or {}, new["rss_mb"] or {}
+        print(
+            f"{key[0]:<11} {key[1]:>3}  {delta(old['throughput_rps'], new['throughput_rps']):>9}  "
+            f"{delta(old_lat.get('p50'), new_lat.get('p50')):>9}  "
+            f"{delta(old_lat.get('p95'), new_lat.get('p95')):>9}  "
+            f"{delta(old_lat.get('p99'), new_lat.get('p99')):>9}  "
+            f"{delta(old_mem.get('peak'), new_mem.get('peak')):>9}"
+        )
+    missing = baseline.keys() ^ candidate.keys()
+    if missing:
+        print(f"\nNot present in both runs: {sorted(missing)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark for the AI Playground API")
+    sub = parser.add_subparsers(dest="command")
+
+    cmp_parser = sub.add_parser("compare", help="Compare two result files")
+    cmp_parser.add_argument("baseline")
+    cmp_parser.add_argument("candidate")
+    cmp_parser.set_defaults(func=compare)
+
+    parser.add_argument("--endpoints", default=",".join(ALL_ENDPOINTS),
+                        help=f"Comma-separated subset of: {', '.join(ALL_ENDPOINTS)}")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint and concurrency level")
+    parser.add_argument("--warmup", type=int, default=2, help="Unmeasured requests before each scenario")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--model", default="llama3.2-vision:latest")
+    parser.add_argument("--url", help="Benchmark an already running API instead of starting one")
+    parser.add_argument("--ollama-host", help="Use a real Ollama server instead of the fake one")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="Fake Ollama tokens per second")
+    parser.add_argument("--first-token-ms", type=float, default=100.0, help="Fake Ollama time to first token")
+    parser.add_argument("--response-tokens", type=int, default=64, help="Fake Ollama tokens per answer")
+    parser.add_argument("--real-models", action="store_true", help="Use real Faster-Whisper and Kokoro models")
+    parser.add_argument("--whisper-rtf", type=float, default=0.05, help="Stand-in STT real-time factor")
+    parser.add_argument("--kokoro-rtf", type=float, default=0.1, help="Stand-in TTS real-time factor")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="Length of the synthetic audio clip")
+    parser.add_argument("--pdf-pages", type=int, default=5, help="Pages in the synthetic PDF")
+    parser.add_argument("--output", help="Path of the JSON report (default: bench/results/bench_<time>.json)")
+    parser.set_defaults(func=run)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+"""
+Serve the backend for a benchmark run.
+Launched as a subprocess by bench.run so the server's memory can be measured
+in isolation. Uses stand-in STT/TTS models unless --real-models is given.
+"""
+import argparse
+import os
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API for benchmarking")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workdir", required=True, help="Directory for static/, the database and Chroma")
+    parser.add_argument("--real-models", action="store_true", help="Use Faster-Whisper and Kokoro instead of stand-ins")
+    parser.add_argument("--whisper-rtf", type=float, default=0.05)
+    parser.add_argument("--kokoro-rtf", type=float, default=0.1)
+    args = parser.parse_args()
+
+    sys.path.insert(0, BACKEND_DIR)
+    os.makedirs(args.workdir, exist_ok=True)
+    if args.real_models:
+        # Routers resolve Kokoro files relative to the working directory.
+        models_link = os.path.join(args.workdir, "models")
+        if not os.path.exists(models_link):
+            os.symlink(os.path.join(BACKEND_DIR, "models"), models_link)
+    os.chdir(args.workdir)
+    # Measure retrieval and generation, not semantic cache hits on repeated questions
+    os.environ.setdefault("RAG_CACHE_ENABLED", "0")
+    # ...and at full quality, so results stay comparable as load changes
+    os.environ.setdefault("QUALITY_ADAPTIVE", "0")
+
+    import uvicorn
+    from main import app
+
+    if not args.real_models:
+        from bench import standins
+        standins.install(whisper_rtf=args.whisper_rtf, kokoro_rtf=args.kokoro_rtf)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
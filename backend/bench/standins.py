@@ -0,0 +1,65 @@
+"""
+Lightweight stand-ins for Faster-Whisper and Kokoro.
+They mimic the call signatures the routers use and burn a configurable
+amount of wall time proportional to the audio length (a real-time factor),
+so STT/TTS endpoints can be load-tested without model files.
+"""
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+
+def _audio_seconds(audio) -> float:
+    if isinstance(audio, np.ndarray):
+        return len(audio) / 16000
+    try:
+        import soundfile as sf
+        info = sf.info(audio)
+        return info.frames / info.samplerate
+    except Exception:
+        return 3.0
+
+
+class FakeWhisperModel:
+    """Matches WhisperModel.transcribe(audio, beam_size=...) -> (segments, info)."""
+
+    def __init__(self, rtf: float = 0.05):
+        self.rtf = rtf
+
+    def transcribe(self, audio, beam_size: int = 5, **kwargs):
+        seconds = _audio_seconds(audio)
+        time.sleep(seconds * self.rtf * max(1, beam_size) / 5)
+        segments = iter([SimpleNamespace(text=" Hello, this is a synthetic benchmark transcript.")])
+        info = SimpleNamespace(language="en", language_probability=0.99, duration=seconds)
+        return segments, info
+
+
+class FakeKokoro:
+    """Matches Kokoro.create(text, voice=..., speed=..., lang=...) -> (samples, sample_rate)."""
+
+    sample_rate = 24000
+    seconds_per_char = 0.06
+
+    def __init__(self, rtf: float = 0.1):
+        self.rtf = rtf
+
+    def create(self, text, voice="af_sarah", speed=1.0, lang="en-us"):
+        seconds = max(0.5, len(text) * self.seconds_per_char / max(speed, 0.1))
+        time.sleep(seconds * self.rtf)
+        t = np.arange(int(seconds * self.sample_rate), dtype=np.float32) / self.sample_rate
+        samples = (0.1 * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+        return samples, self.sample_rate
+
+
+def install(whisper_rtf: float = 0.05, kokoro_rtf: float = 0.1):
+    """Swap the stand-ins into the shared model singletons used by the routers."""
+    import speech_models
+    from routers import stt, tts, voice_chat
+
+    speech_models._whisper_model = FakeWhisperModel(rtf=whisper_rtf)
+    speech_models._kokoro_instance = FakeKokoro(rtf=kokoro_rtf)
+    for module in (speech_models, stt, voice_chat):
+        module.WHISPER_AVAILABLE = True
+    for module in (speech_models, tts, voice_chat):
+        module.KOKORO_AVAILABLE = True
@@ -0,0 +1,123 @@
+"""
+Synthetic inputs for benchmarks: speech-like audio, images, text and PDFs.
+Everything is generated deterministically from a seed so runs are comparable.
+"""
+import io
+import random
+import struct
+import wave
+import zlib
+
+SENTENCES = [
+    "The warranty covers manufacturing defects for a period of two years.",
+    "To reset the device, hold the power button for ten seconds.",
+    "Battery life depends on screen brightness and network activity.",
+    "Firmware updates are installed automatically during the night.",
+    "The maintenance schedule recommends cleaning the filter every month.",
+    "Contact support if the status light blinks red three times.",
+    "Shipping to international destinations takes up to fourteen days.",
+    "The configuration file is stored in the user's home directory.",
+]
+
+
+def make_wav(seconds: float = 3.0, sample_rate: int = 16000, seed: int = 0) -> bytes:
+    """16-bit mono WAV with a few amplitude-modulated tones, roughly speech-shaped."""
+    import math
+    rng = random.Random(seed)
+    freqs = [rng.uniform(120, 300), rng.uniform(500, 1200), rng.uniform(1500, 3000)]
+    n = int(seconds * sample_rate)
+    frames = bytearray()
+    for i in range(n):
+        t = i / sample_rate
+        envelope = 0.5 + 0.5 * math.sin(2 * math.pi * 3 * t)
+        value = sum(math.sin(2 * math.pi * f * t) for f in freqs) / len(freqs)
+        value = value * envelope * 0.6 + rng.uniform(-0.02, 0.02)
+        frames += struct.pack("<h", int(max(-1.0, min(1.0, value)) * 32767))
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+def make_png(width: int = 512, height: int = 512, seed: int = 0) -> bytes:
+    """RGB gradient PNG written with zlib only, so Pillow is not required."""
+    rng = random.Random(seed)
+    r0, g0, b0 = rng.randrange(256), rng.randrange(256), rng.randrange(256)
+    raw = bytearray()
+    for y in range(height):
+        raw.append(0)  # filter type: none
+        for x in range(width):
+            raw += bytes(((r0 + x) % 256, (g0 + y) % 256, (b0 + x + y) % 256))
+
+    def chunk(tag: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", header)
+        + chunk(b"IDAT", zlib.compress(bytes(raw), 6))
+        + chunk(b"IEND", b"")
+    )
+
+
+def make_text(paragraphs: int = 20, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return "\n\n".join(
+        " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(4, 8)))
+        for _ in range(paragraphs)
+    )
+
+
+def make_pdf(pages: int = 5, seed: int = 0) -> bytes:
+    """Minimal multi-page PDF with one Helvetica text block per page."""
+    rng = random.Random(seed)
+    objects = []
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    font_id = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    pages_id = add(b"")  # placeholder, filled in once the page ids are known
+    page_ids = []
+    for _ in range(pages):
+        lines = [rng.choice(SENTENCES) for _ in range(30)]
+        ops = ["BT", "/F1 11 Tf", "14 TL", "50 780 Td"]
+        for line in lines:
+            escaped = line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+            ops.append(f"({escaped}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1")
+        content_id = add(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (pages_id, font_id, content_id)
+        ))
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids).encode()
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+    catalog_id = add(b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog_id, xref_offset
+    )
+    return bytes(out)
+
+
+def make_question(seed: int = 0) -> str:
+    rng = random.Random(seed)
+    topic = rng.choice(SENTENCES).split()[1:4]
+    return f"What does the manual say about {' '.join(topic)}?"
@@ -0,0 +1,136 @@
+"""
+Recall and latency of the NumPy vector store against Chroma.
+
+Builds a synthetic clustered corpus (chunks of the same document lie close
+together, as real chunk embeddings do), loads it into each store and runs the
+same queries, unfiltered and restricted to one doc_id. Recall@k is measured
+against exact float32 search.
+
+From the backend directory:
+    python -m bench.vector_store_bench --rows 100000 --dim 768
+    python -m bench.vector_store_bench --stores numpy:float16,numpy:int8 --output vs.json
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from bench.run import summarize
+
+INSERT_BATCH = 5000
+
+
+def make_corpus(rows: int, dim: int, docs: int, queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(docs, dim)).astype(np.float32)
+    doc_of_row = rng.integers(0, docs, size=rows)
+    vectors = centers[doc_of_row] + rng.normal(scale=1.5, size=(rows, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    # Queries are noisy copies of corpus rows, so they have real neighbours
+    picks = rng.integers(0, rows, size=queries)
+    query_vectors = vectors[picks] + rng.normal(scale=0.05, size=(queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, doc_of_row, query_vectors, doc_of_row[picks]
+
+
+def exact_top_k(vectors, query, k, mask=None):
+    scores = vectors @ query
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+    top = np.argpartition(-scores, k)[:k]
+    return set(top[np.argsort(-scores[top])].tolist())
+
+
+def open_store(kind: str, path: str):
+    """Collection for 'chroma' or 'numpy:<dtype>'."""
+    if kind == "chroma":
+        import chromadb
+        from chromadb.config import Settings
+        client = chromadb.PersistentClient(path=path, settings=Settings(anonymized_telemetry=False))
+        return client.get_or_create_collection(name="bench", metadata={"hnsw:space": "cosine"})
+
+    import numpy_store
+    numpy_store.RAG_NUMPY_DTYPE = kind.split(":", 1)[1]
+    return numpy_store.NumpyVectorStore(path).get_or_create_collection("bench")
+
+
+def dir_size_mb(path: str) -> float:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total / 1e6
+
+
+def run_store(kind, vectors, doc_of_row, query_vectors, query_docs, k):
+    path = tempfile.mkdtemp(prefix="vector-bench-")
+    try:
+        collection = open_store(kind, path)
+        start = time.perf_counter()
+        for offset in range(0, len(vectors), INSERT_BATCH):
+            rows = range(offset, min(offset + INSERT_BATCH, len(vectors)))
+            collection.add(
+                ids=[f"row_{i}" for i in rows],
+                embeddings=vectors[rows.start:rows.stop].tolist(),
+                documents=[f"chunk {i}" for i in rows],
+                metadatas=[{"doc_id": f"doc_{doc_of_row[i]}", "chunk_index": i} for i in rows],
+            )
+        insert_seconds = time.perf_counter() - start
+
+        result = {"store": kind, "insert_seconds": insert_seconds, "disk_mb": dir_size_mb(path)}
+        for mode in ("global", "doc_filter"):
+            latencies, recalls = [], []
+            for query, doc in zip(query_vectors, query_docs):
+                params = {"query_embeddings": [query.tolist()], "n_results": k, "include": ["distances"]}
+                mask = None
+                if mode == "doc_filter":
+                    params["where"] = {"doc_id": f"doc_{doc}"}
+                    mask = doc_of_row == doc
+                start = time.perf_counter()
+                found = collection.query(**params)
+                latencies.append((time.perf_counter() - start) * 1000)
+
+                truth = exact_top_k(vectors, query, min(k, int(mask.sum()) if mask is not None else k), mask)
+                got = {int(i.split("_")[1]) for i in found["ids"][0]}
+                recalls.append(len(got & truth) / len(truth))
+            result[mode] = {"latency_ms": summarize(latencies), "recall": float(np.mean(recalls))}
+        return result
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the NumPy vector store with Chroma")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--docs", type=int, default=500, help="Distinct doc_ids (clusters)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=12)
+    parser.add_argument("--stores", default="chroma,numpy:float16,numpy:int8")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    vectors, doc_of_row, query_vectors, query_docs = make_corpus(args.rows, args.dim, args.docs, args.queries)
+    results = []
+    for kind in args.stores.split(","):
+        result = run_store(kind, vectors, doc_of_row, query_vectors, query_docs, args.k)
+        results.append(result)
+        for mode in ("global", "doc_filter"):
+            stats = result[mode]
+            print(
+                f"{kind:<14} {mode:<10} recall@{args.k}={stats['recall']:.3f} "
+                f"p50={stats['latency_ms']['p50']:.2f}ms p95={stats['latency_ms']['p95']:.2f}ms "
+                f"insert={result['insert_seconds']:.1f}s disk={result['disk_mb']:.0f}MB"
+            )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Cancellation of in-flight inference.
+
+A request that produces model output registers a CancelToken under a key such
+as ("voice", session_id). The token is cancelled when:
+
+- the client disconnects (watch_disconnect, or Starlette cancelling a
+  streaming response),
+- the client asks for it (the /cancel endpoints), or
+- a newer request registers the same key (barge-in: the user spoke again
+  before the previous answer was ready).
+
+Cancelling closes the Ollama stream, which makes Ollama stop generating, and
+work that runs step by step (sentence-level TTS) checks the token between
+steps. Callers record whatever was produced so far as interrupted.
+"""
+import asyncio
+from typing import AsyncIterator, Hashable, Optional
+
+# How often a non-streaming request checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.25
+
+
+class Interrupted(Exception):
+    """The work was cancelled; partial output may exist."""
+
+
+class CancelToken:
+    def __init__(self, key: Hashable = None):
+        self.key = key
+        self.reason = None
+        self._tasks = set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def cancel(self, reason: str = "cancelled"):
+        if self.reason is None:
+            self.reason = reason
+            for task in self._tasks:
+                task.cancel()
+
+    def attach(self, task: asyncio.Task):
+        """Cancel the task together with the token."""
+        if self.cancelled:
+            task.cancel()
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def check(self):
+        if self.cancelled:
+            raise Interrupted(self.reason)
+
+
+_active = {}
+
+
+def register(key: Hashable) -> CancelToken:
+    """Token for new work under key; work already running under it is superseded."""
+    previous = _active.get(key)
+    if previous is not None:
+        previous.cancel("superseded")
+    token = _active[key] = CancelToken(key)
+    return token
+
+
+def unregister(token: CancelToken):
+    if _active.get(token.key) is token:
+        del _active[token.key]
+
+
+def cancel(key: Hashable, reason: str = "cancelled") -> bool:
+    """Cancel the work running under key. Returns False if there is none."""
+    token = _active.get(key)
+    if token is None:
+        return False
+    token.cancel(reason)
+    return True
+
+
+async def watch_disconnect(request, token: CancelToken):
+    """Cancel the token once the client has gone away. Run as a task; cancel it when done."""
+    while not token.cancelled:
+        if await request.is_disconnected():
+            token.cancel("client disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+
+class _End:
+    def __init__(self, error: Optional[BaseException] = None):
+        self.error = error
+
+
+async def cancellable(token: CancelToken, source: AsyncIterator) -> AsyncIterator:
+    """
+    Iterate source until it ends or the token is cancelled, then raise Interrupted.
+    The source runs in its own task, so cancelling interrupts it mid-await
+    (e.g. closes an HTTP stream that has not produced its next item yet).
+    """
+    items = asyncio.Queue()
+
+    async def pump():
+        error = None
+        try:
+            async for item in source:
+                items.put_nowait(item)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            items.put_nowait(_End(error))
+
+    task = asyncio.ensure_future(pump())
+    token.attach(task)
+    try:
+        while True:
+            item = await items.get()
+            if isinstance(item, _End):
+                if item.error is not None:
+                    raise item.error
+                token.check()
+                return
+            yield item
+    finally:
+        task.cancel()
@@ -0,0 +1,186 @@
+"""
+Token-budgeted context packing for RAG prompts.
+
+Instead of pasting a fixed number of chunks into the prompt, rag_chat retrieves
+a wider candidate set and packs it:
+
+1. drop candidates below a relevance threshold,
+2. drop near-duplicates (overlapping neighbours often repeat the same text),
+3. order the rest with MMR so the context covers different aspects of the question,
+4. merge adjacent chunks of the same document, removing their overlap,
+5. add blocks until the per-model token budget is used up.
+
+Configuration (environment variables):
+    RAG_CANDIDATES           chunks retrieved before packing
+    RAG_MIN_SIMILARITY       cosine similarity below which a chunk is ignored
+    RAG_DEDUP_THRESHOLD      word-shingle Jaccard similarity above which chunks count as duplicates
+    RAG_MMR_LAMBDA           1.0 = pure relevance, 0.0 = pure diversity
+    RAG_CONTEXT_TOKENS       default context budget in tokens
+    RAG_CONTEXT_TOKENS_BY_MODEL  per-model budgets, e.g. "llama3.2:latest=1024,deepseek-r1=3000"
+"""
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from ollama_scheduler import parse_map
+
+RAG_CANDIDATES = int(os.getenv("RAG_CANDIDATES", "12"))
+RAG_MIN_SIMILARITY = float(os.getenv("RAG_MIN_SIMILARITY", "0.3"))
+RAG_DEDUP_THRESHOLD = float(os.getenv("RAG_DEDUP_THRESHOLD", "0.8"))
+RAG_MMR_LAMBDA = float(os.getenv("RAG_MMR_LAMBDA", "0.7"))
+RAG_CONTEXT_TOKENS = int(os.getenv("RAG_CONTEXT_TOKENS", "1500"))
+
+MODEL_CONTEXT_TOKENS = parse_map(os.getenv("RAG_CONTEXT_TOKENS_BY_MODEL", ""), int)
+
+SHINGLE_SIZE = 5
+# Longest chunk overlap we look for when stitching neighbours (splitter uses 200 chars)
+MAX_OVERLAP_CHARS = 400
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def context_budget(model: str) -> int:
+    if model in MODEL_CONTEXT_TOKENS:
+        return MODEL_CONTEXT_TOKENS[model]
+    base_name = model.split(":")[0]
+    return MODEL_CONTEXT_TOKENS.get(base_name, RAG_CONTEXT_TOKENS)
+
+
+def _shingles(text: str) -> set:
+    words = text.lower().split()
+    if len(words) <= SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def _jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def _dedupe(candidates: List[dict], threshold: float) -> List[dict]:
+    """Keep the higher-scoring chunk of every near-duplicate pair."""
+    kept = []
+    for candidate in sorted(candidates, key=lambda c: -c["score"]):
+        shingles = _shingles(candidate["text"])
+        if any(_jaccard(shingles, k["_shingles"]) >= threshold for k in kept):
+            continue
+        kept.append({**candidate, "_shingles": shingles})
+    return kept
+
+
+def _mmr_order(candidates: List[dict], lambda_: float) -> List[dict]:
+    """
+    Maximal marginal relevance ordering; falls back to score order without
+    comparable embeddings (missing, or from shards with different embedding models).
+    """
+    if not candidates:
+        return []
+    if any(c.get("embedding") is None for c in candidates) or len({len(c["embedding"]) for c in candidates}) > 1:
+        return sorted(candidates, key=lambda c: -c["score"])
+
+    vectors = np.array([c["embedding"] for c in candidates], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    similarity = vectors @ vectors.T
+    relevance = np.array([c["score"] for c in candidates], dtype=np.float32)
+
+    ordered = []
+    remaining = list(range(len(candidates)))
+    while remaining:
+        if ordered:
+            redundancy = similarity[np.ix_(remaining, ordered)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        mmr = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy
+        best = remaining[int(np.argmax(mmr))]
+        ordered.append(best)
+        remaining.remove(best)
+    return [candidates[i] for i in ordered]
+
+
+def _stitch(first: str, second: str) -> str:
+    """Join two neighbouring chunks, dropping the text they share."""
+    limit = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for size in range(limit, 20, -1):
+        if first.endswith(second[:size]):
+            return first + second[size:]
+    return first + "\n" + second
+
+
+def _merge_adjacent(chunks: List[dict]) -> List[dict]:
+    """
+    Merge runs of consecutive chunks from the same document into one block.
+    Blocks keep the rank of their best chunk.
+    """
+    indexed, loose = {}, []
+    for rank, chunk in enumerate(chunks):
+        metadata = chunk["metadata"]
+        if "chunk_index" in metadata and "doc_id" in metadata:
+            indexed.setdefault(metadata["doc_id"], []).append((metadata["chunk_index"], rank, chunk))
+        else:
+            loose.append({"text": chunk["text"], "rank": rank, "chunks": 1})
+
+    blocks = list(loose)
+    for doc_chunks in indexed.values():
+        doc_chunks.sort(key=lambda item: item[0])
+        current = None
+        for chunk_index, rank, chunk in doc_chunks:
+            if current and chunk_index == current["last_index"] + 1:
+                current["text"] = _stitch(current["text"], chunk["text"])
+                current["rank"] = min(current["rank"], rank)
+                current["chunks"] += 1
+                current["last_index"] = chunk_index
+            else:
+                current = {"text": chunk["text"], "rank": rank, "chunks": 1, "last_index": chunk_index}
+                blocks.append(current)
+    blocks.sort(key=lambda b: b["rank"])
+    return blocks
+
+
+def pack_context(
+    candidates: List[dict],
+    model: str,
+    token_budget: Optional[int] = None,
+    min_similarity: float = None,
+    dedup_threshold: float = None,
+    mmr_lambda: float = None,
+) -> tuple[List[str], dict]:
+    """
+    Select and merge candidate chunks (as returned by rag_utils.retrieve_candidates)
+    into context blocks that fit the model's token budget.
+    Returns (blocks, stats).
+    """
+    budget = token_budget if token_budget is not None else context_budget(model)
+    min_similarity = RAG_MIN_SIMILARITY if min_similarity is None else min_similarity
+    dedup_threshold = RAG_DEDUP_THRESHOLD if dedup_threshold is None else dedup_threshold
+    mmr_lambda = RAG_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+
+    relevant = [c for c in candidates if c["score"] >= min_similarity]
+    unique = _dedupe(relevant, dedup_threshold)
+    ordered = _mmr_order(unique, mmr_lambda)
+
+    # Greedily add chunks in MMR order, re-merging each time: stitching neighbours
+    # can make a set fit that would not fit as separate chunks.
+    selected, blocks = [], []
+    for chunk in ordered:
+        trial = _merge_adjacent(selected + [chunk])
+        if sum(estimate_tokens(b["text"]) for b in trial) <= budget:
+            selected.append(chunk)
+            blocks = trial
+
+    texts = [b["text"] for b in blocks]
+    stats = {
+        "candidates": len(candidates),
+        "relevant": len(relevant),
+        "after_dedup": len(unique),
+        "chunks_used": len(selected),
+        "blocks": len(blocks),
+        "context_tokens": sum(estimate_tokens(t) for t in texts),
+        "token_budget": budget,
+    }
+    return texts, stats
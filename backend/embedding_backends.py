@@ -0,0 +1,222 @@
+"""
+Embedding backends for RAG.
+
+Every Chroma collection records which backend embedded its chunks (collection
+metadata "embedding_backend"), and queries against it are embedded with the
+same one. Collections created before backends existed use "ollama".
+
+    ollama  HTTP calls to the Ollama server (shares its queue with chat generations)
+    local   in-process sentence-transformers model on CPU; concurrent requests are
+            merged into batches by a small pool of worker threads, and ONNX /
+            quantized model files can be loaded instead of PyTorch weights
+
+Configuration (environment variables):
+    RAG_EMBEDDING_BACKEND            backend for new collections
+    RAG_EMBEDDING_BACKENDS           per-collection overrides, e.g. "ns_manuals=local,doc_1234=ollama"
+    LOCAL_EMBEDDING_MODEL            sentence-transformers model name or path
+    LOCAL_EMBEDDING_RUNTIME          torch | onnx | openvino
+    LOCAL_EMBEDDING_MODEL_FILE       model file for onnx/openvino, e.g. "onnx/model_qint8_avx512.onnx"
+    LOCAL_EMBEDDING_QUERY_PREFIX     text prepended to queries (some models expect e.g. "search_query: ")
+    LOCAL_EMBEDDING_DOCUMENT_PREFIX  text prepended to documents
+    LOCAL_EMBEDDING_MAX_BATCH        most texts encoded in one batch
+    LOCAL_EMBEDDING_MAX_WAIT_MS      how long a batch waits for more requests before encoding
+    LOCAL_EMBEDDING_WORKERS          worker threads encoding batches
+    LOCAL_EMBEDDING_THREADS          torch intra-op threads (0 = library default)
+"""
+import os
+import queue
+from abc import ABC, abstractmethod
+import threading
+import time
+from concurrent.futures import Future
+from typing import List
+
+from ollama_scheduler import ollama_scheduler, parse_map, BATCH, RAG
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
+# Make sure you have pulled an embedding model: ollama pull nomic-embed-text
+OLLAMA_EMBEDDING_MODEL = "nomic-embed-text"
+
+RAG_EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "ollama")
+COLLECTION_BACKENDS = parse_map(os.getenv("RAG_EMBEDDING_BACKENDS", ""), str.strip)
+
+LOCAL_EMBEDDING_MODEL = os.getenv("LOCAL_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+LOCAL_EMBEDDING_RUNTIME = os.getenv("LOCAL_EMBEDDING_RUNTIME", "torch")
+LOCAL_EMBEDDING_MODEL_FILE = os.getenv("LOCAL_EMBEDDING_MODEL_FILE", "")
+LOCAL_EMBEDDING_QUERY_PREFIX = os.getenv("LOCAL_EMBEDDING_QUERY_PREFIX", "")
+LOCAL_EMBEDDING_DOCUMENT_PREFIX = os.getenv("LOCAL_EMBEDDING_DOCUMENT_PREFIX", "")
+LOCAL_EMBEDDING_MAX_BATCH = int(os.getenv("LOCAL_EMBEDDING_MAX_BATCH", "64"))
+LOCAL_EMBEDDING_MAX_WAIT_MS = float(os.getenv("LOCAL_EMBEDDING_MAX_WAIT_MS", "5"))
+LOCAL_EMBEDDING_WORKERS = int(os.getenv("LOCAL_EMBEDDING_WORKERS", "1"))
+LOCAL_EMBEDDING_THREADS = int(os.getenv("LOCAL_EMBEDDING_THREADS", "0"))
+
+# Used for collections whose metadata predates embedding backends
+LEGACY_BACKEND = "ollama"
+
+
+class EmbeddingBackend(ABC):
+    """Same interface as LangChain embeddings, so either can be used interchangeably."""
+
+    name = ""
+
+    @abstractmethod
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        ...
+
+    @abstractmethod
+    def embed_query(self, text: str) -> List[float]:
+        ...
+
+
+class OllamaEmbeddingBackend(EmbeddingBackend):
+    name = "ollama"
+
+    def __init__(self, model: str = OLLAMA_EMBEDDING_MODEL, base_url: str = OLLAMA_HOST):
+        from langchain_community.embeddings import OllamaEmbeddings
+        self.model = model
+        self._client = OllamaEmbeddings(model=model, base_url=base_url)
+
+    # Calls go through the Ollama scheduler (blocking the calling thread while
+    # queued): document embedding is batch work, query embedding is part of an
+    # interactive RAG request.
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with ollama_scheduler.slot(BATCH, self.model):
+            return self._client.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        with ollama_scheduler.slot(RAG, self.model):
+            return self._client.embed_query(text)
+
+
+class LocalEmbeddingBackend(EmbeddingBackend):
+    """
+    sentence-transformers on CPU with dynamic batching: callers enqueue their
+    texts and block; worker threads drain the queue into batches of up to
+    max_batch texts (waiting at most max_wait_ms for more to arrive) and encode
+    each batch in one forward pass.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        model_name: str = LOCAL_EMBEDDING_MODEL,
+        runtime: str = LOCAL_EMBEDDING_RUNTIME,
+        model_file: str = LOCAL_EMBEDDING_MODEL_FILE,
+        max_batch: int = LOCAL_EMBEDDING_MAX_BATCH,
+        max_wait_ms: float = LOCAL_EMBEDDING_MAX_WAIT_MS,
+        workers: int = LOCAL_EMBEDDING_WORKERS,
+        threads: int = LOCAL_EMBEDDING_THREADS,
+        model=None,
+    ):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._model = model or self._load_model(model_name, runtime, model_file, threads)
+        self._queue = queue.Queue()
+        self._batches = 0
+        self._texts = 0
+        for i in range(max(1, workers)):
+            threading.Thread(target=self._worker, name=f"embedding-worker-{i}", daemon=True).start()
+
+    @staticmethod
+    def _load_model(model_name: str, runtime: str, model_file: str, threads: int):
+        if threads > 0:
+            import torch
+            torch.set_num_threads(threads)
+        from sentence_transformers import SentenceTransformer
+
+        kwargs = {"device": "cpu"}
+        if runtime != "torch":
+            # ONNX / OpenVINO export, optionally a quantized file from the model repo
+            kwargs["backend"] = runtime
+            if model_file:
+                kwargs["model_kwargs"] = {"file_name": model_file}
+        return SentenceTransformer(model_name, **kwargs)
+
+    def _next_batch(self) -> list:
+        first = self._queue.get()
+        batch, size = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _worker(self):
+        while True:
+            batch = self._next_batch()
+            texts = [text for item_texts, _ in batch for text in item_texts]
+            try:
+                vectors = self._model.encode(
+                    texts,
+                    batch_size=self.max_batch,
+                    normalize_embeddings=True,
+                    convert_to_numpy=True,
+                ).tolist()
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self._batches += 1
+            self._texts += len(texts)
+            offset = 0
+            for item_texts, future in batch:
+                future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+    def _encode(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        future = Future()
+        self._queue.put((texts, future))
+        return future.result()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode([LOCAL_EMBEDDING_DOCUMENT_PREFIX + t for t in texts])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([LOCAL_EMBEDDING_QUERY_PREFIX + text])[0]
+
+    def stats(self) -> dict:
+        return {
+            "batches": self._batches,
+            "texts": self._texts,
+            "avg_batch_size": self._texts / self._batches if self._batches else 0.0,
+            "queued": self._queue.qsize(),
+        }
+
+
+BACKENDS = {
+    "ollama": OllamaEmbeddingBackend,
+    "local": LocalEmbeddingBackend,
+}
+
+_instances = {}
+_init_lock = threading.Lock()
+
+
+def get_embedding_backend(name: str = None) -> EmbeddingBackend:
+    """Shared backend instance, created on first use."""
+    name = name or RAG_EMBEDDING_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {name}")
+    backend = _instances.get(name)
+    if backend is None:
+        with _init_lock:
+            backend = _instances.get(name)
+            if backend is None:
+                backend = BACKENDS[name]()
+                _instances[name] = backend
+    return backend
+
+
+def backend_for_new_collection(collection_name: str) -> str:
+    return COLLECTION_BACKENDS.get(collection_name, RAG_EMBEDDING_BACKEND)
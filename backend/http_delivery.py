@@ -0,0 +1,171 @@
+"""
+Response delivery: compression, conditional requests and static caching.
+
+- CompressionMiddleware compresses JSON and text responses above
+  HTTP_COMPRESS_MIN_BYTES with brotli (if the brotli package is installed and
+  the client accepts it) or gzip. Streamed responses (chat tokens, NDJSON
+  progress) pass through untouched: compressing them would hold tokens back
+  in the compressor's buffer.
+- ETagMiddleware gives complete GET responses under /api (history lists,
+  details, model lists) a weak ETag computed from the body and answers a
+  matching If-None-Match with 304 and no body. There is deliberately no
+  Last-Modified/If-Modified-Since: the newest row timestamp in a list does
+  not change when a row is deleted or edited in place, so a date validator
+  would answer 304 for stale lists. The body hash catches every change.
+- CachedStaticFiles serves /static with "immutable" caching for UUID-named
+  files (generated audio, uploads, images), which are never rewritten. Other
+  files (documents re-uploaded under the same name) are revalidated with
+  StaticFiles' own ETag/Last-Modified on every use.
+
+Configuration (environment variables):
+    HTTP_COMPRESS_MIN_BYTES   smallest body worth compressing
+    HTTP_COMPRESS_LEVEL       gzip level (1-9); brotli uses quality HTTP_BROTLI_QUALITY
+    HTTP_ETAG_ENABLED         ETag/304 for API responses (default 1)
+    STATIC_MAX_AGE            cache lifetime of immutable static files, in seconds
+"""
+import gzip
+import hashlib
+import os
+import re
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    BROTLI_AVAILABLE = False
+
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+HTTP_COMPRESS_LEVEL = int(os.getenv("HTTP_COMPRESS_LEVEL", "6"))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+HTTP_ETAG_ENABLED = os.getenv("HTTP_ETAG_ENABLED", "1") == "1"
+STATIC_MAX_AGE = int(os.getenv("STATIC_MAX_AGE", str(365 * 24 * 3600)))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+_UUID_NAME = re.compile(r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.\w+$")
+
+
+def _accepts(header: str, coding: str) -> bool:
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        if name.strip().lower() == coding:
+            return params.replace(" ", "") not in ("q=0", "q=0.0")
+    return False
+
+
+async def _buffer_single_body(app, scope, receive, send, handle):
+    """
+    Run the app, and call handle(start, body) if the response arrives in one
+    piece; responses streamed in several chunks are forwarded as they are.
+    """
+    start = None
+    passthrough = False
+
+    async def buffered_send(message):
+        nonlocal start, passthrough
+        if passthrough:
+            await send(message)
+        elif message["type"] == "http.response.start":
+            start = message
+        elif message["type"] == "http.response.body":
+            if message.get("more_body", False):
+                passthrough = True
+                await send(start)
+                await send(message)
+            else:
+                await handle(start, message.get("body", b""))
+        else:
+            await send(message)
+
+    await app(scope, receive, buffered_send)
+
+
+class CompressionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        coding = "br" if BROTLI_AVAILABLE and _accepts(accept, "br") else "gzip" if _accepts(accept, "gzip") else None
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def handle(start, body):
+            headers = MutableHeaders(raw=list(start["headers"]))
+            content_type = headers.get("content-type", "")
+            if (
+                len(body) >= HTTP_COMPRESS_MIN_BYTES
+                and "content-encoding" not in headers
+                and content_type.startswith(COMPRESSIBLE_TYPES)
+            ):
+                if coding == "br":
+                    body = brotli.compress(body, quality=HTTP_BROTLI_QUALITY)
+                else:
+                    body = gzip.compress(body, compresslevel=HTTP_COMPRESS_LEVEL, mtime=0)
+                headers["content-encoding"] = coding
+                headers["content-length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                etag = headers.get("etag")
+                if etag:
+                    # The compressed body is a different representation
+                    headers["etag"] = etag[:-1] + f'-{coding}"'
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": body})
+
+        await _buffer_single_body(self.app, scope, receive, send, handle)
+
+
+class ETagMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not HTTP_ETAG_ENABLED
+            or scope["type"] != "http"
+            or scope["method"] != "GET"
+            or not scope["path"].startswith("/api/")
+        ):
+            await self.app(scope, receive, send)
+            return
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+
+        async def handle(start, body):
+            headers = MutableHeaders(raw=list(start["headers"]))
+            if start["status"] != 200 or "etag" in headers:
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+            etag = 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+            headers["etag"] = etag
+            # Cached copies may be reused only after checking the ETag
+            headers.setdefault("cache-control", "no-cache")
+            # Compare ignoring the weak prefix and the -gzip/-br suffix of compressed variants
+            candidates = {tag.strip().removeprefix("W/").split("-")[0].strip('"') for tag in if_none_match.split(",")}
+            if if_none_match.strip() == "*" or etag[3:-1] in candidates:
+                del headers["content-length"]
+                if "content-type" in headers:
+                    del headers["content-type"]
+                await send({"type": "http.response.start", "status": 304, "headers": headers.raw})
+                await send({"type": "http.response.body", "body": b""})
+                return
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": body})
+
+        await _buffer_single_body(self.app, scope, receive, send, handle)
+
+
+class CachedStaticFiles(StaticFiles):
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        if _UUID_NAME.match(os.path.basename(full_path)):
+            response.headers["cache-control"] = f"public, max-age={STATIC_MAX_AGE}, immutable"
+        else:
+            response.headers["cache-control"] = "no-cache"
+        return response
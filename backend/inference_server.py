@@ -0,0 +1,234 @@
+"""
+Dedicated STT/TTS inference process.
+
+Holds the only copy of the Faster-Whisper and Kokoro models so the HTTP API can
+run with several uvicorn workers without loading the models once per worker.
+API workers talk to it over a local multiprocessing connection (a Unix socket
+by default); audio payloads travel through shared memory, only small control
+messages are pickled over the socket.
+
+Start it next to the API and point the workers at it:
+
+    python inference_server.py --address /tmp/ai-playground-inference.sock
+    INFERENCE_SERVER_ADDRESS=/tmp/ai-playground-inference.sock uvicorn main:app --workers 4
+"""
+import argparse
+import io
+import os
+import queue
+import threading
+import traceback
+from multiprocessing import shared_memory
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+DEFAULT_AUTHKEY = b"ai-playground-inference"
+
+
+def parse_address(address: str):
+    """'host:port' -> TCP tuple, anything else is a Unix socket path."""
+    host, sep, port = address.rpartition(":")
+    if sep and port.isdigit() and "/" not in address:
+        return (host or "127.0.0.1", int(port))
+    return address
+
+
+def _authkey() -> bytes:
+    return os.getenv("INFERENCE_SERVER_AUTHKEY", "").encode() or DEFAULT_AUTHKEY
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    """Stop this process's resource tracker from unlinking a block the other side owns."""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def _attach(name: str, will_unlink: bool = False) -> shared_memory.SharedMemory:
+    """Attach to an existing block. Only track it here if this process is going to unlink it."""
+    if will_unlink:
+        return shared_memory.SharedMemory(name=name)
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        _untrack(shm)
+        return shm
+
+
+def _put_bytes(data) -> shared_memory.SharedMemory:
+    """Copy a bytes-like object into a new shared memory block (caller unlinks it)."""
+    view = memoryview(data).cast("B")
+    shm = shared_memory.SharedMemory(create=True, size=max(1, view.nbytes))
+    shm.buf[:view.nbytes] = view
+    return shm
+
+
+# --- Server ------------------------------------------------------------------
+
+def _handle_transcribe(request: dict) -> dict:
+    import speech_models
+    shm = _attach(request["shm"])
+    try:
+        if request["kind"] == "pcm_f32":
+            audio = np.ndarray((request["size"] // 4,), dtype=np.float32, buffer=shm.buf)
+            result = speech_models.transcribe_local(
+                audio, beam_size=request.get("beam_size", 5), model_size=request.get("model_size")
+            )
+            del audio
+        else:
+            audio = io.BytesIO(bytes(shm.buf[:request["size"]]))
+            result = speech_models.transcribe_local(
+                audio, beam_size=request.get("beam_size", 5), model_size=request.get("model_size")
+            )
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # A failed transcription can leave a view alive; the mapping is freed with it.
+            pass
+    return {"ok": True, "result": tuple(result)}
+
+
+def _handle_synthesize(request: dict) -> dict:
+    import speech_models
+    samples, sample_rate = speech_models.synthesize_local(
+        request["text"], voice=request["voice"], speed=request["speed"], lang=request["lang"]
+    )
+    samples = np.ascontiguousarray(samples, dtype=np.float32)
+    shm = _put_bytes(samples)
+    # Ownership passes to the client, which unlinks the block after copying it out.
+    name, size = shm.name, samples.nbytes
+    shm.close()
+    _untrack(shm)
+    return {"ok": True, "shm": name, "size": size, "sample_rate": sample_rate}
+
+
+HANDLERS = {
+    "ping": lambda request: {"ok": True},
+    "transcribe": _handle_transcribe,
+    "synthesize": _handle_synthesize,
+}
+
+
+def _serve_connection(conn):
+    with conn:
+        while True:
+            try:
+                request = conn.recv()
+            except (EOFError, OSError):
+                return
+            try:
+                response = HANDLERS[request["op"]](request)
+            except Exception as e:
+                traceback.print_exc()
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            try:
+                conn.send(response)
+            except (BrokenPipeError, OSError):
+                return
+
+
+def serve(address):
+    if isinstance(address, str) and os.path.exists(address):
+        os.remove(address)
+    with Listener(address, authkey=_authkey()) as listener:
+        print(f"Inference server listening on {address}")
+        while True:
+            conn = listener.accept()
+            threading.Thread(target=_serve_connection, args=(conn,), daemon=True).start()
+
+
+# --- Client ------------------------------------------------------------------
+
+class InferenceClient:
+    """
+    Thread-safe client with a small pool of persistent connections, so
+    concurrent requests in one API worker don't serialize on a single socket.
+    """
+
+    def __init__(self, address: str, max_connections: int = 8):
+        self.address = parse_address(address)
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+
+    def _call(self, request: dict) -> dict:
+        with self._slots:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = Client(self.address, authkey=_authkey())
+            try:
+                conn.send(request)
+                response = conn.recv()
+            except Exception:
+                conn.close()
+                raise
+            self._idle.put(conn)
+        if not response.get("ok"):
+            raise RuntimeError(f"Inference server error: {response.get('error')}")
+        return response
+
+    def ping(self):
+        self._call({"op": "ping"})
+
+    def transcribe(self, audio, beam_size: int = 5, model_size: str = None):
+        if isinstance(audio, np.ndarray):
+            data, kind = np.ascontiguousarray(audio, dtype=np.float32), "pcm_f32"
+        elif isinstance(audio, (bytes, bytearray, memoryview)):
+            data, kind = audio, "encoded"
+        elif isinstance(audio, str):
+            with open(audio, "rb") as f:
+                data, kind = f.read(), "encoded"
+        else:
+            data, kind = audio.read(), "encoded"
+        shm = _put_bytes(data)
+        try:
+            response = self._call({
+                "op": "transcribe", "shm": shm.name, "size": memoryview(data).nbytes,
+                "kind": kind, "beam_size": beam_size, "model_size": model_size,
+            })
+        finally:
+            shm.close()
+            shm.unlink()
+        return response["result"]
+
+    def synthesize(self, text: str, voice: str, speed: float, lang: str):
+        response = self._call({"op": "synthesize", "text": text, "voice": voice, "speed": speed, "lang": lang})
+        shm = _attach(response["shm"], will_unlink=True)
+        try:
+            samples = np.frombuffer(shm.buf, dtype=np.float32, count=response["size"] // 4).copy()
+        finally:
+            shm.close()
+            shm.unlink()
+        return samples, response["sample_rate"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the shared STT/TTS inference server")
+    parser.add_argument("--address", default=os.getenv("INFERENCE_SERVER_ADDRESS", "/tmp/ai-playground-inference.sock"),
+                        help="Unix socket path or host:port")
+    parser.add_argument("--no-warmup", action="store_true", help="Load models on first request instead of at start")
+    args = parser.parse_args()
+
+    # This process owns the models, so it must never forward to another server.
+    os.environ.pop("INFERENCE_SERVER_ADDRESS", None)
+    import speech_models
+    speech_models.INFERENCE_SERVER_ADDRESS = None
+
+    if not args.no_warmup:
+        import warmup
+        warmup.PRELOAD_MODELS = [m for m in warmup.PRELOAD_MODELS if m in ("whisper", "kokoro")]
+        threading.Thread(target=warmup.run_warmup, daemon=True).start()
+
+    try:
+        serve(parse_address(args.address))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+ONNX Runtime tuning for Kokoro TTS.
+
+Kokoro is built from an explicitly configured onnxruntime.InferenceSession
+instead of library defaults, so thread counts, graph optimization and memory
+arena behaviour can be matched to the host (e.g. a few intra-op threads per
+session when several requests synthesize concurrently on a many-core box).
+A quantized model file can be selected with KOKORO_QUANTIZED=1.
+
+Configuration (environment variables):
+    KOKORO_INTRA_OP_THREADS   threads used inside one operator (0 = ONNX Runtime default: all cores)
+    KOKORO_INTER_OP_THREADS   threads used across independent operators (0 = default)
+    KOKORO_EXECUTION_MODE     sequential | parallel
+    KOKORO_GRAPH_OPTIMIZATION disable | basic | extended | all
+    KOKORO_CPU_ARENA          1 to enable the CPU memory arena, 0 to disable it
+    KOKORO_MEM_PATTERN        1 to enable memory pattern optimization, 0 to disable it
+    KOKORO_QUANTIZED          1 to load KOKORO_QUANTIZED_MODEL_PATH instead of the fp32 model
+"""
+import os
+import threading
+
+KOKORO_MODEL_PATH = os.getenv("KOKORO_MODEL_PATH", "models/kokoro-v0_19.onnx")
+KOKORO_QUANTIZED_MODEL_PATH = os.getenv("KOKORO_QUANTIZED_MODEL_PATH", "models/kokoro-v0_19.int8.onnx")
+
+SESSION_CONFIG = {
+    "intra_op_threads": int(os.getenv("KOKORO_INTRA_OP_THREADS", "0")),
+    "inter_op_threads": int(os.getenv("KOKORO_INTER_OP_THREADS", "0")),
+    "execution_mode": os.getenv("KOKORO_EXECUTION_MODE", "sequential"),
+    "graph_optimization": os.getenv("KOKORO_GRAPH_OPTIMIZATION", "all"),
+    "cpu_arena": os.getenv("KOKORO_CPU_ARENA", "1") == "1",
+    "mem_pattern": os.getenv("KOKORO_MEM_PATTERN", "1") == "1",
+    "quantized": os.getenv("KOKORO_QUANTIZED", "0") == "1",
+}
+
+
+def model_path_for(config: dict) -> str:
+    return KOKORO_QUANTIZED_MODEL_PATH if config.get("quantized") else KOKORO_MODEL_PATH
+
+
+def build_session_options(config: dict):
+    import onnxruntime as ort
+
+    levels = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }
+    if config["graph_optimization"] not in levels:
+        raise ValueError(f"Unknown graph optimization level: {config['graph_optimization']}")
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = config["intra_op_threads"]
+    options.inter_op_num_threads = config["inter_op_threads"]
+    options.execution_mode = (
+        ort.ExecutionMode.ORT_PARALLEL if config["execution_mode"] == "parallel"
+        else ort.ExecutionMode.ORT_SEQUENTIAL
+    )
+    options.graph_optimization_level = levels[config["graph_optimization"]]
+    options.enable_cpu_mem_arena = config["cpu_arena"]
+    options.enable_mem_pattern = config["mem_pattern"]
+    return options
+
+
+def load_kokoro(voices_path: str, config: dict = None):
+    """Create a Kokoro instance on a tuned ONNX Runtime session."""
+    from kokoro_onnx import Kokoro
+
+    config = config or SESSION_CONFIG
+    model_path = model_path_for(config)
+    if not os.path.exists(model_path):
+        raise RuntimeError(f"Kokoro model file not found: {model_path}")
+
+    if not hasattr(Kokoro, "from_session"):
+        # Older kokoro-onnx releases build their own session
+        return Kokoro(model_path, voices_path)
+
+    import onnxruntime as ort
+    session = ort.InferenceSession(
+        model_path,
+        sess_options=build_session_options(config),
+        providers=["CPUExecutionProvider"],
+    )
+    return Kokoro.from_session(session, voices_path)
+
+
+class VoiceStyleCache:
+    """
+    Resolved voice style vectors, one per voice name. Passing the vector to
+    Kokoro.create() skips the per-call lookup in the voices file.
+    """
+
+    def __init__(self):
+        self._styles = {}
+        self._lock = threading.Lock()
+
+    def get(self, kokoro, voice: str):
+        """Style vector for `voice`, or the name itself if this Kokoro build can't resolve styles."""
+        style = self._styles.get(voice)
+        if style is not None:
+            return style
+        if not hasattr(kokoro, "get_voice_style"):
+            return voice
+        style = kokoro.get_voice_style(voice)
+        with self._lock:
+            self._styles[voice] = style
+        return style
+
+    def clear(self):
+        with self._lock:
+            self._styles.clear()
@@ -0,0 +1,170 @@
+"""
+Fast local language identification, no model or network call.
+
+Used to skip translating text that is already in the target language.
+Scripts written by a single language here decide it directly (kana ->
+Japanese, Hangul -> Korean, Greek, Hebrew, Thai, Han -> Chinese). Text in a
+shared script (Latin, Cyrillic, Arabic, Devanagari) is scored by the share of
+words that are common function words of each language of that script, and a
+language is ruled out if the text has letters its alphabet lacks (Ukrainian
+і/ї/є rule out Russian, Persian پ/گ/ی rule out Arabic). Short or ambiguous
+text, or a language without a word list (Serbian, Kazakh, Pashto, ...), gives
+no answer, and callers then translate as usual: a missed skip costs one model
+call, a wrong skip returns untranslated text.
+"""
+import re
+from typing import Optional, Tuple
+
+# Canonical name -> ways the target language may be written in a request
+LANGUAGE_ALIASES = {
+    "english": ("en", "eng", "english"),
+    "spanish": ("es", "spa", "spanish", "español", "espanol", "castellano"),
+    "french": ("fr", "fra", "fre", "french", "français", "francais"),
+    "german": ("de", "deu", "ger", "german", "deutsch"),
+    "italian": ("it", "ita", "italian", "italiano"),
+    "portuguese": ("pt", "por", "portuguese", "português", "portugues", "pt-br", "brazilian portuguese"),
+    "dutch": ("nl", "nld", "dut", "dutch", "nederlands"),
+    "russian": ("ru", "rus", "russian", "русский"),
+    "ukrainian": ("uk", "ukr", "ukrainian", "українська"),
+    "bulgarian": ("bg", "bul", "bulgarian", "български"),
+    "greek": ("el", "ell", "gre", "greek", "ελληνικά"),
+    "hebrew": ("he", "heb", "hebrew", "עברית"),
+    "arabic": ("ar", "ara", "arabic", "العربية"),
+    "persian": ("fa", "fas", "per", "persian", "farsi", "فارسی"),
+    "urdu": ("ur", "urd", "urdu", "اردو"),
+    "hindi": ("hi", "hin", "hindi", "हिन्दी", "हिंदी"),
+    "marathi": ("mr", "mar", "marathi", "मराठी"),
+    "nepali": ("ne", "nep", "nepali", "नेपाली"),
+    "thai": ("th", "tha", "thai", "ไทย"),
+    "korean": ("ko", "kor", "korean", "한국어"),
+    "japanese": ("ja", "jpn", "japanese", "日本語"),
+    "chinese": ("zh", "zho", "chi", "chinese", "mandarin", "中文", "simplified chinese", "traditional chinese"),
+}
+_ALIAS_TO_LANGUAGE = {alias: name for name, aliases in LANGUAGE_ALIASES.items() for alias in aliases}
+
+# Letters of a script (checked in order; kana before Han)
+_SCRIPTS = (
+    ("kana", re.compile(r"[぀-ヿ]")),
+    ("hangul", re.compile(r"[가-힯ᄀ-ᇿ]")),
+    ("han", re.compile(r"[一-鿿]")),
+    ("cyrillic", re.compile(r"[Ѐ-ӿ]")),
+    ("greek", re.compile(r"[Ͱ-Ͽ]")),
+    ("hebrew", re.compile(r"[֐-׿]")),
+    ("arabic", re.compile(r"[؀-ۿ]")),
+    ("devanagari", re.compile(r"[ऀ-ॿ]")),
+    ("thai", re.compile(r"[฀-๿]")),
+    ("latin", re.compile(r"[A-Za-zÀ-ɏ]")),
+)
+# Scripts only one language is written in (among those recognized)
+_SCRIPT_LANGUAGE = {
+    "kana": "japanese", "hangul": "korean", "han": "chinese", "greek": "greek", "hebrew": "hebrew", "thai": "thai",
+}
+# Scripts shared by several languages: scored by function words
+_SCRIPT_CANDIDATES = {
+    "latin": ("english", "spanish", "french", "german", "italian", "portuguese", "dutch"),
+    "cyrillic": ("russian", "ukrainian", "bulgarian"),
+    "arabic": ("arabic", "persian", "urdu"),
+    "devanagari": ("hindi", "marathi", "nepali"),
+}
+# Letters that rule a language out: its own alphabet lacks them. Related
+# languages without a word list (Serbian, Belarusian, Kazakh, Pashto, Kurdish)
+# use some of these letters and so are never taken for a listed one.
+_PASHTO_KURDISH = "ټډړښږځڅېۍڼێۆڵڕە"
+_FOREIGN_LETTERS = {
+    "russian": re.compile(r"(?![абвгдеёжзийклмнопрстуфхцчшщъыьэюя])[а-ӿ]"),
+    "ukrainian": re.compile(r"(?![абвгґдеєжзиіїйклмнопрстуфхцчшщьюя])[а-ӿ]"),
+    "bulgarian": re.compile(r"(?![абвгдежзийклмнопрстуфхцчшщъьюя])[а-ӿ]"),
+    "arabic": re.compile(f"[پچژگکیٹڈڑںےہ{_PASHTO_KURDISH}]"),
+    "persian": re.compile(f"[ٹڈڑںےہ{_PASHTO_KURDISH}]"),
+    "urdu": re.compile(f"[{_PASHTO_KURDISH}]"),
+    "hindi": re.compile(r"[ळ]"),
+}
+# Hebrew-script text with Yiddish ligatures is not Hebrew
+_YIDDISH = re.compile(r"[װױײ]")
+_LETTER = re.compile(r"[^\W\d_]", re.UNICODE)
+# Words, including the combining vowel signs of Devanagari and Arabic
+_WORD = re.compile(r"(?:[^\W\d_]|[\u0610-\u061a\u064b-\u065f\u0670\u0900-\u0903\u093a-\u094f\u0962\u0963])+", re.UNICODE)
+
+_FUNCTION_WORDS = {
+    "english": "the of and to in is that it for was on are with as be this by not at or from have an but they which you were has their we will would there been can",
+    "spanish": "de la que el en los se del las un por con no una su para es al lo como más pero sus le ya o este fue ha muy también entre cuando",
+    "french": "de la le et les des en un du une que est pour qui dans par sur au pas plus ne se ce il sont avec ou mais nous vous été aux",
+    "german": "der die und in den von zu das mit sich des auf für ist im dem nicht ein eine als auch es an werden aus er hat dass sie nach wird bei",
+    "italian": "di che il la e per un in non una sono del della le si da con gli al lo come più ma anche nel alla ha questo dei delle",
+    "portuguese": "de que o a do da em um para com não uma os no se na por mais as dos como mas foi ao ele das tem à seu sua ou quando muito nos",
+    "dutch": "de het een en van in is dat op te zijn voor met die niet aan er om ook als bij of wordt door maar naar dan nog werd hij",
+    "russian": "и в не на что с по как это он к но из у за же она так все его был то мы для вы бы только было они ещё уже который",
+    "ukrainian": "і в не на що з та як це він до але із у за від вона так все його був то ми ви б тільки було вони ще вже є який",
+    "bulgarian": "и в не на че се е са като това той към но от за да тя така всички беше ние ли ще още вече които който ако",
+    "arabic": "في من على أن إلى التي الذي عن مع هذا هذه كان لا ما هو هي قد إن ذلك كل بين أو ثم بعد عند",
+    "persian": "و در به از که این را با است می آن برای یک هم شده بود شود تا ها نیز اما دارد کرد هر خود",
+    "urdu": "کے میں کی ہے اور سے کو کا یہ نے پر ہیں تھا بھی ایک لیے تو ہو گیا کہ جو اس وہ",
+    "hindi": "है के में की और से को का यह पर हैं नहीं भी एक था कि लिए तो हो ने गया इस वह",
+    "marathi": "आहे आणि या हे ते त्या होते नाही आहेत मध्ये केले व तो ती त्याचे करून पण म्हणून हा",
+    "nepali": "छ र को मा हो पनि गर्न भएको छन् थियो यो त्यो गरेको लागि भने तर हुन्छ गरी",
+}
+_WORD_SETS = {language: set(words.split()) for language, words in _FUNCTION_WORDS.items()}
+
+# Below these, Latin-script text is too short or too mixed to call
+MIN_WORDS = 6
+MIN_FUNCTION_WORD_SHARE = 0.15
+MIN_MARGIN = 0.5
+
+
+def normalize_language(name: str) -> Optional[str]:
+    """Canonical language name for a request's target ("es", "Spanish", "español"), or None."""
+    return _ALIAS_TO_LANGUAGE.get(name.strip().lower())
+
+
+def _script(text: str) -> Tuple[Optional[str], float]:
+    """(script most letters are written in, its share of the letters), or (None, 0.0)."""
+    letters = _LETTER.findall(text)
+    if not letters:
+        return None, 0.0
+    for script, pattern in _SCRIPTS:
+        share = len(pattern.findall(text)) / len(letters)
+        # Japanese mixes kana with Han, so a little kana is enough
+        if share >= (0.1 if script == "kana" else 0.5):
+            return script, min(1.0, share * 2 if script == "kana" else share)
+    return None, 0.0
+
+
+def detect_language(text: str) -> Tuple[Optional[str], float]:
+    """(canonical language, confidence 0-1), or (None, 0.0) if unsure."""
+    script, share = _script(text)
+    if script is None:
+        return None, 0.0
+    if script in _SCRIPT_LANGUAGE:
+        if script == "hebrew" and _YIDDISH.search(text):
+            return None, 0.0
+        return _SCRIPT_LANGUAGE[script], share
+
+    words = [word.lower() for word in _WORD.findall(text)]
+    if len(words) < MIN_WORDS:
+        return None, 0.0
+    lowered = text.lower()
+    candidates = [
+        language for language in _SCRIPT_CANDIDATES[script]
+        if language not in _FOREIGN_LETTERS or not _FOREIGN_LETTERS[language].search(lowered)
+    ]
+    if not candidates:
+        return None, 0.0
+    scores = {
+        language: sum(1 for word in words if word in _WORD_SETS[language]) / len(words)
+        for language in candidates
+    }
+    ranked = sorted(scores.items(), key=lambda item: -item[1]) + [(None, 0.0)]
+    (best, best_score), (_, runner_up) = ranked[0], ranked[1]
+    if best_score < MIN_FUNCTION_WORD_SHARE:
+        return None, 0.0
+    # Confidence: how clearly the best language beats the next possible one
+    confidence = 1.0 - runner_up / best_score
+    if confidence < MIN_MARGIN:
+        return None, confidence
+    return best, confidence
+
+
+def is_in_language(text: str, language: str, min_confidence: float = 0.6) -> bool:
+    """True only if text is confidently detected as the given (canonical) language."""
+    detected, confidence = detect_language(text)
+    return detected is not None and detected == language and confidence >= min_confidence
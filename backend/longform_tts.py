@@ -0,0 +1,137 @@
+"""
+Long-form TTS: split long texts into segments and synthesize them in parallel.
+
+One synthesize() call on a whole article runs on a single inference path and
+can overflow Kokoro's phoneme window. Long texts are instead cut at paragraph
+and sentence boundaries into segments of at most TTS_SEGMENT_CHARS, which a
+shared pool of TTS_WORKERS threads synthesizes concurrently (locally or on the
+inference server). The results are stitched in order with a short pause
+between segments and a longer one between paragraphs.
+
+With local Kokoro, set KOKORO_INTRA_OP_THREADS to about cores / TTS_WORKERS
+so the parallel segments don't oversubscribe the CPU.
+
+Configuration (environment variables):
+    TTS_LONGFORM_CHARS       texts longer than this are segmented
+    TTS_SEGMENT_CHARS        longest segment sent to the model
+    TTS_WORKERS              segments synthesized at once (default: CPU count, at most 8)
+    TTS_SEGMENT_PAUSE_MS     silence between segments of a paragraph
+    TTS_PARAGRAPH_PAUSE_MS   silence between paragraphs
+"""
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from speech_models import synthesize
+
+TTS_LONGFORM_CHARS = int(os.getenv("TTS_LONGFORM_CHARS", "600"))
+TTS_SEGMENT_CHARS = int(os.getenv("TTS_SEGMENT_CHARS", "400"))
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", str(min(8, os.cpu_count() or 1))))
+TTS_SEGMENT_PAUSE_MS = int(os.getenv("TTS_SEGMENT_PAUSE_MS", "150"))
+TTS_PARAGRAPH_PAUSE_MS = int(os.getenv("TTS_PARAGRAPH_PAUSE_MS", "500"))
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+_CLAUSE_END = re.compile(r"(?<=[,])\s+")
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_tts_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=TTS_WORKERS, thread_name_prefix="tts-segment")
+    return _pool
+
+
+def _pack(pieces: List[str], max_chars: int) -> List[str]:
+    """Join consecutive pieces into chunks of at most max_chars."""
+    chunks, current = [], ""
+    for piece in pieces:
+        if current and len(current) + 1 + len(piece) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = f"{current} {piece}" if current else piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_long(sentence: str, max_chars: int) -> List[str]:
+    """A sentence longer than max_chars is cut at commas, then at spaces."""
+    if len(sentence) <= max_chars:
+        return [sentence]
+    pieces = []
+    for clause in _CLAUSE_END.split(sentence):
+        if len(clause) <= max_chars:
+            pieces.append(clause)
+        else:
+            pieces.extend(_pack(clause.split(), max_chars))
+    return _pack(pieces, max_chars)
+
+
+def segment_text(text: str, max_chars: int = TTS_SEGMENT_CHARS) -> List[Tuple[str, bool]]:
+    """(segment, ends_paragraph) pairs in reading order."""
+    segments = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        pieces = [p for sentence in _SENTENCE_END.split(paragraph) for p in _split_long(sentence, max_chars)]
+        chunks = _pack(pieces, max_chars)
+        segments.extend((chunk, i == len(chunks) - 1) for i, chunk in enumerate(chunks))
+    return segments
+
+
+def synthesize_long(
+    text: str,
+    voice: str,
+    speed: float = 1.0,
+    lang: str = "en-us",
+    segment_pause_ms: Optional[int] = None,
+    paragraph_pause_ms: Optional[int] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+):
+    """
+    Synthesize text segment by segment on the shared pool and stitch the
+    audio in order. on_progress(done, total) is called as segments finish.
+    Returns (samples, sample_rate).
+    """
+    segment_pause_ms = TTS_SEGMENT_PAUSE_MS if segment_pause_ms is None else segment_pause_ms
+    paragraph_pause_ms = TTS_PARAGRAPH_PAUSE_MS if paragraph_pause_ms is None else paragraph_pause_ms
+    segments = segment_text(text)
+    if not segments:
+        raise ValueError("Nothing to synthesize")
+
+    pool = get_tts_pool()
+    futures = {
+        pool.submit(synthesize, segment, voice=voice, speed=speed, lang=lang): i
+        for i, (segment, _) in enumerate(segments)
+    }
+    results = [None] * len(segments)
+    try:
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if on_progress:
+                on_progress(done, len(segments))
+    finally:
+        # On failure, don't leave the remaining segments occupying the pool
+        for future in futures:
+            future.cancel()
+
+    sample_rate = results[0][1]
+    parts = []
+    for i, ((samples, _), (_, ends_paragraph)) in enumerate(zip(results, segments)):
+        parts.append(np.asarray(samples, dtype=np.float32))
+        if i < len(segments) - 1:
+            pause_ms = paragraph_pause_ms if ends_paragraph else segment_pause_ms
+            parts.append(np.zeros(int(sample_rate * pause_ms / 1000), dtype=np.float32))
+    return np.concatenate(parts), sample_rate
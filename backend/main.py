@@ -1,26 +1,108 @@
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import time
+
+_import_start = time.perf_counter()
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from routers import chat, vision, tts, stt, translate, rag, voice_chat
-from database import engine, Base
+from fastapi.responses import JSONResponse
+from startup import timed_import, timed_phase, startup_report, STARTUP_PHASES
+from database import async_engine
+from tracing import TraceMiddleware
+from http_delivery import CachedStaticFiles, CompressionMiddleware, ETagMiddleware
 import models
+import warmup
+import search
+from model_catalog import model_catalog
+
+# Routers are timed individually so slow imports show up in /health/startup.
+# Heavy libraries (Whisper, Kokoro, Chroma, LangChain) are imported on first use.
+chat = timed_import("routers.chat")
+vision = timed_import("routers.vision")
+tts = timed_import("routers.tts")
+stt = timed_import("routers.stt")
+translate = timed_import("routers.translate")
+rag = timed_import("routers.rag")
+voice_chat = timed_import("routers.voice_chat")
+system = timed_import("routers.system")
+search_router = timed_import("routers.search")
+
+STARTUP_PHASES["import"] = time.perf_counter() - _import_start
+
+# Open the Chroma store in the background after startup instead of on the first RAG request
+WARM_VECTORSTORE = os.getenv("WARM_VECTORSTORE", "1") == "1"
+
+
+def _warm_vectorstore():
+    import rag_utils
+    with timed_phase("vectorstore"):
+        if rag_utils.RAG_SHARDING == "single":
+            rag_utils.get_collection()
+        else:
+            # Shards are opened on first use
+            rag_utils.get_vector_client()
+        rag_utils.get_embeddings()
+
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+def _warm_model_catalog():
+    # Fill the model catalog so the first page load doesn't wait on Ollama
+    try:
+        model_catalog.refresh()
+    except Exception as e:
+        print(f"Model catalog not loaded at startup: {e}")
 
-app = FastAPI(title="AI Playground API")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    with timed_phase("create_tables"):
+        # Create database tables
+        async with async_engine.begin() as conn:
+            await conn.run_sync(models.Base.metadata.create_all)
+            if async_engine.dialect.name == "sqlite":
+                # Full-text indexes; ones created now are filled from existing rows
+                indexed = await conn.run_sync(search.ensure_search_index)
+                if indexed:
+                    print(f"Built search index for: {', '.join(indexed)}")
+
+    # Model preloading runs in the background so /health answers right away;
+    # /ready only turns green once it has finished.
+    background = [
+        asyncio.create_task(asyncio.to_thread(warmup.run_warmup)),
+        asyncio.create_task(asyncio.to_thread(_warm_model_catalog)),
+    ]
+    if WARM_VECTORSTORE:
+        background.append(asyncio.create_task(asyncio.to_thread(_warm_vectorstore)))
+
+    print(f"Startup complete: {startup_report()['phases']}")
+    yield
+
+    # Don't let warm-up retries hold up shutdown or reload
+    warmup.stop()
+    for task in background:
+        task.cancel()
+    await async_engine.dispose()
+
+
+app = FastAPI(title="AI Playground API", lifespan=lifespan)
+
+# Innermost first: the ETag is computed on the uncompressed body
+app.add_middleware(ETagMiddleware)
+app.add_middleware(CompressionMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "Server-Timing", "X-Quality-Tier"],
 )
+# Added last so it wraps everything: the root span covers the whole request
+app.add_middleware(TraceMiddleware)
 
-from fastapi.staticfiles import StaticFiles
-import os
 os.makedirs("static", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 app.include_router(chat.router, prefix="/api", tags=["chat"])
 app.include_router(vision.router, prefix="/api", tags=["vision"])
@@ -29,6 +111,8 @@ app.include_router(stt.router, prefix="/api", tags=["stt"])
 app.include_router(translate.router, prefix="/api", tags=["translate"])
 app.include_router(rag.router, prefix="/api", tags=["rag"])
 app.include_router(voice_chat.router, prefix="/api", tags=["voice"])
+app.include_router(system.router, prefix="/api", tags=["system"])
+app.include_router(search_router.router, prefix="/api", tags=["search"])
 
 @app.get("/")
 def read_root():
@@ -37,3 +121,14 @@ def read_root():
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness probe: 503 until the configured models are loaded and warmed up."""
+    ready, details = warmup.readiness()
+    return JSONResponse(details, status_code=200 if ready else 503)
+
+@app.get("/health/startup")
+def startup_timings():
+    """Per-module import cost and duration of each startup phase, in seconds."""
+    return startup_report()
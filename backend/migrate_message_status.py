@@ -0,0 +1,29 @@
+"""Migration script adding the status column (complete/interrupted) to chat and voice messages"""
+import sqlite3
+
+from database import engine
+
+# Connect to database
+conn = sqlite3.connect(engine.url.database)
+cursor = conn.cursor()
+
+try:
+    for table in ("chat_messages", "voice_messages"):
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = {row[1] for row in cursor.fetchall()}
+        if not columns:
+            print(f"No {table} table yet, it will be created on startup")
+        elif "status" not in columns:
+            # Messages saved before cancellation existed always ran to completion
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN status VARCHAR DEFAULT 'complete'")
+            cursor.execute(f"UPDATE {table} SET status = 'complete' WHERE status IS NULL")
+            print(f"Added {table}.status")
+
+    conn.commit()
+    print("✅ Migration completed successfully!")
+
+except Exception as e:
+    print(f"❌ Migration failed: {e}")
+    conn.rollback()
+finally:
+    conn.close()
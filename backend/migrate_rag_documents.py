@@ -0,0 +1,32 @@
+"""Migration script adding shard columns to the rag_documents table"""
+import sqlite3
+
+from database import engine
+
+# Connect to database
+conn = sqlite3.connect(engine.url.database)
+cursor = conn.cursor()
+
+try:
+    cursor.execute("PRAGMA table_info(rag_documents)")
+    columns = {row[1] for row in cursor.fetchall()}
+    if not columns:
+        print("No rag_documents table yet, it will be created on startup")
+    else:
+        if "collection" not in columns:
+            # Documents uploaded before sharding all live in the single collection
+            cursor.execute("ALTER TABLE rag_documents ADD COLUMN collection VARCHAR DEFAULT 'documents'")
+            cursor.execute("UPDATE rag_documents SET collection = 'documents' WHERE collection IS NULL")
+            print("Added rag_documents.collection")
+        if "namespace" not in columns:
+            cursor.execute("ALTER TABLE rag_documents ADD COLUMN namespace VARCHAR")
+            print("Added rag_documents.namespace")
+
+    conn.commit()
+    print("✅ Migration completed successfully!")
+
+except Exception as e:
+    print(f"❌ Migration failed: {e}")
+    conn.rollback()
+finally:
+    conn.close()
@@ -0,0 +1,13 @@
+"""Migration script building the full-text search indexes (FTS5) for existing history rows"""
+from database import engine
+from search import ensure_search_index
+
+try:
+    with engine.begin() as conn:
+        # Creates any missing index and trigger, then re-reads every row
+        tables = ensure_search_index(conn, rebuild=True)
+    print(f"Indexed: {', '.join(tables)}")
+    print("✅ Migration completed successfully!")
+
+except Exception as e:
+    print(f"❌ Migration failed: {e}")
@@ -0,0 +1,188 @@
+"""
+Cached catalog of the models installed in Ollama.
+
+Model pickers and default-model resolution read from here instead of calling
+ollama.list() on every request:
+
+- The installed list is cached for MODEL_CATALOG_TTL seconds. After that the
+  stale list is still served while a background thread refreshes it; only the
+  very first call waits for Ollama.
+- Which models are loaded in memory (Ollama's running-models API, /api/ps)
+  is refreshed the same way on the shorter MODEL_RESIDENCY_TTL.
+- Capabilities (chat, vision, embedding, tools) come from each model's
+  metadata (/api/show), fetched once per model digest.
+- default_model() prefers a model that is already resident, so a request
+  without an explicit model does not trigger a cold load when another capable
+  model is ready.
+
+Configuration (environment variables):
+    MODEL_CATALOG_TTL      seconds before the installed-model list is refreshed
+    MODEL_RESIDENCY_TTL    seconds before the loaded-model list is refreshed
+    DEFAULT_CHAT_MODEL     preferred model for chat, RAG, translation and voice
+    DEFAULT_VISION_MODEL   preferred model for image analysis
+"""
+import os
+import threading
+import time
+
+import ollama
+
+MODEL_CATALOG_TTL = float(os.getenv("MODEL_CATALOG_TTL", "60"))
+MODEL_RESIDENCY_TTL = float(os.getenv("MODEL_RESIDENCY_TTL", "5"))
+DEFAULT_MODELS = {
+    "chat": os.getenv("DEFAULT_CHAT_MODEL", "llama3.2-vision:latest"),
+    "vision": os.getenv("DEFAULT_VISION_MODEL", "llama3.2-vision:latest"),
+}
+
+# Ollama capability names -> the tags used by this app
+CAPABILITY_TAGS = {"completion": "chat", "vision": "vision", "embedding": "embedding", "tools": "tools"}
+
+
+def full_name(model: str) -> str:
+    """Ollama treats "name" and "name:latest" as the same model."""
+    return model if ":" in model else f"{model}:latest"
+
+
+def _capabilities_from_metadata(show) -> list:
+    """Derive tags from architecture metadata, for servers that do not report capabilities."""
+    info = show.get("modelinfo") or {}
+    families = [f.lower() for f in ((show.get("details") or {}).get("families") or [])]
+    if any(key.endswith(".pooling_type") for key in info) or any("bert" in f for f in families):
+        return ["embedding"]
+    tags = ["chat"]
+    if any(".vision." in key for key in info) or any(f in ("clip", "mllama") for f in families):
+        tags.append("vision")
+    return tags
+
+
+def _capabilities(show) -> list:
+    reported = show.get("capabilities")
+    if reported:
+        return [CAPABILITY_TAGS[c] for c in reported if c in CAPABILITY_TAGS]
+    return _capabilities_from_metadata(show)
+
+
+class ModelCatalog:
+    def __init__(self, ttl: float = MODEL_CATALOG_TTL, residency_ttl: float = MODEL_RESIDENCY_TTL):
+        self.ttl = ttl
+        self.residency_ttl = residency_ttl
+        self._models = None      # list of dicts from ollama.list()
+        self._listed_at = 0.0
+        self._loaded = set()     # full names of models currently in memory
+        self._ps_at = 0.0
+        self._capabilities = {}  # digest -> tags
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+    def _fetch_list(self):
+        models = []
+        for m in ollama.list().get("models", []):
+            entry = m.model_dump(mode="json") if hasattr(m, "model_dump") else dict(m)
+            digest = entry.get("digest") or entry["model"]
+            if digest in self._capabilities:
+                entry["capabilities"] = self._capabilities[digest]
+                models.append(entry)
+                continue
+            try:
+                entry["capabilities"] = self._capabilities[digest] = _capabilities(ollama.show(entry["model"]))
+            except Exception as e:
+                # Guess from the list entry for now; show is retried on the next refresh
+                print(f"Could not read capabilities of {entry['model']}: {e}")
+                entry["capabilities"] = _capabilities_from_metadata({"details": entry.get("details")})
+            models.append(entry)
+        with self._lock:
+            self._models = models
+            self._listed_at = time.monotonic()
+
+    def _fetch_loaded(self):
+        loaded = {full_name(m.get("model") or m.get("name")) for m in ollama.ps().get("models", [])}
+        with self._lock:
+            self._loaded = loaded
+            self._ps_at = time.monotonic()
+
+    def _refresh_in_background(self, name: str, fetch):
+        with self._lock:
+            if name in self._refreshing:
+                return
+            self._refreshing.add(name)
+
+        def run():
+            try:
+                fetch()
+            except Exception as e:
+                print(f"Model catalog refresh ({name}) failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(name)
+
+        threading.Thread(target=run, name=f"model-catalog-{name}", daemon=True).start()
+
+    def refresh(self):
+        """Fetch everything now (blocking). Used at startup."""
+        self._fetch_list()
+        self._fetch_loaded()
+
+    def _cached(self, block: bool):
+        now = time.monotonic()
+        if self._models is None:
+            if not block:
+                self._refresh_in_background("list", self._fetch_list)
+                return None, set()
+            self._fetch_list()
+        elif now - self._listed_at > self.ttl:
+            self._refresh_in_background("list", self._fetch_list)
+        if now - self._ps_at > self.residency_ttl:
+            if block and not self._ps_at:
+                try:
+                    self._fetch_loaded()
+                except Exception as e:
+                    print(f"Could not read loaded models: {e}")
+            else:
+                self._refresh_in_background("ps", self._fetch_loaded)
+        return self._models, self._loaded
+
+    def models(self, capability: str = None) -> list:
+        """
+        Installed models with "capabilities" and "loaded" fields, optionally only
+        those with the given capability. Blocks only until the first list is fetched.
+        """
+        models, loaded = self._cached(block=True)
+        return [
+            {**m, "loaded": full_name(m["model"]) in loaded}
+            for m in models
+            if capability is None or capability in m["capabilities"]
+        ]
+
+    def default_model(self, capability: str = "chat") -> str:
+        """
+        Model to use when a request does not name one, without ever waiting on
+        Ollama: the configured default if it is loaded, else another loaded
+        model with the capability, else the configured default if installed,
+        else any installed model with the capability.
+        """
+        configured = DEFAULT_MODELS.get(capability, DEFAULT_MODELS["chat"])
+        models, loaded = self._cached(block=False)
+        if not models:
+            return configured
+        capable = [m["model"] for m in models if capability in m["capabilities"]]
+        if full_name(configured) in loaded:
+            return configured
+        for name in capable:
+            if full_name(name) in loaded:
+                return name
+        if any(full_name(name) == full_name(configured) for name in capable) or not capable:
+            return configured
+        return capable[0]
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "models": len(self._models or []),
+            "loaded": sorted(self._loaded),
+            "list_age_s": now - self._listed_at if self._models is not None else None,
+            "residency_age_s": now - self._ps_at if self._ps_at else None,
+            "defaults": {capability: self.default_model(capability) for capability in DEFAULT_MODELS},
+        }
+
+
+model_catalog = ModelCatalog()
@@ -19,6 +19,7 @@ class ChatMessage(Base):
     session_id = Column(Integer, ForeignKey("chat_sessions.id"))
     role = Column(String)  # "user" or "assistant"
     content = Column(Text)
+    status = Column(String, default="complete")  # "complete" or "interrupted"
     created_at = Column(DateTime, default=datetime.utcnow)
 
     session = relationship("ChatSession", back_populates="messages")
@@ -77,6 +78,24 @@ class VoiceMessage(Base):
     ai_audio_path = Column(String)
     language = Column(String)
     language_probability = Column(Float)
+    status = Column(String, default="complete")  # "complete" or "interrupted"
     created_at = Column(DateTime, default=datetime.utcnow)
     
     session = relationship("VoiceSession", back_populates="messages")
+
+class RAGDocument(Base):
+    __tablename__ = "rag_documents"
+    # Shared across API workers, unlike the old in-memory registry in routers/rag.py
+    id = Column(String, primary_key=True, index=True)  # doc_id used in the vector store
+    filename = Column(String)
+    chunks = Column(Integer)
+    collection = Column(String, default="documents")  # Chroma collection (shard) holding the chunks
+    namespace = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class RAGCacheGeneration(Base):
+    __tablename__ = "rag_cache_generations"
+    # Bumped when the documents behind a cache scope change, so every API worker
+    # can tell its cached RAG answers for that scope are stale (see semantic_cache.py)
+    scope = Column(String, primary_key=True)  # doc_id, "ns:<namespace>" or "*" for all documents
+    generation = Column(Integer, default=0)
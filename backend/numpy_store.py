@@ -0,0 +1,422 @@
+"""
+Compact NumPy vector store for small and medium corpora.
+
+An alternative to Chroma for RAG (RAG_VECTOR_STORE=numpy). It implements the
+part of the Chroma client/collection API that rag_utils uses, so the rest of
+the code does not know which store it talks to.
+
+Each collection is a directory holding:
+    vectors.bin   append-only matrix of unit-normalized embeddings, memory-mapped
+                  for search; float16, or int8 with a per-row scale (scales.bin)
+    rows.sqlite   side table: id, doc_id, namespace, text, metadata, tombstone flag
+
+Search is exact: the query is multiplied with the matrix block by block and the
+top k are taken with argpartition, restricted by doc_id / namespace masks.
+int8 is both smaller and faster to scan than float16 (NumPy's float16 to
+float32 conversion dominates a float16 scan) at a small recall cost.
+Deletes only set tombstones; the matrix is rewritten without them (compaction)
+once they make up RAG_NUMPY_COMPACT_RATIO of the rows, or on demand:
+
+    python numpy_store.py compact [collection ...]
+
+Several processes (API workers) may use a store at once. Every write takes
+SQLite's write lock on rows.sqlite (BEGIN IMMEDIATE) before it reads the row
+count, so appends to vectors.bin and compaction never overlap.
+
+Configuration (environment variables):
+    RAG_NUMPY_DTYPE          float16 | int8, used for new collections
+    RAG_NUMPY_COMPACT_RATIO  fraction of deleted rows that triggers compaction
+"""
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+RAG_NUMPY_DTYPE = os.getenv("RAG_NUMPY_DTYPE", "float16")
+RAG_NUMPY_COMPACT_RATIO = float(os.getenv("RAG_NUMPY_COMPACT_RATIO", "0.25"))
+# Rows converted to float32 and multiplied per step during search; small enough
+# for the temporary to stay in cache, which matters more than BLAS call overhead
+SEARCH_BLOCK_ROWS = 4096
+# Metadata keys that can be used in `where` filters
+FILTER_KEYS = ("doc_id", "namespace")
+# How long a write waits for another process's write to finish
+WRITE_LOCK_TIMEOUT = 60.0
+
+_DTYPES = {"float16": np.float16, "int8": np.int8}
+
+
+class NumpyCollection:
+    def __init__(self, path: str, name: str, metadata: dict = None):
+        self.name = name
+        self.path = path
+        self._lock = threading.RLock()
+        os.makedirs(path, exist_ok=True)
+        self._db = sqlite3.connect(
+            os.path.join(path, "rows.sqlite"), timeout=WRITE_LOCK_TIMEOUT, check_same_thread=False
+        )
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER NOT NULL,
+                id TEXT PRIMARY KEY,
+                doc_id TEXT,
+                namespace TEXT,
+                document TEXT,
+                metadata TEXT,
+                deleted INTEGER DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS rows_row ON rows(row);
+            CREATE INDEX IF NOT EXISTS rows_doc_id ON rows(doc_id);
+            CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT);
+        """)
+        if self._state("metadata") is None:
+            self._db.execute("BEGIN IMMEDIATE")
+            # Another process may have created the collection meanwhile
+            if self._state("metadata") is None:
+                self._set_state("metadata", json.dumps(metadata or {}))
+                self._set_state("dtype", RAG_NUMPY_DTYPE)
+                self._set_state("rows", "0")
+                self._set_state("generation", "0")
+            self._db.commit()
+        self.metadata = json.loads(self._state("metadata"))
+        self.dtype = self._state("dtype")
+        self._generation = None
+        self._refresh()
+
+    # --- state -----------------------------------------------------------
+
+    def _state(self, key: str) -> Optional[str]:
+        row = self._db.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str):
+        self._db.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    def _bump_generation(self):
+        self._set_state("generation", str(int(self._state("generation")) + 1))
+
+    def _refresh(self):
+        """Reload the in-memory row index if another process (or compaction) changed the store."""
+        if self._state("generation") == self._generation:
+            return
+        # One read transaction, so the row count and the rows belong together
+        own_transaction = not self._db.in_transaction
+        if own_transaction:
+            self._db.execute("BEGIN")
+        try:
+            self._load()
+        finally:
+            if own_transaction:
+                self._db.commit()
+
+    def _load(self):
+        generation = self._state("generation")
+        n = int(self._state("rows"))
+        dim = self._state("dim")
+        self.dim = int(dim) if dim else None
+
+        self._ids = [None] * n
+        self._id_rows = {}
+        self._alive = np.zeros(n, dtype=bool)
+        self._codes = {key: {} for key in FILTER_KEYS}
+        self._row_codes = {key: np.full(n, -1, dtype=np.int32) for key in FILTER_KEYS}
+        for row, chunk_id, doc_id, namespace, deleted in self._db.execute(
+            "SELECT row, id, doc_id, namespace, deleted FROM rows"
+        ):
+            self._ids[row] = chunk_id
+            if not deleted:
+                self._id_rows[chunk_id] = row
+                self._alive[row] = True
+            for key, value in (("doc_id", doc_id), ("namespace", namespace)):
+                if value is not None:
+                    self._row_codes[key][row] = self._codes[key].setdefault(value, len(self._codes[key]))
+
+        self._vectors = self._map("vectors.bin", _DTYPES[self.dtype], (n, self.dim)) if n else None
+        self._scales = self._map("scales.bin", np.float32, (n,)) if n and self.dtype == "int8" else None
+        self._generation = generation
+
+    def _map(self, filename: str, dtype, shape):
+        return np.memmap(os.path.join(self.path, filename), dtype=dtype, mode="r", shape=shape)
+
+    # --- writes ----------------------------------------------------------
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold the write lock of this store across threads and processes, with
+        the in-memory index brought up to date under it. Commits (bumping the
+        generation if anything changed) or rolls back.
+        """
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                changes = self._db.total_changes
+                yield
+                if self._db.total_changes != changes:
+                    self._bump_generation()
+                self._db.commit()
+            except BaseException:
+                self._db.rollback()
+                # The in-memory index may hold changes that were just undone
+                self._generation = None
+                raise
+            self._refresh()
+
+    def _encode(self, vectors: np.ndarray):
+        """Unit-normalize and convert to the storage dtype; returns (stored, scales)."""
+        vectors = vectors / (np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12)
+        if self.dtype == "int8":
+            scales = np.abs(vectors).max(axis=1) / 127 + 1e-12
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return vectors.astype(np.float16), None
+
+    def _append_file(self, filename: str, data: np.ndarray, offset_rows: int):
+        row_bytes = data.itemsize * (data.shape[1] if data.ndim == 2 else 1)
+        with open(os.path.join(self.path, filename), "ab") as f:
+            # Drop bytes of a write that crashed before its rows were committed
+            f.truncate(offset_rows * row_bytes)
+            f.write(np.ascontiguousarray(data).tobytes())
+
+    def add(self, ids: List[str], embeddings, documents: List[str] = None, metadatas: List[dict] = None):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{}] * len(ids)
+        with self._writing():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._set_state("dim", str(self.dim))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection ({self.dim})")
+
+            # Re-adding an id (live or deleted) replaces the old row
+            self._db.executemany("DELETE FROM rows WHERE id = ?", [(i,) for i in ids])
+
+            n = len(self._ids)
+            stored, scales = self._encode(vectors)
+            self._append_file("vectors.bin", stored, n)
+            if scales is not None:
+                self._append_file("scales.bin", scales, n)
+
+            self._db.executemany(
+                "INSERT INTO rows (row, id, doc_id, namespace, document, metadata) VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (n + i, chunk_id, (meta or {}).get("doc_id"), (meta or {}).get("namespace"), doc, json.dumps(meta or {}))
+                    for i, (chunk_id, doc, meta) in enumerate(zip(ids, documents, metadatas))
+                ]
+            )
+            self._set_state("rows", str(n + len(ids)))
+
+    def update(self, ids: List[str], metadatas: List[dict]):
+        with self._writing():
+            self._db.executemany(
+                "UPDATE rows SET metadata = ?, doc_id = ?, namespace = ? WHERE id = ? AND deleted = 0",
+                [(json.dumps(meta), meta.get("doc_id"), meta.get("namespace"), chunk_id) for chunk_id, meta in zip(ids, metadatas)]
+            )
+
+    def delete(self, ids: List[str] = None, where: dict = None):
+        with self._writing():
+            rows = self._rows_for(ids, where)
+            if not len(rows):
+                return
+            self._db.executemany("UPDATE rows SET deleted = 1 WHERE row = ?", [(int(r),) for r in rows])
+            self._alive[rows] = False
+            if 1 - self._alive.mean() >= RAG_NUMPY_COMPACT_RATIO:
+                self._compact()
+
+    def compact(self):
+        """Rewrite the matrix without deleted rows and renumber the side table."""
+        with self._writing():
+            self._compact()
+
+    def _compact(self):
+        # Caller holds the write lock
+        keep = np.flatnonzero(self._alive)
+        if len(keep) == len(self._ids):
+            return
+        replacements = []
+        for filename, source in (("vectors.bin", self._vectors), ("scales.bin", self._scales)):
+            if source is None:
+                continue
+            tmp = os.path.join(self.path, filename + ".tmp")
+            with open(tmp, "wb") as f:
+                for start in range(0, len(keep), SEARCH_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(source[keep[start:start + SEARCH_BLOCK_ROWS]]).tobytes())
+            replacements.append((tmp, os.path.join(self.path, filename)))
+
+        self._db.execute("DELETE FROM rows WHERE deleted = 1")
+        self._db.executemany(
+            "UPDATE rows SET row = ? WHERE id = ?",
+            [(new_row, self._ids[old_row]) for new_row, old_row in enumerate(keep)]
+        )
+        self._set_state("rows", str(len(keep)))
+        # Swapped in right before the caller commits the renumbered rows
+        for tmp, path in replacements:
+            os.replace(tmp, path)
+
+    # --- reads -----------------------------------------------------------
+
+    def _mask(self, where: Optional[dict]) -> np.ndarray:
+        mask = self._alive.copy()
+        if not where:
+            return mask
+        clauses = where["$and"] if "$and" in where else [{key: value} for key, value in where.items()]
+        for clause in clauses:
+            (key, value), = clause.items()
+            if key not in FILTER_KEYS:
+                raise ValueError(f"Unsupported filter key for the NumPy store: {key}")
+            code = self._codes[key].get(value)
+            if code is None:
+                return np.zeros_like(mask)
+            mask &= self._row_codes[key] == code
+        return mask
+
+    def _rows_for(self, ids: Optional[List[str]], where: Optional[dict]) -> np.ndarray:
+        if ids is not None:
+            rows = np.array([self._id_rows[i] for i in ids if i in self._id_rows], dtype=np.int64)
+            return rows[self._mask(where)[rows]] if where else rows
+        return np.flatnonzero(self._mask(where))
+
+    def _snapshot(self) -> tuple:
+        """Arrays of the current generation; stay valid for a search even if a write replaces them."""
+        return self._ids, self._vectors, self._scales
+
+    @staticmethod
+    def _decode(snapshot: tuple, rows: np.ndarray) -> np.ndarray:
+        _, vectors, scales = snapshot
+        decoded = np.asarray(vectors[rows], dtype=np.float32)
+        if scales is not None:
+            decoded *= scales[rows][:, None]
+        return decoded
+
+    def _fetch(self, snapshot: tuple, rows, include) -> Dict[str, list]:
+        rows = [int(r) for r in rows]
+        ids = [snapshot[0][r] for r in rows]
+        result = {"ids": ids}
+        if "documents" in include or "metadatas" in include:
+            found = {}
+            with self._lock:
+                for start in range(0, len(ids), 500):
+                    part = ids[start:start + 500]
+                    placeholders = ",".join("?" * len(part))
+                    for chunk_id, document, metadata in self._db.execute(
+                        f"SELECT id, document, metadata FROM rows WHERE id IN ({placeholders})", part
+                    ):
+                        found[chunk_id] = (document, json.loads(metadata))
+            # A row deleted since the snapshot was taken comes back empty
+            if "documents" in include:
+                result["documents"] = [found.get(i, (None, {}))[0] for i in ids]
+            if "metadatas" in include:
+                result["metadatas"] = [found.get(i, (None, {}))[1] for i in ids]
+        if "embeddings" in include:
+            result["embeddings"] = list(self._decode(snapshot, np.array(rows, dtype=np.int64))) if rows else []
+        return result
+
+    def get(self, ids: List[str] = None, where: dict = None, include: List[str] = ("metadatas", "documents")):
+        with self._lock:
+            self._refresh()
+            return self._fetch(self._snapshot(), self._rows_for(ids, where), include)
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    def _search(self, snapshot: tuple, query: np.ndarray, mask: np.ndarray, k: int):
+        """Exact top-k (rows, cosine similarities) among rows where mask is set."""
+        _, vectors, scales = snapshot
+        best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        for start in range(0, len(mask), SEARCH_BLOCK_ROWS):
+            block_mask = mask[start:start + SEARCH_BLOCK_ROWS]
+            if not block_mask.any():
+                continue
+            rows = np.flatnonzero(block_mask) + start
+            # Contiguous slice when most rows qualify, fancy indexing for selective filters
+            if len(rows) > len(block_mask) // 2:
+                block = np.asarray(vectors[start:start + len(block_mask)], dtype=np.float32)
+                scores = (block @ query)[block_mask]
+                if scales is not None:
+                    scores *= scales[rows]
+            else:
+                scores = self._decode(snapshot, rows) @ query
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, scores])
+            if len(best_rows) > k:
+                top = np.argpartition(-best_scores, k)[:k]
+                best_rows, best_scores = best_rows[top], best_scores[top]
+        order = np.argsort(-best_scores)
+        return best_rows[order], best_scores[order]
+
+    def query(self, query_embeddings, n_results: int = 10, where: dict = None,
+              include: List[str] = ("documents", "metadatas", "distances")):
+        # The matrix product runs outside the lock, on this generation's arrays
+        with self._lock:
+            self._refresh()
+            mask = self._mask(where)
+            snapshot = self._snapshot()
+        results = {key: [] for key in ("ids", *include)}
+        for query in np.asarray(query_embeddings, dtype=np.float32):
+            query = query / (np.linalg.norm(query) + 1e-12)
+            if snapshot[1] is None or not mask.any():
+                rows, scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            else:
+                rows, scores = self._search(snapshot, query, mask, n_results)
+            fetched = self._fetch(snapshot, rows, include)
+            for key, value in fetched.items():
+                results[key].append(value)
+            if "distances" in include:
+                # Cosine distance, as in a Chroma collection with hnsw:space=cosine
+                results["distances"].append([float(1 - s) for s in scores])
+        return results
+
+
+class NumpyVectorStore:
+    """Client with the Chroma methods rag_utils needs; one directory per collection."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._collections = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def get_or_create_collection(self, name: str, metadata: dict = None) -> NumpyCollection:
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = NumpyCollection(os.path.join(self.path, name), name, metadata)
+            return self._collections[name]
+
+    def list_collections(self) -> List[str]:
+        return sorted(
+            name for name in os.listdir(self.path)
+            if os.path.exists(os.path.join(self.path, name, "rows.sqlite"))
+        )
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            collection = self._collections.pop(name, None)
+            if collection is not None:
+                collection._db.close()
+            directory = os.path.join(self.path, name)
+            if not os.path.isdir(directory):
+                raise ValueError(f"Collection {name} does not exist.")
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "compact":
+        print("Usage: python numpy_store.py compact [collection ...]")
+        sys.exit(1)
+    from rag_utils import NUMPY_STORE_PATH
+    store = NumpyVectorStore(NUMPY_STORE_PATH)
+    for name in sys.argv[2:] or store.list_collections():
+        collection = store.get_or_create_collection(name)
+        before = len(collection._ids)
+        collection.compact()
+        print(f"{name}: {before} -> {len(collection._ids)} rows")
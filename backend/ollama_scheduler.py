@@ -0,0 +1,279 @@
+"""
+Priority scheduler and admission control for Ollama calls.
+
+Every call to the local Ollama server takes a slot from this scheduler first,
+so a bulk translation or a large PDF ingestion cannot push interactive voice
+chat to the back of Ollama's own queue.
+
+- Priority classes, highest first: VOICE, CHAT (also vision), RAG, BATCH
+  (translation, document embedding, warm-up).
+- At most OLLAMA_MAX_CONCURRENCY calls run at once, and at most the per-model
+  cap for any one model.
+- When a slot frees up, the waiting call with the best effective priority gets
+  it. Effective priority improves by one class per OLLAMA_SCHED_AGING_SECONDS
+  of waiting, so lower classes are never starved; ties go to the oldest call.
+- Each class has a deadline for queue wait. A call whose estimated wait
+  (calls ahead of it x average service time / capacity) already exceeds it
+  is rejected immediately, and one still queued at its deadline is rejected
+  then. Either way the client gets 503 with Retry-After instead of a request
+  that hangs.
+
+Configuration (environment variables):
+    OLLAMA_MAX_CONCURRENCY        calls running at once (match OLLAMA_NUM_PARALLEL on the server)
+    OLLAMA_MODEL_CONCURRENCY      per-model caps, e.g. "llama3.2-vision:latest=1,nomic-embed-text=2"
+    OLLAMA_SCHED_DEADLINES        queue-wait deadlines in seconds, e.g. "voice=5,chat=30,rag=30,batch=600"
+    OLLAMA_SCHED_AGING_SECONDS    waiting time that promotes a call by one class
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager, contextmanager
+
+from fastapi import HTTPException
+
+from tracing import span
+
+VOICE, CHAT, RAG, BATCH = 0, 1, 2, 3
+CLASS_NAMES = {VOICE: "voice", CHAT: "chat", RAG: "rag", BATCH: "batch"}
+
+
+def parse_map(value: str, cast) -> dict:
+    """Parse a "name=value,name=value" setting (also used by quality.py, embedding_backends.py and context_packer.py)."""
+    parsed = {}
+    for entry in value.split(","):
+        if "=" in entry:
+            name, setting = entry.rsplit("=", 1)
+            parsed[name.strip()] = cast(setting)
+    return parsed
+
+
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+OLLAMA_MODEL_CONCURRENCY = parse_map(os.getenv("OLLAMA_MODEL_CONCURRENCY", ""), int)
+OLLAMA_SCHED_DEADLINES = {
+    "voice": 5.0, "chat": 30.0, "rag": 30.0, "batch": 600.0,
+    **parse_map(os.getenv("OLLAMA_SCHED_DEADLINES", ""), float),
+}
+OLLAMA_SCHED_AGING_SECONDS = float(os.getenv("OLLAMA_SCHED_AGING_SECONDS", "10"))
+# Queue waits kept per class for the reported percentiles
+WAIT_SAMPLES = 500
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile, or None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class SchedulerRejected(HTTPException):
+    """Raised instead of queueing a call that would miss its deadline."""
+
+    def __init__(self, priority: int, model: str, retry_after: float):
+        super().__init__(
+            status_code=503,
+            detail=f"Ollama is busy: {CLASS_NAMES[priority]} request for {model} would wait too long",
+            headers={"Retry-After": str(max(1, int(retry_after)))},
+        )
+
+
+class Ticket:
+    def __init__(self, priority: int, model: str, deadline: float):
+        self.priority = priority
+        self.model = model
+        self.enqueued = time.monotonic()
+        self.deadline_at = self.enqueued + deadline
+        self.granted_at = None
+        self.rejected = False
+        self.released = False
+        self._event = threading.Event()
+        self._loop = None
+        self._future = None
+
+    def _wake(self):
+        self._event.set()
+        if self._future is not None:
+            self._loop.call_soon_threadsafe(
+                lambda: self._future.done() or self._future.set_result(None)
+            )
+
+
+class OllamaScheduler:
+    def __init__(self, max_concurrency: int, model_caps: dict, deadlines: dict, aging_seconds: float):
+        self.max_concurrency = max_concurrency
+        self.model_caps = model_caps
+        self.deadlines = deadlines
+        self.aging_seconds = aging_seconds
+        self._lock = threading.Lock()
+        self._waiting = []
+        self._running = 0
+        self._running_by_model = defaultdict(int)
+        self._service_time = {}  # model -> moving average of seconds per call
+        self._waits = {p: deque(maxlen=WAIT_SAMPLES) for p in CLASS_NAMES}
+        self._counts = {p: defaultdict(int) for p in CLASS_NAMES}
+
+    def _cap(self, model: str) -> int:
+        return min(self.model_caps.get(model, self.max_concurrency), self.max_concurrency)
+
+    def _effective_priority(self, ticket: Ticket, now: float) -> float:
+        return ticket.priority - (now - ticket.enqueued) / self.aging_seconds
+
+    def _dispatch(self):
+        """Grant free slots to the best eligible waiting calls. Caller holds the lock."""
+        now = time.monotonic()
+        while self._running < self.max_concurrency and self._waiting:
+            eligible = [t for t in self._waiting if self._running_by_model[t.model] < self._cap(t.model)]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda t: (self._effective_priority(t, now), t.enqueued))
+            self._waiting.remove(ticket)
+            self._running += 1
+            self._running_by_model[ticket.model] += 1
+            ticket.granted_at = now
+            wait = now - ticket.enqueued
+            self._waits[ticket.priority].append(wait)
+            self._counts[ticket.priority]["admitted"] += 1
+            ticket._wake()
+
+    def _estimated_wait(self, priority: int, model: str) -> float:
+        """Rough queue wait for a new call: work ahead of it divided by capacity."""
+        ahead = self._running + sum(1 for t in self._waiting if t.priority <= priority)
+        free = self.max_concurrency - self._running
+        if free > 0 and self._running_by_model[model] < self._cap(model) and ahead <= self._running:
+            return 0.0
+        service = self._service_time.get(model)
+        if service is None:
+            return 0.0  # No history yet; let the deadline timer decide
+        return ahead * service / self.max_concurrency
+
+    def _enqueue(self, priority: int, model: str) -> Ticket:
+        deadline = self.deadlines[CLASS_NAMES[priority]]
+        with self._lock:
+            estimate = self._estimated_wait(priority, model)
+            if estimate > deadline:
+                self._counts[priority]["rejected"] += 1
+                raise SchedulerRejected(priority, model, estimate)
+            ticket = Ticket(priority, model, deadline)
+            self._waiting.append(ticket)
+            self._dispatch()
+            return ticket
+
+    def _expire(self, ticket: Ticket):
+        """Deadline reached: reject the ticket unless it was granted meanwhile."""
+        with self._lock:
+            if ticket.granted_at is not None:
+                return
+            self._waiting.remove(ticket)
+            ticket.rejected = True
+            self._counts[ticket.priority]["rejected"] += 1
+            self._counts[ticket.priority]["expired"] += 1
+        raise SchedulerRejected(ticket.priority, ticket.model, self.deadlines[CLASS_NAMES[ticket.priority]])
+
+    def _cancel(self, ticket: Ticket):
+        """The caller went away while queued (or right after being granted)."""
+        with self._lock:
+            if ticket.granted_at is None:
+                self._waiting.remove(ticket)
+                self._counts[ticket.priority]["cancelled"] += 1
+                return
+        self.release(ticket)
+
+    def release(self, ticket: Ticket):
+        with self._lock:
+            if ticket.released or ticket.granted_at is None:
+                return
+            ticket.released = True
+            self._running -= 1
+            self._running_by_model[ticket.model] -= 1
+            elapsed = time.monotonic() - ticket.granted_at
+            previous = self._service_time.get(ticket.model)
+            self._service_time[ticket.model] = elapsed if previous is None else 0.8 * previous + 0.2 * elapsed
+            self._dispatch()
+
+    def acquire(self, priority: int, model: str) -> Ticket:
+        """Block the calling thread until a slot is granted; raises SchedulerRejected."""
+        ticket = self._enqueue(priority, model)
+        if not ticket._event.wait(timeout=max(0.0, ticket.deadline_at - time.monotonic())):
+            self._expire(ticket)
+        return ticket
+
+    async def aacquire(self, priority: int, model: str) -> Ticket:
+        """Wait for a slot without blocking the event loop; raises SchedulerRejected."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        ticket = self._enqueue(priority, model)
+        ticket._loop, ticket._future = loop, future
+        if ticket._event.is_set():
+            return ticket
+        try:
+            await asyncio.wait_for(future, timeout=max(0.0, ticket.deadline_at - time.monotonic()))
+        except asyncio.TimeoutError:
+            self._expire(ticket)
+        except asyncio.CancelledError:
+            self._cancel(ticket)
+            raise
+        return ticket
+
+    @contextmanager
+    def slot(self, priority: int, model: str):
+        with span("ollama.queue", priority=CLASS_NAMES[priority]):
+            ticket = self.acquire(priority, model)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, priority: int, model: str):
+        with span("ollama.queue", priority=CLASS_NAMES[priority]):
+            ticket = await self.aacquire(priority, model)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        with self._lock:
+            classes = {}
+            for priority, name in CLASS_NAMES.items():
+                waits = list(self._waits[priority])
+                classes[name] = {
+                    "queued": sum(1 for t in self._waiting if t.priority == priority),
+                    "admitted": self._counts[priority]["admitted"],
+                    "rejected": self._counts[priority]["rejected"],
+                    "expired": self._counts[priority]["expired"],
+                    "cancelled": self._counts[priority]["cancelled"],
+                    "wait_p50_s": percentile(waits, 50),
+                    "wait_p95_s": percentile(waits, 95),
+                    "wait_max_s": max(waits) if waits else None,
+                    "deadline_s": self.deadlines[name],
+                }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "running": self._running,
+                "running_by_model": {m: n for m, n in self._running_by_model.items() if n},
+                "service_time_s": dict(self._service_time),
+                "classes": classes,
+            }
+
+
+ollama_scheduler = OllamaScheduler(
+    OLLAMA_MAX_CONCURRENCY, OLLAMA_MODEL_CONCURRENCY, OLLAMA_SCHED_DEADLINES, OLLAMA_SCHED_AGING_SECONDS
+)
+
+_async_client = None
+
+
+def get_async_client():
+    """
+    Shared ollama.AsyncClient (honours OLLAMA_HOST). Used for streamed
+    generations that must stop when cancelled: closing the stream makes
+    Ollama abort the generation.
+    """
+    global _async_client
+    if _async_client is None:
+        import ollama
+        _async_client = ollama.AsyncClient()
+    return _async_client
@@ -0,0 +1,119 @@
+"""
+On-demand profiling of the running API process.
+
+Two capture modes, both for a fixed number of seconds:
+
+- sample: a background thread snapshots the stack of every thread
+  (sys._current_frames) every few milliseconds. It covers the event loop
+  and all worker threads (STT/TTS, Ollama calls, the database), and its
+  overhead stays low enough for production. It returns the hottest functions
+  and, as "collapsed", stacks in the folded format that flamegraph.pl and
+  speedscope read.
+- cprofile: deterministic cProfile of the event loop thread. It gives exact
+  call counts for async request handling, but not for work in threads, and
+  it slows the loop down while it runs.
+
+Served by GET /api/system/profile when PROFILING_ENABLED=1 (see routers/system.py).
+"""
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+# If set, the profile endpoint requires it in the X-Profiling-Token header
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_MAX_SECONDS = float(os.getenv("PROFILING_MAX_SECONDS", "120"))
+
+# One capture at a time: two profilers would mostly measure each other
+_capture_lock = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """Another capture is already running."""
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005, top: int = 40) -> dict:
+    """Sample every thread's stack for the given time (blocking; run in a thread)."""
+    if not _capture_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        me = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        own = Counter()
+        total = Counter()
+        samples = stack_samples = 0
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                if not labels:
+                    continue
+                labels.reverse()
+                stacks[(names.get(ident, str(ident)),) + tuple(labels)] += 1
+                stack_samples += 1
+                own[labels[-1]] += 1
+                # A recursive function counts once per sample
+                for label in set(labels):
+                    total[label] += 1
+            samples += 1
+            time.sleep(interval)
+    finally:
+        _capture_lock.release()
+
+    def ranked(counter):
+        # percent of all thread stacks sampled
+        return [
+            {"function": label, "samples": count, "percent": round(100 * count / max(stack_samples, 1), 1)}
+            for label, count in counter.most_common(top)
+        ]
+
+    return {
+        "mode": "sample",
+        "seconds": seconds,
+        "interval_ms": interval * 1000,
+        "samples": samples,
+        # Where threads are (self) and what they are inside of (total); idle
+        # threads show up waiting in e.g. wait (threading.py) or select
+        "top_self": ranked(own),
+        "top_total": ranked(total),
+        "collapsed": "\n".join(f"{';'.join(stack)} {count}" for stack, count in stacks.most_common()),
+    }
+
+
+async def profile_event_loop(seconds: float, sort: str = "cumulative", top: int = 60) -> dict:
+    """cProfile the event loop thread for the given time."""
+    if not _capture_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+    finally:
+        _capture_lock.release()
+
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(sort).print_stats(top)
+    return {"mode": "cprofile", "seconds": seconds, "sort": sort, "stats": output.getvalue()}
@@ -0,0 +1,191 @@
+"""
+Load-adaptive quality tiers for STT, LLM and TTS.
+
+Each service has a controller that watches the latency of recent requests
+(p95 over the last QUALITY_WINDOW_SECONDS) and how much work is waiting,
+and compares them with SLO targets. Under pressure it steps down one tier
+at a time, at most every QUALITY_STEP_SECONDS. Once latency is well under
+target (below QUALITY_RECOVER_RATIO x SLO) and the queue has drained for
+QUALITY_RECOVER_SECONDS, it steps back up.
+
+    tier      STT                         LLM (chat, voice)                  TTS (voice)
+    full      beam search (beam 5)        requested model, no token cap     requested speed
+    reduced   greedy decoding             answers capped at N tokens        speech slightly faster
+    minimal   greedy + smaller Whisper    tighter cap + smaller voice model  speech slightly faster
+
+Responses say which tiers served them: X-Quality-Tier header
+("stt=full; llm=reduced"), and a "quality" field in voice chat and STT JSON.
+GET /api/system/quality shows the controllers' state.
+
+Configuration (environment variables):
+    QUALITY_ADAPTIVE            enable degradation (default 1; 0 keeps everything at full)
+    QUALITY_SLO_MS              p95 latency targets: STT transcription, LLM time to first token,
+                                TTS per sentence, e.g. "stt=4000,llm=3000,tts=1500"
+    QUALITY_MAX_PENDING         work in flight/queued that counts as overload, e.g. "stt=4,llm=4,tts=4"
+    QUALITY_MAX_TOKENS          LLM answer caps per tier, e.g. "reduced=384,minimal=160"
+    QUALITY_STT_MINIMAL_MODEL   Whisper size for the minimal tier (e.g. "tiny"; empty: keep the model)
+    QUALITY_VOICE_MINIMAL_MODEL Ollama model for voice chat in the minimal tier (empty: keep the model)
+    QUALITY_TTS_SPEED_FACTOR    speech speed multiplier below full quality
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+from ollama_scheduler import parse_map, percentile, ollama_scheduler
+
+FULL, REDUCED, MINIMAL = 0, 1, 2
+TIER_NAMES = {FULL: "full", REDUCED: "reduced", MINIMAL: "minimal"}
+
+QUALITY_ADAPTIVE = os.getenv("QUALITY_ADAPTIVE", "1") == "1"
+QUALITY_SLO_MS = {"stt": 4000.0, "llm": 3000.0, "tts": 1500.0, **parse_map(os.getenv("QUALITY_SLO_MS", ""), float)}
+QUALITY_MAX_PENDING = {"stt": 4, "llm": 4, "tts": 4, **parse_map(os.getenv("QUALITY_MAX_PENDING", ""), int)}
+QUALITY_MAX_TOKENS = {"reduced": 384, "minimal": 160, **parse_map(os.getenv("QUALITY_MAX_TOKENS", ""), int)}
+QUALITY_STT_MINIMAL_MODEL = os.getenv("QUALITY_STT_MINIMAL_MODEL", "")
+QUALITY_VOICE_MINIMAL_MODEL = os.getenv("QUALITY_VOICE_MINIMAL_MODEL", "")
+QUALITY_TTS_SPEED_FACTOR = float(os.getenv("QUALITY_TTS_SPEED_FACTOR", "1.1"))
+QUALITY_WINDOW_SECONDS = float(os.getenv("QUALITY_WINDOW_SECONDS", "60"))
+QUALITY_STEP_SECONDS = float(os.getenv("QUALITY_STEP_SECONDS", "10"))
+QUALITY_RECOVER_SECONDS = float(os.getenv("QUALITY_RECOVER_SECONDS", "30"))
+QUALITY_RECOVER_RATIO = float(os.getenv("QUALITY_RECOVER_RATIO", "0.6"))
+# Latency samples needed before p95 counts (the queue signal works from the first request)
+QUALITY_MIN_SAMPLES = int(os.getenv("QUALITY_MIN_SAMPLES", "5"))
+STT_BEAM_SIZE = 5
+
+
+class QualityController:
+    def __init__(self, name: str, slo_ms: float, max_pending: int, queued: Optional[Callable[[], int]] = None):
+        self.name = name
+        self.slo_ms = slo_ms
+        self.max_pending = max_pending
+        self._queued = queued
+        self._tier = FULL
+        self._changed_at = time.monotonic()
+        self._calm_since = None
+        self._samples = deque()
+        self._in_flight = 0
+        self._served = {name: 0 for name in TIER_NAMES.values()}
+        self._lock = threading.Lock()
+
+    def observe(self, latency_ms: float):
+        with self._lock:
+            self._samples.append((time.monotonic(), latency_ms))
+
+    @contextmanager
+    def track(self):
+        """Count the work as in flight and record its latency."""
+        with self._lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+            self.observe((time.perf_counter() - start) * 1000)
+
+    def _pending(self) -> int:
+        return self._in_flight + (self._queued() if self._queued else 0)
+
+    def _p95(self, now: float) -> Optional[float]:
+        # Only samples since the last tier change: older ones were served by another tier
+        horizon = max(now - QUALITY_WINDOW_SECONDS, self._changed_at)
+        while self._samples and self._samples[0][0] < now - QUALITY_WINDOW_SECONDS:
+            self._samples.popleft()
+        recent = [latency for at, latency in self._samples if at >= horizon]
+        return percentile(recent, 95) if len(recent) >= QUALITY_MIN_SAMPLES else None
+
+    def tier(self) -> int:
+        """Current tier, re-evaluated against the SLO; counts the request as served by it."""
+        if not QUALITY_ADAPTIVE:
+            return FULL
+        pending = self._pending()
+        with self._lock:
+            now = time.monotonic()
+            p95 = self._p95(now)
+            overloaded = pending > self.max_pending or (p95 is not None and p95 > self.slo_ms)
+            calm = pending <= self.max_pending // 2 and (p95 is None or p95 < self.slo_ms * QUALITY_RECOVER_RATIO)
+            self._calm_since = (self._calm_since or now) if calm else None
+            if overloaded and self._tier < MINIMAL and now - self._changed_at >= QUALITY_STEP_SECONDS:
+                self._set_tier(self._tier + 1, now, p95, pending)
+            elif (
+                self._calm_since is not None and self._tier > FULL
+                and now - max(self._calm_since, self._changed_at) >= QUALITY_RECOVER_SECONDS
+            ):
+                self._set_tier(self._tier - 1, now, p95, pending)
+            self._served[TIER_NAMES[self._tier]] += 1
+            return self._tier
+
+    def _set_tier(self, tier: int, now: float, p95: Optional[float], pending: int):
+        print(
+            f"Quality {self.name}: {TIER_NAMES[self._tier]} -> {TIER_NAMES[tier]} "
+            f"(p95 {p95 if p95 is None else round(p95)} ms, SLO {self.slo_ms:.0f} ms, pending {pending})"
+        )
+        self._tier = tier
+        self._changed_at = now
+
+    def stats(self) -> dict:
+        pending = self._pending()
+        with self._lock:
+            p95 = self._p95(time.monotonic())
+            return {
+                "tier": TIER_NAMES[self._tier],
+                "p95_ms": None if p95 is None else round(p95, 1),
+                "slo_ms": self.slo_ms,
+                "pending": pending,
+                "max_pending": self.max_pending,
+                "seconds_in_tier": round(time.monotonic() - self._changed_at, 1),
+                "served": dict(self._served),
+            }
+
+
+def _queued_llm() -> int:
+    # Interactive calls waiting for an Ollama slot
+    classes = ollama_scheduler.stats()["classes"]
+    return classes["voice"]["queued"] + classes["chat"]["queued"]
+
+
+stt_quality = QualityController("stt", QUALITY_SLO_MS["stt"], QUALITY_MAX_PENDING["stt"])
+llm_quality = QualityController("llm", QUALITY_SLO_MS["llm"], QUALITY_MAX_PENDING["llm"], queued=_queued_llm)
+tts_quality = QualityController("tts", QUALITY_SLO_MS["tts"], QUALITY_MAX_PENDING["tts"])
+CONTROLLERS = (stt_quality, llm_quality, tts_quality)
+
+
+def stt_settings():
+    """(tier, transcribe() keyword arguments)."""
+    tier = stt_quality.tier()
+    settings = {"beam_size": STT_BEAM_SIZE if tier == FULL else 1}
+    if tier == MINIMAL and QUALITY_STT_MINIMAL_MODEL:
+        settings["model_size"] = QUALITY_STT_MINIMAL_MODEL
+    return tier, settings
+
+
+def llm_settings(model: str, voice: bool = False):
+    """(tier, model, Ollama options) for a chat or voice answer."""
+    tier = llm_quality.tier()
+    options = {} if tier == FULL else {"num_predict": QUALITY_MAX_TOKENS[TIER_NAMES[tier]]}
+    if voice and tier == MINIMAL and QUALITY_VOICE_MINIMAL_MODEL:
+        model = QUALITY_VOICE_MINIMAL_MODEL
+    return tier, model, options
+
+
+def tts_speed(speed: float):
+    """(tier, speech speed) for voice chat answers."""
+    tier = tts_quality.tier()
+    return tier, speed if tier == FULL else speed * QUALITY_TTS_SPEED_FACTOR
+
+
+def report(**tiers) -> dict:
+    """{"stt": "full", ...} for the tiers that served a request."""
+    return {service: TIER_NAMES[tier] for service, tier in tiers.items()}
+
+
+def header(**tiers) -> str:
+    """X-Quality-Tier value, e.g. "stt=full; llm=reduced"."""
+    return "; ".join(f"{service}={name}" for service, name in report(**tiers).items())
+
+
+def stats() -> dict:
+    return {"adaptive": QUALITY_ADAPTIVE, **{controller.name: controller.stats() for controller in CONTROLLERS}}
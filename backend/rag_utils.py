@@ -1,126 +1,456 @@
 """
 RAG Utilities for Document Processing and Vector Storage
-Uses ChromaDB for vector storage and Ollama for embeddings
+Uses ChromaDB for vector storage and Ollama (or an in-process model, see
+embedding_backends.py) for embeddings
 """
+import hashlib
 import os
+import re
 import shutil
+import threading
 import uuid
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Union
 from fastapi import UploadFile
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
-import chromadb
-from chromadb.config import Settings
-
-# Initialize ChromaDB client
-CHROMA_DB_PATH = os.path.join(os.path.dirname(__file__), "chroma_db")
-os.makedirs(CHROMA_DB_PATH, exist_ok=True)
-
-chroma_client = chromadb.PersistentClient(
-    path=CHROMA_DB_PATH,
-    settings=Settings(anonymized_telemetry=False)
+from tracing import span
+from embedding_backends import (
+    get_embedding_backend, backend_for_new_collection, EmbeddingBackend, LEGACY_BACKEND, RAG_EMBEDDING_BACKEND
 )
 
-# Initialize embeddings with Ollama
-# Make sure you have pulled an embedding model: ollama pull nomic-embed-text
-embeddings = OllamaEmbeddings(model="nomic-embed-text", base_url="http://localhost:11434")
+# ChromaDB, LangChain and the embeddings client are expensive to import and
+# initialize, so they are created on first use (or by the startup warm-up in
+# main.py) instead of at import time.
+CHROMA_DB_PATH = os.getenv("CHROMA_DB_PATH", os.path.join(os.path.dirname(__file__), "chroma_db"))
+# chroma, or numpy for the memory-mapped exact-search store in numpy_store.py
+RAG_VECTOR_STORE = os.getenv("RAG_VECTOR_STORE", "chroma")
+NUMPY_STORE_PATH = os.getenv("NUMPY_STORE_PATH", os.path.join(os.path.dirname(__file__), "numpy_store_data"))
+# Chunks embedded and written per batch during ingestion
+RAG_INGEST_BATCH_SIZE = int(os.getenv("RAG_INGEST_BATCH_SIZE", "32"))
+# Characters read per block from text files
+TEXT_BLOCK_CHARS = 64 * 1024
+SUPPORTED_EXTENSIONS = (".pdf", ".txt", ".md")
+# Infix of a new version's file until it replaces the current one
+STAGED_MARKER = ".staged"
 
-# Initialize or get collection
-collection = chroma_client.get_or_create_collection(
-    name="documents",
-    metadata={"hnsw:space": "cosine"}
-)
+# How chunks are spread over Chroma collections:
+#   single     one "documents" collection, documents separated by a doc_id filter
+#   document   one collection per document; deleting a document drops its collection
+#   namespace  one collection per namespace given at upload (default namespace otherwise)
+RAG_SHARDING = os.getenv("RAG_SHARDING", "single")
+RAG_DEFAULT_NAMESPACE = os.getenv("RAG_DEFAULT_NAMESPACE", "default")
+# Threads used to query shards in parallel for searches across all documents
+RAG_SHARD_QUERY_WORKERS = int(os.getenv("RAG_SHARD_QUERY_WORKERS", "8"))
+DEFAULT_COLLECTION = "documents"
+DOCUMENT_SHARD_PREFIX = "doc_"
+NAMESPACE_SHARD_PREFIX = "ns_"
+_NAMESPACE_PATTERN = re.compile(r"^[A-Za-z0-9](?:[A-Za-z0-9_-]{0,56}[A-Za-z0-9])?$")
 
+_chroma_client = None
+_numpy_store = None
+_collections = {}
+_shard_pool = None
+_init_lock = threading.Lock()
 
-async def process_document(file: UploadFile) -> tuple[str, List[str]]:
-    """
-    Process uploaded document: save to disk, load, and split into chunks.
-    Returns (document_id, list of text chunks)
-    """
-    # Save file temporarily
-    doc_id = str(uuid.uuid4())
-    file_ext = os.path.splitext(file.filename)[1].lower()
-    temp_path = os.path.join("static", f"doc_{doc_id}{file_ext}")
-    
-    with open(temp_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-    
-    # Load document based on type
-    if file_ext == ".pdf":
-        loader = PyPDFLoader(temp_path)
-    elif file_ext in [".txt", ".md"]:
-        loader = TextLoader(temp_path)
-    else:
-        raise ValueError(f"Unsupported file type: {file_ext}")
-    
-    documents = loader.load()
-    
-    # Split into chunks
-    text_splitter = RecursiveCharacterTextSplitter(
+
+def get_chroma_client():
+    global _chroma_client
+    if _chroma_client is None:
+        with _init_lock:
+            if _chroma_client is None:
+                import chromadb
+                from chromadb.config import Settings
+                os.makedirs(CHROMA_DB_PATH, exist_ok=True)
+                _chroma_client = chromadb.PersistentClient(
+                    path=CHROMA_DB_PATH,
+                    settings=Settings(anonymized_telemetry=False)
+                )
+    return _chroma_client
+
+
+def get_vector_client():
+    """Chroma client, or the NumPy store when RAG_VECTOR_STORE=numpy (same collection API)."""
+    global _numpy_store
+    if RAG_VECTOR_STORE != "numpy":
+        return get_chroma_client()
+    if _numpy_store is None:
+        with _init_lock:
+            if _numpy_store is None:
+                from numpy_store import NumpyVectorStore
+                _numpy_store = NumpyVectorStore(NUMPY_STORE_PATH)
+    return _numpy_store
+
+
+def get_collection(name: str = DEFAULT_COLLECTION):
+    collection = _collections.get(name)
+    if collection is None:
+        client = get_vector_client()
+        with _init_lock:
+            collection = _collections.get(name)
+            if collection is None:
+                # The backend is only recorded when the collection is created;
+                # an existing collection keeps the one its chunks were embedded with
+                collection = client.get_or_create_collection(
+                    name=name,
+                    metadata={"hnsw:space": "cosine", "embedding_backend": backend_for_new_collection(name)}
+                )
+                _collections[name] = collection
+    return collection
+
+
+def shard_for(doc_id: str, namespace: str = None) -> str:
+    """Collection that a new document is stored in under the configured sharding strategy."""
+    if RAG_SHARDING == "document":
+        return f"{DOCUMENT_SHARD_PREFIX}{doc_id}"
+    if RAG_SHARDING == "namespace":
+        namespace = namespace or RAG_DEFAULT_NAMESPACE
+        if not _NAMESPACE_PATTERN.match(namespace):
+            raise ValueError(
+                "Namespace must be 1-58 letters, digits, '_' or '-', starting and ending with a letter or digit"
+            )
+        return f"{NAMESPACE_SHARD_PREFIX}{namespace}"
+    return DEFAULT_COLLECTION
+
+
+def list_shards() -> List[str]:
+    """All collections holding RAG chunks, whatever strategy they were written with."""
+    names = get_vector_client().list_collections()
+    # Chroma < 0.6 returns Collection objects instead of names
+    names = [n if isinstance(n, str) else n.name for n in names]
+    return [
+        n for n in names
+        if n == DEFAULT_COLLECTION or n.startswith((DOCUMENT_SHARD_PREFIX, NAMESPACE_SHARD_PREFIX))
+    ]
+
+
+def _get_shard_pool():
+    global _shard_pool
+    if _shard_pool is None:
+        with _init_lock:
+            if _shard_pool is None:
+                from concurrent.futures import ThreadPoolExecutor
+                _shard_pool = ThreadPoolExecutor(max_workers=RAG_SHARD_QUERY_WORKERS, thread_name_prefix="rag-shard")
+    return _shard_pool
+
+
+def get_embeddings() -> EmbeddingBackend:
+    """Embedding backend used for new collections."""
+    return get_embedding_backend(RAG_EMBEDDING_BACKEND)
+
+
+def collection_backend(name: str) -> str:
+    """Name of the embedding backend a collection's chunks were embedded with."""
+    return (get_collection(name).metadata or {}).get("embedding_backend", LEGACY_BACKEND)
+
+
+def collection_embeddings(name: str) -> EmbeddingBackend:
+    return get_embedding_backend(collection_backend(name))
+
+
+def _text_splitter():
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=200,
         length_function=len
     )
-    chunks = text_splitter.split_documents(documents)
-    
-    # Extract text from chunks
-    texts = [doc.page_content for doc in chunks]
-    
-    return doc_id, texts
 
 
-def add_to_vectorstore(doc_id: str, texts: List[str], metadata: dict = None):
+async def save_upload(file: UploadFile, doc_id: str = None, staged: bool = False) -> tuple[str, str]:
+    """
+    Save an uploaded document to disk (streamed, not read into memory).
+    Pass doc_id when re-uploading a new version of an existing document, with
+    staged=True to keep it beside the current file until install_upload().
+    Returns (document_id, path)
+    """
+    doc_id = doc_id or str(uuid.uuid4())
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in SUPPORTED_EXTENSIONS:
+        raise ValueError(f"Unsupported file type: {file_ext}")
+    path = os.path.join("static", f"doc_{doc_id}{STAGED_MARKER if staged else ''}{file_ext}")
+
+    with open(path, "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+    return doc_id, path
+
+
+def install_upload(doc_id: str, staged_path: str) -> str:
+    """Make a staged upload the document's file, replacing earlier versions. Returns its path."""
+    path = staged_path.replace(STAGED_MARKER, "", 1)
+    os.replace(staged_path, path)
+    remove_previous_uploads(doc_id, path)
+    return path
+
+
+def discard_upload(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def remove_previous_uploads(doc_id: str, keep: str):
+    """Delete files of earlier versions of a document saved with another extension."""
+    for file_ext in SUPPORTED_EXTENSIONS:
+        path = os.path.join("static", f"doc_{doc_id}{file_ext}")
+        if path != keep and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                print(f"Warning: Could not remove previous upload {path}: {e}")
+
+
+def _iter_pdf_pages(path: str) -> Iterator[str]:
+    import pypdf
+    # PdfReader parses pages on access, so only one page's text is held at a time
+    reader = pypdf.PdfReader(path)
+    for page in reader.pages:
+        yield page.extract_text()
+
+
+def _iter_text_blocks(path: str) -> Iterator[str]:
+    with open(path, encoding="utf-8", errors="replace") as f:
+        while True:
+            block = f.read(TEXT_BLOCK_CHARS)
+            if not block:
+                break
+            yield block
+
+
+def iter_document_chunks(path: str) -> Iterator[str]:
     """
-    Embed text chunks and add to ChromaDB.
+    Yield text chunks of a saved document as it is parsed. PDF pages are split
+    one at a time (like the splitter does for whole documents); text files are
+    read in blocks, carrying the unfinished last chunk of each block into the
+    next, so memory use does not grow with the file size.
     """
-    if not texts:
+    splitter = _text_splitter()
+    file_ext = os.path.splitext(path)[1].lower()
+
+    if file_ext == ".pdf":
+        for page_text in _iter_pdf_pages(path):
+            yield from splitter.split_text(page_text)
         return
-    
-    # Generate embeddings
-    embedded_texts = embeddings.embed_documents(texts)
-    
-    # Prepare metadata
-    metadatas = [{"doc_id": doc_id, **(metadata or {})} for _ in texts]
-    ids = [f"{doc_id}_{i}" for i in range(len(texts))]
-    
-    # Add to collection
-    collection.add(
-        embeddings=embedded_texts,
-        documents=texts,
-        metadatas=metadatas,
-        ids=ids
-    )
+
+    carry = ""
+    for block in _iter_text_blocks(path):
+        chunks = splitter.split_text(carry + block)
+        if not chunks:
+            continue
+        yield from chunks[:-1]
+        carry = chunks[-1]
+    if carry:
+        yield carry
+
+
+def chunk_ids(doc_id: str, texts: List[str], seen: dict = None) -> List[str]:
+    """
+    Content-addressed chunk IDs: the same text in the same document always gets
+    the same ID, so a re-upload can tell unchanged chunks from edited ones.
+    Repeated identical chunks get an occurrence suffix; pass the same `seen`
+    dict when assigning IDs batch by batch.
+    """
+    ids = []
+    seen = {} if seen is None else seen
+    for text in texts:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+        occurrence = seen.get(digest, 0)
+        seen[digest] = occurrence + 1
+        ids.append(f"{doc_id}_{digest}" if occurrence == 0 else f"{doc_id}_{digest}_{occurrence}")
+    return ids
 
 
-def query_vectorstore(query: str, n_results: int = 3, doc_id: str = None) -> List[str]:
+def update_vectorstore(
+    doc_id: str,
+    chunks: Iterable[str],
+    metadata: dict = None,
+    batch_size: int = None,
+    collection_name: str = DEFAULT_COLLECTION,
+) -> dict:
     """
-    Query the vectorstore and return relevant context chunks.
-    If doc_id is provided, filter results to that document only.
+    Bring the stored chunks of doc_id in line with a (new version of a) document.
+
+    Chunks are consumed lazily in batches of batch_size: each batch is embedded
+    and written before the next one is read, so memory stays bounded and the
+    first chunks are searchable while the rest is still being parsed. Only
+    chunks whose text is new are embedded; unchanged ones are kept (only their
+    metadata is updated if they moved) and chunks that no longer occur are
+    deleted at the end. Returns counts of added, removed and kept chunks.
+    If anything fails, the chunks added so far are deleted and moved ones get
+    their metadata back, leaving the previous version as it was.
     """
-    # Embed query
-    query_embedding = embeddings.embed_query(query)
-    
-    # Query parameters
+    collection = get_collection(collection_name)
+    embeddings = collection_embeddings(collection_name)
+    batch_size = batch_size or RAG_INGEST_BATCH_SIZE
+    stored = collection.get(where={"doc_id": doc_id}, include=["metadatas"])
+    stored_metadata = {chunk_id: meta or {} for chunk_id, meta in zip(stored["ids"], stored["metadatas"])}
+
+    def chunk_metadata(i):
+        return {"doc_id": doc_id, "chunk_index": i, **(metadata or {})}
+
+    seen_digests, seen_ids = {}, set()
+    counts = {"added": 0, "removed": 0, "kept": 0}
+    added_ids, moved_ids = [], []
+
+    def write_batch(start, texts):
+        ids = chunk_ids(doc_id, texts, seen_digests)
+        seen_ids.update(ids)
+        added = [j for j, chunk_id in enumerate(ids) if chunk_id not in stored_metadata]
+        # Kept chunks whose position (or e.g. filename) changed
+        moved = [
+            j for j, chunk_id in enumerate(ids)
+            if chunk_id in stored_metadata and stored_metadata[chunk_id] != chunk_metadata(start + j)
+        ]
+        if added:
+            added_texts = [texts[j] for j in added]
+            with span("embed", chunks=len(added_texts)):
+                added_embeddings = embeddings.embed_documents(added_texts)
+            with span("vectorstore.add", chunks=len(added_texts)):
+                added_ids.extend(ids[j] for j in added)
+                collection.add(
+                    embeddings=added_embeddings,
+                    documents=added_texts,
+                    metadatas=[chunk_metadata(start + j) for j in added],
+                    ids=[ids[j] for j in added]
+                )
+        if moved:
+            # Metadata-only update, no re-embedding
+            moved_ids.extend(ids[j] for j in moved)
+            collection.update(ids=[ids[j] for j in moved], metadatas=[chunk_metadata(start + j) for j in moved])
+        counts["added"] += len(added)
+        counts["kept"] += len(ids) - len(added)
+
+    batch, start = [], 0
+    try:
+        for text in chunks:
+            batch.append(text)
+            if len(batch) >= batch_size:
+                write_batch(start, batch)
+                start += len(batch)
+                batch = []
+        if batch:
+            write_batch(start, batch)
+    except BaseException:
+        _undo_update(collection, added_ids, {chunk_id: stored_metadata[chunk_id] for chunk_id in moved_ids})
+        raise
+
+    removed = [chunk_id for chunk_id in stored_metadata if chunk_id not in seen_ids]
+    if removed:
+        collection.delete(ids=removed)
+    counts["removed"] = len(removed)
+    return counts
+
+
+def _undo_update(collection, added_ids: List[str], moved_metadata: Dict[str, dict]):
+    try:
+        if added_ids:
+            collection.delete(ids=added_ids)
+        if moved_metadata:
+            collection.update(ids=list(moved_metadata), metadatas=list(moved_metadata.values()))
+    except Exception as e:
+        print(f"Warning: Could not roll back a failed vector store update: {e}")
+
+
+def embed_query(query: str, backend: str = None) -> List[float]:
+    return get_embedding_backend(backend or RAG_EMBEDDING_BACKEND).embed_query(query)
+
+
+def embed_query_for(query: str, collections: List[str], known: Dict[str, List[float]] = None) -> Dict[str, List[float]]:
+    """
+    Query embeddings keyed by backend name, one for every backend used by the
+    given collections. Pass already computed embeddings in `known`.
+    """
+    embeddings = dict(known or {})
+    for backend in {collection_backend(name) for name in collections}:
+        if backend not in embeddings:
+            embeddings[backend] = embed_query(query, backend)
+    return embeddings
+
+
+def _query_shard(
+    collection_name: str,
+    query_embedding: Union[List[float], Dict[str, List[float]]],
+    n_results: int,
+    doc_id: str = None,
+    namespace: str = None,
+) -> List[dict]:
+    if isinstance(query_embedding, dict):
+        query_embedding = query_embedding[collection_backend(collection_name)]
     query_params = {
         "query_embeddings": [query_embedding],
-        "n_results": n_results
+        "n_results": n_results,
+        "include": ["documents", "metadatas", "distances", "embeddings"],
     }
-    
-    # Add filter if doc_id specified
-    if doc_id:
-        query_params["where"] = {"doc_id": doc_id}
-    
-    results = collection.query(**query_params)
-    
-    # Extract documents
-    if results and results["documents"]:
-        return results["documents"][0]  # Returns list of relevant texts
-    return []
-
-
-def delete_document(doc_id: str):
+    # A dedicated shard holds nothing else, so it needs no metadata filter
+    filters = []
+    if doc_id and collection_name != f"{DOCUMENT_SHARD_PREFIX}{doc_id}":
+        filters.append({"doc_id": doc_id})
+    if namespace and collection_name != f"{NAMESPACE_SHARD_PREFIX}{namespace}":
+        filters.append({"namespace": namespace})
+    if filters:
+        query_params["where"] = filters[0] if len(filters) == 1 else {"$and": filters}
+
+    results = get_collection(collection_name).query(**query_params)
+    if not results or not results["documents"]:
+        return []
+
+    return [
+        {
+            "id": chunk_id,
+            "text": text,
+            "metadata": metadata or {},
+            # Collection uses cosine distance, so similarity = 1 - distance
+            "score": 1.0 - distance,
+            "embedding": embedding,
+        }
+        for chunk_id, text, metadata, distance, embedding in zip(
+            results["ids"][0],
+            results["documents"][0],
+            results["metadatas"][0],
+            results["distances"][0],
+            results["embeddings"][0],
+        )
+    ]
+
+
+def retrieve_candidates(
+    query_embedding: Union[List[float], Dict[str, List[float]]],
+    n_results: int = 12,
+    doc_id: str = None,
+    collections: List[str] = None,
+    namespace: str = None,
+) -> List[dict]:
+    """
+    Retrieve candidate chunks with everything the context packer needs:
+    text, metadata, cosine similarity to the query and the chunk embedding.
+    Searches the given collections (all shards by default) in parallel and
+    returns the best n_results overall. When collections use different
+    embedding backends, pass query embeddings keyed by backend (embed_query_for).
+    """
+    collections = collections if collections is not None else list_shards()
+    if not collections:
+        return []
+    if len(collections) == 1:
+        return _query_shard(collections[0], query_embedding, n_results, doc_id, namespace)
+
+    pool = _get_shard_pool()
+    futures = [
+        pool.submit(_query_shard, name, query_embedding, n_results, doc_id, namespace)
+        for name in collections
+    ]
+    candidates = [candidate for future in futures for candidate in future.result()]
+    candidates.sort(key=lambda c: -c["score"])
+    return candidates[:n_results]
+
+
+def delete_document(doc_id: str, collection_name: str = DEFAULT_COLLECTION):
     """
     Delete all chunks associated with a document from the vectorstore.
+    A per-document shard is dropped as a whole.
     """
-    collection.delete(where={"doc_id": doc_id})
+    if collection_name == f"{DOCUMENT_SHARD_PREFIX}{doc_id}":
+        _collections.pop(collection_name, None)
+        try:
+            get_vector_client().delete_collection(collection_name)
+        except ValueError:
+            pass  # Already gone
+        return
+    get_collection(collection_name).delete(where={"doc_id": doc_id})
@@ -1,30 +1,61 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-import ollama
 from typing import List, Optional
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import ChatSession, ChatMessage
 import json
 from fastapi.responses import StreamingResponse
+from ollama_scheduler import ollama_scheduler, get_async_client, CHAT
+from model_catalog import model_catalog
+import cancellation
+from cancellation import Interrupted, cancellable
+import asyncio
+import time
+from database import AsyncSessionLocal
+from tracing import span
+import quality
 
 router = APIRouter()
+# Saves of interrupted answers, which must outlive the cancelled stream
+_pending_saves = set()
+
+
+class _SlotStreamingResponse(StreamingResponse):
+    """Calls release() however the response ends, even if the body never starts."""
+
+    def __init__(self, content, release, **kwargs):
+        super().__init__(content, **kwargs)
+        self._release = release
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self._release()
+
+
+async def _save_reply(session_id: int, content: str, status: str):
+    async with AsyncSessionLocal() as db:
+        db.add(ChatMessage(session_id=session_id, role="assistant", content=content, status=status))
+        await db.commit()
 
 class Message(BaseModel):
     role: str
     content: str
 
 class ChatRequest(BaseModel):
-    model: str
+    model: Optional[str] = None  # Default: a resident chat-capable model
     messages: List[Message]
     session_id: Optional[int] = None
 
 @router.post("/chat")
-async def chat(request: ChatRequest, db: Session = Depends(get_db)):
+async def chat(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
     try:
         # 1. Handle Session
         if request.session_id:
-            session = db.query(ChatSession).filter(ChatSession.id == request.session_id).first()
+            session = await db.get(ChatSession, request.session_id)
             if not session:
                 raise HTTPException(status_code=404, detail="Session not found")
         else:
@@ -36,82 +67,140 @@ async def chat(request: ChatRequest, db: Session = Depends(get_db)):
             
             session = ChatSession(title=title)
             db.add(session)
-            db.commit()
-            db.refresh(session)
+            await db.flush()  # Assigns session.id; committed with the user message
         
         # 2. Save User Message
         user_msg_content = request.messages[-1].content
         user_message = ChatMessage(session_id=session.id, role="user", content=user_msg_content)
         db.add(user_message)
-        db.commit()
+        with span("db.commit"):
+            await db.commit()
 
-        # 3. Stream Response & Save AI Message
-        async def generate():
-            full_response = ""
-            
-            # Send session_id first as a special event or metadata? 
-            # Ideally clients should handle this, but for simplicity we'll just stream text 
-            # and clients refresh the list. 
-            # Actually, let's yield the session_id as the first chunk if it is a new session
-            if not request.session_id:
-                yield json.dumps({"session_id": session.id}) + "\n"
-
-            stream = ollama.chat(
-                model=request.model, 
+        # The request's DB session is closed by the time the stream runs,
+        # so keep the plain id around and save the answer with a new one.
+        session_id = session.id
+        model = request.model or model_catalog.default_model("chat")
+        # Shorter answers when the LLM is behind its latency target (see quality.py)
+        llm_tier, model, llm_options = quality.llm_settings(model)
+        started = time.perf_counter()
+
+        # Wait for an Ollama slot before answering, so an overloaded server
+        # yields a 503 instead of a stream that never starts
+        with span("ollama.queue", priority="chat"):
+            ticket = await ollama_scheduler.aacquire(CHAT, model)
+
+        token = None
+
+        def release():
+            # Idempotent: runs when generate() ends and again when the response
+            # is done, which covers a client gone before the body started
+            ollama_scheduler.release(ticket)
+            if token is not None:
+                cancellation.unregister(token)
+
+        async def ollama_stream():
+            stream = await get_async_client().chat(
+                model=model, 
                 messages=[msg.dict() for msg in request.messages], 
+                options=llm_options or None,
                 stream=True
             )
-            
-            for chunk in stream:
+            async for chunk in stream:
                 if "message" in chunk and "content" in chunk["message"]:
-                    content = chunk["message"]["content"]
-                    full_response += content
-                    yield content
+                    yield chunk["message"]["content"]
 
-            # Save Assistant Message after stream completes
-            ai_message = ChatMessage(session_id=session.id, role="assistant", content=full_response)
-            db.add(ai_message)
-            db.commit()
+        # 3. Stream Response & Save AI Message
+        async def generate():
+            nonlocal started
+            full_response = ""
+            status = None
+            try:
+                # Send session_id first as a special event or metadata? 
+                # Ideally clients should handle this, but for simplicity we'll just stream text 
+                # and clients refresh the list. 
+                # Actually, let's yield the session_id as the first chunk if it is a new session
+                if not request.session_id:
+                    yield json.dumps({"session_id": session_id}) + "\n"
+
+                with span("llm", model=model):
+                    async for content in cancellable(token, ollama_stream()):
+                        if started is not None:
+                            # Time to first token, queue wait included
+                            quality.llm_quality.observe((time.perf_counter() - started) * 1000)
+                            started = None
+                        full_response += content
+                        yield content
+                status = "complete"
+            except Interrupted:
+                status = "interrupted"
+            except (asyncio.CancelledError, GeneratorExit):
+                # Client disconnected: this generator can't await anymore,
+                # so the partial answer is saved by a separate task
+                status = None
+                saving = asyncio.ensure_future(_save_reply(session_id, full_response, "interrupted"))
+                _pending_saves.add(saving)
+                saving.add_done_callback(_pending_saves.discard)
+                raise
+            finally:
+                release()
+
+            # Save Assistant Message (the partial answer if interrupted)
+            with span("db.commit"):
+                await _save_reply(session_id, full_response, status)
 
-        return StreamingResponse(generate(), media_type="text/plain")
+        try:
+            # A newer request on the same session, POST .../cancel or the client
+            # disconnecting stops the generation in Ollama
+            token = cancellation.register(("chat", session_id))
+            return _SlotStreamingResponse(
+                generate(), release, media_type="text/plain", headers={"X-Quality-Tier": quality.header(llm=llm_tier)}
+            )
+        except BaseException:
+            release()
+            raise
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/chat/sessions/{session_id}/cancel")
+async def cancel_chat(session_id: int):
+    """Stop the answer currently being generated for this session."""
+    if not cancellation.cancel(("chat", session_id)):
+        raise HTTPException(status_code=404, detail="No answer in progress")
+    return {"status": "cancelled"}
+
 @router.get("/chat/sessions")
-async def list_sessions(db: Session = Depends(get_db)):
-    sessions = db.query(ChatSession).order_by(ChatSession.created_at.desc()).all()
+async def list_sessions(db: AsyncSession = Depends(get_async_db)):
+    sessions = (await db.scalars(select(ChatSession).order_by(ChatSession.created_at.desc()))).all()
     return sessions
 
 @router.get("/chat/sessions/{session_id}")
-async def get_session_history(session_id: int, db: Session = Depends(get_db)):
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+async def get_session_history(session_id: int, db: AsyncSession = Depends(get_async_db)):
+    session = await db.get(ChatSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    messages = db.query(ChatMessage).filter(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at.asc()).all()
+    messages = (await db.scalars(
+        select(ChatMessage).where(ChatMessage.session_id == session_id).order_by(ChatMessage.created_at.asc())
+    )).all()
     return {"session": session, "messages": messages}
 
 @router.delete("/chat/sessions/{session_id}")
-async def delete_session(session_id: int, db: Session = Depends(get_db)):
-    session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
+async def delete_session(session_id: int, db: AsyncSession = Depends(get_async_db)):
+    session = await db.get(ChatSession, session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
-    db.delete(session)
-    db.commit()
+    await db.delete(session)
+    await db.commit()
     return {"status": "success"}
 
 @router.get("/models")
 async def list_models():
+    """Chat-capable models (embedding-only models excluded), from the cached catalog."""
     try:
-        models = ollama.list()
-        # Filter out embedding-only models (they don't support chat)
-        embedding_models = {'nomic-embed-text', 'all-minilm', 'mxbai-embed-large'}
-        if models and 'models' in models:
-            models['models'] = [
-                m for m in models['models'] 
-                if not any(embed_name in m.get('model', '').lower() for embed_name in embedding_models)
-            ]
-        return models
+        models = await asyncio.to_thread(model_catalog.models, "chat")
+        return {"models": models, "default": model_catalog.default_model("chat")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
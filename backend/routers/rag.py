@@ -1,50 +1,112 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
 from pydantic import BaseModel
+import asyncio
 import ollama
 from typing import Optional
-from sqlalchemy.orm import Session
-from database import get_db
-from rag_utils import process_document, add_to_vectorstore, query_vectorstore, delete_document
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, AsyncSessionLocal
+from models import RAGDocument, RAGCacheGeneration
+import uuid
+from fastapi.concurrency import run_in_threadpool
+from rag_utils import (
+    save_upload, install_upload, discard_upload, iter_document_chunks, update_vectorstore, embed_query, embed_query_for,
+    retrieve_candidates, delete_document, list_shards, shard_for, DEFAULT_COLLECTION, RAG_SHARDING, RAG_DEFAULT_NAMESPACE
+)
+from embedding_backends import RAG_EMBEDDING_BACKEND
+from ollama_scheduler import ollama_scheduler, RAG
+from model_catalog import model_catalog
+from context_packer import pack_context, RAG_CANDIDATES
+from semantic_cache import rag_answer_cache, namespace_scope, generation_key, generation_keys, RAG_CACHE_ENABLED
+from tracing import span
 
 router = APIRouter()
 
-# Store document metadata (in-memory for now, could be DB)
-uploaded_documents = {}
-
 
 class RAGChatRequest(BaseModel):
     message: str
     doc_id: Optional[str] = None
-    model: str = "llama3.2-vision:latest"
+    namespace: Optional[str] = None
+    model: Optional[str] = None  # Default: a resident chat-capable model
+
+
+async def _cache_generation(scope: Optional[str]) -> int:
+    """Current generation of a cache scope, as shared by all API workers."""
+    # A fresh session: the request's own may still read an older snapshot
+    async with AsyncSessionLocal() as db:
+        row = await db.get(RAGCacheGeneration, generation_key(scope))
+        return row.generation if row else 0
+
+
+async def _bump_cache_generations(db: AsyncSession, doc_id: str, namespace: Optional[str]):
+    """Make every worker's cached answers that may depend on doc_id stale; committed with the caller's change."""
+    for key in generation_keys(doc_id, namespace):
+        result = await db.execute(
+            update(RAGCacheGeneration)
+            .where(RAGCacheGeneration.scope == key)
+            .values(generation=RAGCacheGeneration.generation + 1)
+        )
+        if result.rowcount == 0:
+            db.add(RAGCacheGeneration(scope=key, generation=1))
+
+
+async def _forget_cached_answers(doc_id: str, namespace: Optional[str]):
+    """Bump the cache generations in a transaction of their own (the request's may have failed)."""
+    try:
+        async with AsyncSessionLocal() as db:
+            await _bump_cache_generations(db, doc_id, namespace)
+            await db.commit()
+    except Exception as e:
+        print(f"Warning: Could not invalidate cached answers for {doc_id}: {e}")
+    rag_answer_cache.invalidate_document(doc_id, namespace)
 
 
 @router.post("/rag/upload")
 async def upload_document(
     file: UploadFile = File(...),
-    name: Optional[str] = Form(None)
+    name: Optional[str] = Form(None),
+    namespace: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Upload and process a document for RAG.
     Supported formats: PDF, TXT, MD
+    Documents can be grouped in a namespace, which chats can be scoped to.
     """
+    doc_id = None
+    collection = DEFAULT_COLLECTION
     try:
-        # Process document
-        doc_id, texts = await process_document(file)
+        new_id = str(uuid.uuid4())
+        if RAG_SHARDING == "namespace":
+            namespace = namespace or RAG_DEFAULT_NAMESPACE
+        collection = shard_for(new_id, namespace)
+        with span("upload.save"):
+            doc_id, path = await save_upload(file, doc_id=new_id)
         
-        # Add to vectorstore
+        # Parse, split, embed and store in bounded batches off the event loop;
+        # chunks become searchable batch by batch
         filename = name or file.filename
-        add_to_vectorstore(doc_id, texts, metadata={"filename": filename})
+        metadata = {"filename": filename, **({"namespace": namespace} if namespace else {})}
+        with span("index", collection=collection):
+            changes = await run_in_threadpool(
+                update_vectorstore, doc_id, iter_document_chunks(path), metadata, None, collection
+            )
         
-        # Store metadata
-        uploaded_documents[doc_id] = {
-            "filename": filename,
-            "chunks": len(texts)
-        }
+        # Store metadata in the DB so every API worker sees it
+        db.add(RAGDocument(
+            id=doc_id, filename=filename, chunks=changes["added"], collection=collection, namespace=namespace
+        ))
+        # Cached all-document answers may now be incomplete
+        await _bump_cache_generations(db, doc_id, namespace)
+        with span("db.commit"):
+            await db.commit()
+        rag_answer_cache.invalidate_document(doc_id, namespace)
         
         return {
             "doc_id": doc_id,
             "filename": filename,
-            "chunks_created": len(texts),
+            "namespace": namespace,
+            "chunks_created": changes["added"],
             "message": "Document uploaded and indexed successfully"
         }
         
@@ -53,23 +115,140 @@ async def upload_document(
     except Exception as e:
         import traceback
         traceback.print_exc()
+        if doc_id:
+            # Don't leave a partially indexed document behind
+            await asyncio.to_thread(delete_document, doc_id, collection)
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@router.put("/rag/documents/{doc_id}")
+async def reupload_document(
+    doc_id: str,
+    file: UploadFile = File(...),
+    name: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Upload a new version of an existing document.
+    Only chunks whose text changed are re-embedded; removed chunks are deleted.
+    If re-indexing fails, the previous version stays in place.
+    """
+    document = await db.get(RAGDocument, doc_id)
+    if not document:
+        raise HTTPException(status_code=404, detail="Document not found")
+    namespace = document.namespace
+    staged_path = None
+    indexing = False
+
+    try:
+        # Kept beside the current file until the new version is indexed
+        with span("upload.save"):
+            _, staged_path = await save_upload(file, doc_id=doc_id, staged=True)
+
+        filename = name or document.filename
+        metadata = {"filename": filename, **({"namespace": namespace} if namespace else {})}
+        indexing = True
+        with span("index", collection=document.collection or DEFAULT_COLLECTION):
+            changes = await run_in_threadpool(
+                update_vectorstore, doc_id, iter_document_chunks(staged_path), metadata, None,
+                document.collection or DEFAULT_COLLECTION
+            )
+
+        document.filename = filename
+        document.chunks = changes["added"] + changes["kept"]
+        if changes["added"] or changes["removed"]:
+            await _bump_cache_generations(db, doc_id, document.namespace)
+        with span("db.commit"):
+            await db.commit()
+
+        indexing = False
+        if changes["added"] or changes["removed"]:
+            rag_answer_cache.invalidate_document(doc_id, document.namespace)
+        await asyncio.to_thread(install_upload, doc_id, staged_path)
+        staged_path = None
+
+        return {
+            "doc_id": doc_id,
+            "filename": filename,
+            "chunks": document.chunks,
+            "chunks_added": changes["added"],
+            "chunks_removed": changes["removed"],
+            "chunks_unchanged": changes["kept"],
+            "message": "Document re-indexed successfully"
+        }
+
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Re-index failed: {str(e)}")
+    finally:
+        if staged_path:
+            await asyncio.to_thread(discard_upload, staged_path)
+        if indexing:
+            # update_vectorstore rolled back, but answers cached meanwhile may
+            # have used chunks of the new version
+            await _forget_cached_answers(doc_id, namespace)
+
+
+async def _shards_for_query(db: AsyncSession, doc_id: Optional[str], namespace: Optional[str]) -> Optional[list]:
+    """Collections to search: the document's shard, the namespace's shards, or None for all."""
+    if doc_id:
+        document = await db.get(RAGDocument, doc_id)
+        return [document.collection or DEFAULT_COLLECTION] if document else None
+    if namespace:
+        rows = await db.scalars(
+            select(RAGDocument.collection).where(RAGDocument.namespace == namespace).distinct()
+        )
+        return [collection or DEFAULT_COLLECTION for collection in rows]
+    return None
+
+
 @router.post("/rag/chat")
-async def rag_chat(request: RAGChatRequest):
+async def rag_chat(request: RAGChatRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Chat with RAG context retrieval.
-    If doc_id is provided, retrieves context from that specific document.
+    If doc_id is provided, retrieves context from that specific document;
+    if namespace is provided, from the documents in that namespace.
     Otherwise, retrieves from all documents.
     """
     try:
-        # Retrieve relevant context
-        context_chunks = query_vectorstore(
-            request.message,
-            n_results=3,
-            doc_id=request.doc_id
-        )
+        model = request.model or model_catalog.default_model("chat")
+
+        # Embedding and retrieval block on I/O (and on the Ollama scheduler), so they run in threads
+        with span("embed.query"):
+            query_embedding = await asyncio.to_thread(embed_query, request.message)
+        cache_scope = request.doc_id or namespace_scope(request.namespace)
+
+        # Answer repeated (or rephrased) questions from the semantic cache
+        if RAG_CACHE_ENABLED:
+            generation = await _cache_generation(cache_scope)
+            cached = rag_answer_cache.lookup(query_embedding, cache_scope, model, generation)
+            if cached:
+                return {**cached, "cached": True}
+
+        # Retrieve a wide candidate set (searching only the relevant shards,
+        # each with the embedding backend it was indexed with) and pack the
+        # relevant, non-redundant part of it into the model's context budget
+        with span("db.shards"):
+            collections = await _shards_for_query(db, request.doc_id, request.namespace)
+        if collections is None:
+            collections = list_shards()
+        with span("retrieve", shards=len(collections)):
+            query_embeddings = await asyncio.to_thread(
+                embed_query_for, request.message, collections, {RAG_EMBEDDING_BACKEND: query_embedding}
+            )
+            candidates = await asyncio.to_thread(
+                retrieve_candidates,
+                query_embeddings,
+                n_results=RAG_CANDIDATES,
+                doc_id=request.doc_id,
+                collections=collections,
+                namespace=None if request.doc_id else request.namespace
+            )
+        with span("context.pack", candidates=len(candidates)):
+            context_chunks, packing = pack_context(candidates, model)
         
         # Build context string
         if context_chunks:
@@ -86,21 +265,32 @@ Answer:"""
             enhanced_prompt = request.message
         
         # Query Ollama
-        response = ollama.chat(
-            model=request.model,
-            messages=[{
-                "role": "user",
-                "content": enhanced_prompt
-            }],
-            stream=False
-        )
+        async with ollama_scheduler.aslot(RAG, model):
+            with span("llm", model=model):
+                response = await asyncio.to_thread(
+                    ollama.chat,
+                    model=model,
+                    messages=[{
+                        "role": "user",
+                        "content": enhanced_prompt
+                    }],
+                    stream=False
+                )
         
-        return {
+        result = {
             "message": response["message"]["content"],
             "context_used": len(context_chunks) > 0,
-            "num_chunks": len(context_chunks)
+            "num_chunks": packing["chunks_used"],
+            "context_tokens": packing["context_tokens"]
         }
-        
+        # Not if the documents changed while answering: the answer may be stale
+        if RAG_CACHE_ENABLED and await _cache_generation(cache_scope) == generation:
+            rag_answer_cache.store(query_embedding, cache_scope, model, result, generation)
+
+        return {**result, "cached": False}
+
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
@@ -108,24 +298,49 @@ Answer:"""
 
 
 @router.get("/rag/documents")
-async def list_documents():
+async def list_documents(db: AsyncSession = Depends(get_async_db)):
     """
     List all uploaded documents.
     """
-    return {"documents": uploaded_documents}
+    documents = (await db.scalars(select(RAGDocument).order_by(RAGDocument.created_at.desc()))).all()
+    return {"documents": {
+        doc.id: {"filename": doc.filename, "chunks": doc.chunks, "namespace": doc.namespace}
+        for doc in documents
+    }}
 
 
 @router.delete("/rag/documents/{doc_id}")
-async def delete_doc(doc_id: str):
+async def delete_doc(doc_id: str, db: AsyncSession = Depends(get_async_db)):
     """
     Delete a document and its embeddings.
     """
-    if doc_id not in uploaded_documents:
+    document = await db.get(RAGDocument, doc_id)
+    if not document:
         raise HTTPException(status_code=404, detail="Document not found")
     
     try:
-        delete_document(doc_id)
-        del uploaded_documents[doc_id]
+        await asyncio.to_thread(delete_document, doc_id, document.collection or DEFAULT_COLLECTION)
+        await db.delete(document)
+        await _bump_cache_generations(db, doc_id, document.namespace)
+        await db.commit()
+        rag_answer_cache.invalidate_document(doc_id, document.namespace)
         return {"message": "Document deleted successfully"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/rag/cache/stats")
+async def rag_cache_stats():
+    """
+    Semantic answer cache size and hit rate (per API worker).
+    """
+    return rag_answer_cache.stats()
+
+
+@router.delete("/rag/cache")
+async def clear_rag_cache():
+    """
+    Drop all cached answers.
+    """
+    rag_answer_cache.clear()
+    return {"message": "Cache cleared"}
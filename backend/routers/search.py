@@ -0,0 +1,58 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+from sqlalchemy import DateTime, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, async_engine
+from search import SOURCES, match_expression, search_sql, count_sql
+
+router = APIRouter()
+
+
+@router.get("/search")
+async def search_history(
+    q: str,
+    types: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Full-text search across chat, translation, STT, vision and voice history.
+    types: comma-separated subset of chat,translate,stt,vision,voice (default: all).
+    Results are ranked best first; snippets mark matches with <mark>.
+    """
+    if async_engine.dialect.name != "sqlite":
+        raise HTTPException(status_code=501, detail="Search requires the SQLite database (FTS5)")
+
+    kinds = [t.strip() for t in types.split(",") if t.strip()] if types else list(SOURCES)
+    unknown = [t for t in kinds if t not in SOURCES]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown types: {', '.join(unknown)}")
+
+    match = match_expression(q)
+    if match is None:
+        return {"query": q, "total": 0, "results": []}
+
+    try:
+        total = await db.scalar(text(count_sql(kinds)), {"match": match})
+        rows = await db.execute(text(search_sql(kinds)).columns(created_at=DateTime), {"match": match, "limit": limit, "offset": offset})
+        return {
+            "query": q,
+            "total": total,
+            "results": [
+                {
+                    "type": row.type,
+                    "id": row.id,
+                    "session_id": row.session_id,
+                    "title": row.title,
+                    "snippet": row.snippet,
+                    "created_at": row.created_at,
+                    "score": -row.rank,
+                }
+                for row in rows
+            ]
+        }
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
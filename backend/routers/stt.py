@@ -1,84 +1,75 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, BackgroundTasks, Response
 from pydantic import BaseModel
-import shutil
+import asyncio
 import os
-import tempfile
 from typing import Optional
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, AsyncSessionLocal
 from models import STTHistory
 import uuid
-
-# Try importing faster_whisper
-try:
-    from faster_whisper import WhisperModel
-    WHISPER_AVAILABLE = True
-except ImportError:
-    WHISPER_AVAILABLE = False
-    print("faster-whisper not installed.")
+from speech_models import WHISPER_AVAILABLE, transcribe
+from audio_io import decode_upload, archive_upload
+from tracing import span
+import quality
 
 router = APIRouter()
 
-# Initialize model lazily to avoid startup delay or if not installed
-_model_instance = None
-MODEL_SIZE = "tiny" # or "base", "small", "medium", "large-v3" based on hardware
-DEVICE = "cpu" # or "cuda"
-COMPUTE_TYPE = "int8" # or "float16" for cuda
 
-def get_model():
-    global _model_instance
-    if _model_instance is None:
-        if not WHISPER_AVAILABLE:
-             raise RuntimeError("faster-whisper library not installed.")
-        print(f"Loading Faster-Whisper model: {MODEL_SIZE} on {DEVICE}...")
-        _model_instance = WhisperModel(MODEL_SIZE, device=DEVICE, compute_type=COMPUTE_TYPE)
-        print("Faster-Whisper model loaded.")
-    return _model_instance
+async def _archive_or_drop(path: str, data: bytes, history_id: int):
+    """Archive the upload; drop its history item if that fails, so none points at a missing file."""
+    if await asyncio.to_thread(archive_upload, path, data):
+        return
+    async with AsyncSessionLocal() as db:
+        item = await db.get(STTHistory, history_id)
+        if item:
+            await db.delete(item)
+            await db.commit()
+    print(f"Warning: Dropped STT history item {history_id}: its audio could not be archived")
 
 @router.post("/stt")
 async def transcribe_audio(
+    background_tasks: BackgroundTasks,
+    response: Response,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     if not WHISPER_AVAILABLE:
         raise HTTPException(status_code=500, detail="faster-whisper library not installed.")
 
-    temp_file_path = ""
-    saved_filepath = ""
     try:
-        # Save uploaded file to static for history
+        with span("upload.read"):
+            data = await file.read()
         file_ext = os.path.splitext(file.filename)[1] or ".wav"
         filename = f"{uuid.uuid4()}{file_ext}"
-        saved_filepath = os.path.join("static", filename)
-        
-        with open(saved_filepath, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Also need a temp path for whisper? actually we can just use the static path now!
-        # But let's verify if whisper needs a closed file. It usually takes a path.
-        
-        model = get_model()
-        
-        # Transcribe
-        segments, info = model.transcribe(saved_filepath, beam_size=5)
-        
-        # Collect text from segments
-        full_text = "".join([segment.text for segment in segments])
-        
+
+        # Decode the upload in memory and transcribe it (locally or on the
+        # shared inference server), off the event loop; cheaper settings under load
+        stt_tier, stt_options = quality.stt_settings()
+        with span("stt", bytes=len(data), tier=stt_tier), quality.stt_quality.track():
+            result = await asyncio.to_thread(lambda: transcribe(decode_upload(data), **stt_options))
+        full_text = result.text
+
         # Save to DB
         history_item = STTHistory(
             audio_path=f"/static/{filename}",
             transcript=full_text.strip(),
-            language=info.language,
-            language_probability=info.language_probability
+            language=result.language,
+            language_probability=result.language_probability
         )
         db.add(history_item)
-        db.commit()
+        with span("db.commit"):
+            await db.commit()
+
+        # The original goes to static/ for the history after the response is sent
+        background_tasks.add_task(_archive_or_drop, os.path.join("static", filename), data, history_item.id)
 
+        response.headers["X-Quality-Tier"] = quality.header(stt=stt_tier)
         return {
             "text": full_text.strip(),
-            "language": info.language,
-            "language_probability": info.language_probability
+            "language": result.language,
+            "language_probability": result.language_probability,
+            "quality": quality.report(stt=stt_tier)
         }
 
     except Exception as e:
@@ -90,24 +81,24 @@ async def transcribe_audio(
         # pass
 
 @router.get("/stt/history")
-async def list_stt_history(db: Session = Depends(get_db)):
-    history = db.query(STTHistory).order_by(STTHistory.created_at.desc()).all()
+async def list_stt_history(db: AsyncSession = Depends(get_async_db)):
+    history = (await db.scalars(select(STTHistory).order_by(STTHistory.created_at.desc()))).all()
     return history
 
 @router.get("/stt/history/{history_id}")
-async def get_stt_history_item(history_id: int, db: Session = Depends(get_db)):
-    item = db.query(STTHistory).filter(STTHistory.id == history_id).first()
+async def get_stt_history_item(history_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.get(STTHistory, history_id)
     if not item:
         raise HTTPException(status_code=404, detail="History item not found")
     return item
 
 @router.delete("/stt/history/{history_id}")
-async def delete_stt_history(history_id: int, db: Session = Depends(get_db)):
-    item = db.query(STTHistory).filter(STTHistory.id == history_id).first()
+async def delete_stt_history(history_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.get(STTHistory, history_id)
     if not item:
         raise HTTPException(status_code=404, detail="History item not found")
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.commit()
     return {"status": "success"}
 
 
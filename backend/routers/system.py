@@ -0,0 +1,69 @@
+import asyncio
+import hmac
+from typing import Literal, Optional
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from ollama_scheduler import ollama_scheduler
+from model_catalog import model_catalog
+from routers.tts import tts_flight
+from routers.translate import translate_flight
+from routers.vision import vision_flight
+import profiling
+import quality
+
+router = APIRouter()
+
+
+@router.get("/system/scheduler")
+async def scheduler_stats():
+    """Ollama slots in use, queue depth and queue-wait percentiles per priority class."""
+    return ollama_scheduler.stats()
+
+
+@router.get("/system/models")
+async def model_catalog_stats():
+    """Cache age of the model catalog, resident models and the current defaults."""
+    return model_catalog.stats()
+
+
+@router.get("/system/quality")
+async def quality_stats():
+    """Quality tier per service, with the latency and queue figures it is based on."""
+    return quality.stats()
+
+
+@router.get("/system/coalescing")
+async def coalescing_stats():
+    """How many identical in-flight requests shared one computation."""
+    return {flight.name: flight.stats() for flight in (tts_flight, translate_flight, vision_flight)}
+
+
+@router.get("/system/profile")
+async def profile_process(
+    seconds: float = Query(10.0, gt=0),
+    mode: Literal["sample", "cprofile"] = "sample",
+    interval_ms: float = Query(5.0, ge=1, le=1000),
+    sort: Literal["cumulative", "tottime", "calls"] = "cumulative",
+    format: Literal["json", "text"] = "json",
+    x_profiling_token: Optional[str] = Header(None),
+):
+    """
+    Profile the live process for `seconds` (see profiling.py). Disabled unless
+    PROFILING_ENABLED=1. format=text returns just the pstats report (cprofile)
+    or the collapsed stacks for flamegraph.pl / speedscope (sample).
+    """
+    if not profiling.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling is disabled (set PROFILING_ENABLED=1)")
+    if profiling.PROFILING_TOKEN and not hmac.compare_digest(x_profiling_token or "", profiling.PROFILING_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid profiling token")
+    seconds = min(seconds, profiling.PROFILING_MAX_SECONDS)
+    try:
+        if mode == "cprofile":
+            result = await profiling.profile_event_loop(seconds, sort=sort)
+            return PlainTextResponse(result["stats"]) if format == "text" else result
+        result = await asyncio.to_thread(profiling.sample_stacks, seconds, interval_ms / 1000)
+    except profiling.ProfilerBusy:
+        raise HTTPException(status_code=409, detail="A profile is already being captured")
+    if format == "text":
+        return PlainTextResponse(result["collapsed"])
+    return result
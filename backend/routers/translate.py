@@ -1,68 +1,211 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+import asyncio
+import json
+import os
+import re
 import ollama
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, get_async_db
 from models import TranslateHistory
+from singleflight import SingleFlight, normalize_text
+from ollama_scheduler import ollama_scheduler, BATCH
+from model_catalog import model_catalog
+from typing import Optional
+from language_id import normalize_language, is_in_language
 
 router = APIRouter()
+translate_flight = SingleFlight("translate")
+
+# Document mode: paragraphs translated at once per request (the scheduler still caps the total)
+TRANSLATE_PARALLELISM = int(os.getenv("TRANSLATE_PARALLELISM", "4"))
+# Paragraphs longer than this are split at sentence boundaries
+TRANSLATE_SEGMENT_CHARS = int(os.getenv("TRANSLATE_SEGMENT_CHARS", "2000"))
+# Segments detected as the target language with at least this confidence are not translated
+TRANSLATE_LANGID_CONFIDENCE = float(os.getenv("TRANSLATE_LANGID_CONFIDENCE", "0.6"))
+
+_PARAGRAPH_BREAK = re.compile(r"(\n[ \t]*\n\s*)")
+_SENTENCE_END = re.compile(r"(?<=[.!?。！？])\s+")
 
 class TranslateRequest(BaseModel):
     text: str
     target_lang: str
-    model: str = "llama3.2-vision:latest" # Default model
+    model: Optional[str] = None # Default: a resident chat-capable model
+
+async def _translate(text: str, target_lang: str, model: str):
+    """One model call (shared with identical translations in flight). Returns (response, shared)."""
+    # Construct a prompt for translation
+    # Llama 3 models are good at following instructions
+    prompt = f"Translate the following text to {target_lang}. Only provide the translated text, no explanations or introductory phrases.\n\nText: {text}"
+
+    async def translate():
+        async with ollama_scheduler.aslot(BATCH, model):
+            return await asyncio.to_thread(
+                ollama.chat,
+                model=model,
+                messages=[{
+                    'role': 'user',
+                    'content': prompt
+                }],
+                stream=False
+            )
+
+    # Identical translations already in flight share one model call
+    key = (normalize_text(text), target_lang.strip().lower(), model)
+    return await translate_flight.do(key, translate)
+
+def _split_document(text: str):
+    """
+    Pieces of text in order: paragraph separators (kept verbatim) and
+    segments to translate, as (piece, translatable) pairs.
+    """
+    pieces = []
+    for i, part in enumerate(_PARAGRAPH_BREAK.split(text)):
+        if i % 2 == 1 or not part.strip():
+            pieces.append((part, False))
+            continue
+        # Keep the paragraph's own leading/trailing whitespace (indentation, final newline)
+        body = part.strip()
+        lead, trail = part[:len(part) - len(part.lstrip())], part[len(part.rstrip()):]
+        if lead:
+            pieces.append((lead, False))
+        if len(body) <= TRANSLATE_SEGMENT_CHARS:
+            pieces.append((body, True))
+        else:
+            chunk = ""
+            for sentence in _SENTENCE_END.split(body):
+                if chunk and len(chunk) + 1 + len(sentence) > TRANSLATE_SEGMENT_CHARS:
+                    pieces.extend([(chunk, True), (" ", False)])
+                    chunk = sentence
+                else:
+                    chunk = f"{chunk} {sentence}" if chunk else sentence
+            if chunk:
+                pieces.append((chunk, True))
+        if trail:
+            pieces.append((trail, False))
+    return pieces
 
 @router.post("/translate")
-async def translate_text(request: TranslateRequest, db: Session = Depends(get_db)):
+async def translate_text(request: TranslateRequest, db: AsyncSession = Depends(get_async_db)):
     try:
-        # Construct a prompt for translation
-        # Llama 3 models are good at following instructions
-        prompt = f"Translate the following text to {request.target_lang}. Only provide the translated text, no explanations or introductory phrases.\n\nText: {request.text}"
-        
-        response = ollama.chat(
-            model=request.model,
-            messages=[{
-                'role': 'user',
-                'content': prompt
-            }],
-            stream=False
-        )
+        model = request.model or model_catalog.default_model("chat")
+        response, shared = await _translate(request.text, request.target_lang, model)
         
         response_text = response['message']['content']
 
-        # Save to DB
-        history_item = TranslateHistory(
-            source_text=request.text,
-            target_language=request.target_lang,
-            translated_text=response_text
-        )
-        db.add(history_item)
-        db.commit()
+        # Save to DB (once per model call)
+        if not shared:
+            history_item = TranslateHistory(
+                source_text=request.text,
+                target_language=request.target_lang,
+                translated_text=response_text
+            )
+            db.add(history_item)
+            await db.commit()
         
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/translate/document")
+async def translate_document(request: TranslateRequest):
+    """
+    Translate a long text paragraph by paragraph, TRANSLATE_PARALLELISM at a
+    time, streaming NDJSON as paragraphs finish: a "start" line with the
+    number of segments, one "segment" line per segment (its index, the
+    whitespace before it, its text and whether it was skipped as already being
+    in the target language), then "done" with the whole translation,
+    paragraph breaks and indentation kept.
+    """
+    model = request.model or model_catalog.default_model("chat")
+    target = normalize_language(request.target_lang)
+    pieces = _split_document(request.text)
+    segments = [i for i, (_, translatable) in enumerate(pieces) if translatable]
+    position = {piece_index: n for n, piece_index in enumerate(segments)}
+    # Whitespace between each segment and the one before it, so clients can
+    # assemble the document as segments arrive: before + text, in index order
+    before, gap = {}, ""
+    for i, (piece, translatable) in enumerate(pieces):
+        if translatable:
+            before[i], gap = gap, ""
+        else:
+            gap += piece
+    limit = asyncio.Semaphore(TRANSLATE_PARALLELISM)
+
+    async def translate_piece(index: int):
+        text = pieces[index][0]
+        if target and is_in_language(text, target, TRANSLATE_LANGID_CONFIDENCE):
+            return index, text, True
+        async with limit:
+            response, _ = await _translate(text, request.target_lang, model)
+        return index, response['message']['content'].strip(), False
+
+    async def ndjson():
+        yield json.dumps({"event": "start", "segments": len(segments), "model": model}) + "\n"
+        translated = {i: piece for i, (piece, translatable) in enumerate(pieces) if not translatable}
+        tasks = [asyncio.ensure_future(translate_piece(i)) for i in segments]
+        skipped = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    index, text, was_skipped = await next_done
+                except Exception as e:
+                    import traceback
+                    traceback.print_exc()
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    yield json.dumps({"event": "error", "detail": detail}) + "\n"
+                    return
+                translated[index] = text
+                skipped += was_skipped
+                yield json.dumps({
+                    "event": "segment", "index": position[index], "before": before[index],
+                    "text": text, "skipped": was_skipped
+                }) + "\n"
+
+            translated_text = "".join(translated[i] for i in range(len(pieces)))
+            async with AsyncSessionLocal() as db:
+                history_item = TranslateHistory(
+                    source_text=request.text,
+                    target_language=request.target_lang,
+                    translated_text=translated_text
+                )
+                db.add(history_item)
+                await db.commit()
+            yield json.dumps({
+                "event": "done", "text": translated_text, "segments": len(segments),
+                "skipped": skipped, "history_id": history_item.id
+            }) + "\n"
+        finally:
+            # Client went away (or a segment failed): drop the rest
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @router.get("/translate/history")
-async def list_translate_history(db: Session = Depends(get_db)):
-    history = db.query(TranslateHistory).order_by(TranslateHistory.created_at.desc()).all()
+async def list_translate_history(db: AsyncSession = Depends(get_async_db)):
+    history = (await db.scalars(select(TranslateHistory).order_by(TranslateHistory.created_at.desc()))).all()
     return history
 
 @router.get("/translate/history/{history_id}")
-async def get_translate_history_item(history_id: int, db: Session = Depends(get_db)):
-    item = db.query(TranslateHistory).filter(TranslateHistory.id == history_id).first()
+async def get_translate_history_item(history_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.get(TranslateHistory, history_id)
     if not item:
         raise HTTPException(status_code=404, detail="History item not found")
     return item
 
 @router.delete("/translate/history/{history_id}")
-async def delete_translate_history(history_id: int, db: Session = Depends(get_db)):
-    item = db.query(TranslateHistory).filter(TranslateHistory.id == history_id).first()
+async def delete_translate_history(history_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.get(TranslateHistory, history_id)
     if not item:
         raise HTTPException(status_code=404, detail="History item not found")
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.commit()
     return {"status": "success"}
 
@@ -1,108 +1,176 @@
-from fastapi import APIRouter, HTTPException, BackgroundTasks, Depends
+from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import Response, StreamingResponse
+from typing import Optional
+import asyncio
+import json
 import os
+import threading
 import soundfile as sf
 import io
-import numpy as np
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, get_async_db
 from models import TTSHistory
 import uuid
-import shutil
-
-# Try importing Kokoro, but handle potential missing dependencies or model files
-try:
-    from kokoro_onnx import Kokoro
-    KOKORO_AVAILABLE = True
-except ImportError:
-    KOKORO_AVAILABLE = False
-    print("Kokoro-onnx not installed.")
+from speech_models import KOKORO_AVAILABLE, KOKORO_VOICES_JSON as VOICES_JSON_PATH, synthesize
+from singleflight import SingleFlight, normalize_text
+from longform_tts import TTS_LONGFORM_CHARS, segment_text, synthesize_long
+from cancellation import Interrupted
+from tracing import span
 
 router = APIRouter()
-
-# Path to models
-MODEL_PATH = "models/kokoro-v0_19.onnx"
-VOICES_BIN_PATH = "models/voices.bin"
-VOICES_JSON_PATH = "models/voices.json"
-
-_kokoro_instance = None
-
-def get_kokoro():
-    global _kokoro_instance
-    if _kokoro_instance is None:
-        if not os.path.exists(MODEL_PATH) or not os.path.exists(VOICES_BIN_PATH):
-            raise RuntimeError("Kokoro model files not found in models/")
-        _kokoro_instance = Kokoro(MODEL_PATH, VOICES_BIN_PATH)
-    return _kokoro_instance
+tts_flight = SingleFlight("tts")
 
 class TTSRequest(BaseModel):
     text: str
     voice: str = "af_sarah" # Default voice
     speed: float = 1.0
+    # Silence inserted between segments of long texts (defaults: TTS_SEGMENT_PAUSE_MS / TTS_PARAGRAPH_PAUSE_MS)
+    segment_pause_ms: Optional[int] = None
+    paragraph_pause_ms: Optional[int] = None
+
+def _flight_key(request: TTSRequest):
+    return (
+        normalize_text(request.text), request.voice, round(request.speed, 3),
+        request.segment_pause_ms, request.paragraph_pause_ms,
+    )
+
+def _render(request: TTSRequest, on_progress=None):
+    """Synthesize, encode and write the WAV file once. Returns (wav, audio_path, duration)."""
+    with span("tts", chars=len(request.text)):
+        if len(request.text) > TTS_LONGFORM_CHARS or on_progress is not None:
+            # Long texts: segments synthesized in parallel, then stitched
+            samples, sample_rate = synthesize_long(
+                request.text,
+                voice=request.voice,
+                speed=request.speed,
+                lang="en-us",
+                segment_pause_ms=request.segment_pause_ms,
+                paragraph_pause_ms=request.paragraph_pause_ms,
+                on_progress=on_progress,
+            )
+        else:
+            # Generate audio (locally or on the shared inference server)
+            samples, sample_rate = synthesize(
+                request.text, 
+                voice=request.voice, 
+                speed=request.speed, 
+                lang="en-us"
+            )
+    with span("file.write"):
+        buffer = io.BytesIO()
+        sf.write(buffer, samples, sample_rate, format='WAV')
+        wav = buffer.getvalue()
+
+        # Save to file
+        filename = f"{uuid.uuid4()}.wav"
+        with open(os.path.join("static", filename), "wb") as f:
+            f.write(wav)
+    return wav, f"/static/{filename}", len(samples) / sample_rate
 
 @router.post("/tts")
-async def generate_speech(request: TTSRequest, db: Session = Depends(get_db)):
+async def generate_speech(request: TTSRequest, db: AsyncSession = Depends(get_async_db)):
     if not KOKORO_AVAILABLE:
          raise HTTPException(status_code=500, detail="Kokoro-onnx library not installed.")
-    
+
     try:
-        kokoro = get_kokoro()
-        
-        # Generate audio
-        samples, sample_rate = kokoro.create(
-            request.text, 
-            voice=request.voice, 
-            speed=request.speed, 
-            lang="en-us"
+        # Identical requests already being synthesized share that synthesis
+        (wav, audio_path, _), shared = await tts_flight.do(
+            _flight_key(request), lambda: asyncio.to_thread(_render, request)
         )
+
+        # Save to DB (once per synthesis, so retries don't duplicate history)
+        if not shared:
+            history_item = TTSHistory(
+                text=request.text,
+                voice=request.voice,
+                audio_path=audio_path
+            )
+            db.add(history_item)
+            with span("db.commit"):
+                await db.commit()
         
-        # Save to file
-        filename = f"{uuid.uuid4()}.wav"
-        filepath = os.path.join("static", filename)
-        sf.write(filepath, samples, sample_rate, format='WAV')
-
-        # Save to DB
-        history_item = TTSHistory(
-            text=request.text,
-            voice=request.voice,
-            audio_path=f"/static/{filename}"
-        )
-        db.add(history_item)
-        db.commit()
-        
-        # Return streaming response (reading from file or memory)
-        # We can enable the user to play it immediately
-        buffer = io.BytesIO()
-        sf.write(buffer, samples, sample_rate, format='WAV')
-        buffer.seek(0)
-        
-        return StreamingResponse(buffer, media_type="audio/wav")
+        return Response(content=wav, media_type="audio/wav")
 
     except Exception as e:
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/tts/long")
+async def generate_long_speech(request: TTSRequest):
+    """
+    Synthesize a long text, streaming progress as NDJSON: a "started" event with
+    the number of segments, "progress" events as segments finish, then "done"
+    with the audio URL (or "error").
+    """
+    if not KOKORO_AVAILABLE:
+         raise HTTPException(status_code=500, detail="Kokoro-onnx library not installed.")
+
+    async def job():
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        stopped = threading.Event()
+
+        def progress(done, total):
+            if stopped.is_set():
+                # Nobody is listening any more: drop the remaining segments
+                raise Interrupted("client disconnected")
+            loop.call_soon_threadsafe(events.put_nowait, {"event": "progress", "done": done, "total": total})
+
+        def run():
+            try:
+                return _render(request, on_progress=progress)
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, None)
+
+        yield {"event": "started", "segments": len(segment_text(request.text))}
+        work = asyncio.ensure_future(asyncio.to_thread(run))
+        try:
+            while (event := await events.get()) is not None:
+                yield event
+            _, audio_path, duration = await work
+
+            async with AsyncSessionLocal() as db:
+                history_item = TTSHistory(text=request.text, voice=request.voice, audio_path=audio_path)
+                db.add(history_item)
+                await db.commit()
+            yield {"event": "done", "audio_url": audio_path, "duration": round(duration, 2), "history_id": history_item.id}
+        finally:
+            stopped.set()
+
+    async def ndjson():
+        try:
+            # Identical long texts already being synthesized share that synthesis and its progress
+            async for event in tts_flight.stream(("long",) + _flight_key(request), job):
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            yield json.dumps({"event": "error", "detail": str(e)}) + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @router.get("/tts/history")
-async def list_tts_history(db: Session = Depends(get_db)):
-    history = db.query(TTSHistory).order_by(TTSHistory.created_at.desc()).all()
+async def list_tts_history(db: AsyncSession = Depends(get_async_db)):
+    history = (await db.scalars(select(TTSHistory).order_by(TTSHistory.created_at.desc()))).all()
     return history
 
 @router.get("/tts/history/{history_id}")
-async def get_tts_history_item(history_id: int, db: Session = Depends(get_db)):
-    item = db.query(TTSHistory).filter(TTSHistory.id == history_id).first()
+async def get_tts_history_item(history_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.get(TTSHistory, history_id)
     if not item:
         raise HTTPException(status_code=404, detail="History item not found")
     return item
 
 @router.delete("/tts/history/{history_id}")
-async def delete_tts_history(history_id: int, db: Session = Depends(get_db)):
-    item = db.query(TTSHistory).filter(TTSHistory.id == history_id).first()
+async def delete_tts_history(history_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.get(TTSHistory, history_id)
     if not item:
         raise HTTPException(status_code=404, detail="History item not found")
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.commit()
     return {"status": "success"}
 
 @router.get("/tts/voices")
@@ -1,78 +1,198 @@
 from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-import ollama
-import base64
+import asyncio
+import hashlib
+import json
 from typing import List, Optional
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import AsyncSessionLocal, get_async_db
 from models import VisionHistory
 import os
-import shutil
 import uuid
+from singleflight import SingleFlight, normalize_text
+from ollama_scheduler import ollama_scheduler, get_async_client, BATCH, CHAT
+from model_catalog import model_catalog
 
 router = APIRouter()
+vision_flight = SingleFlight("vision")
+
+# Model calls of one batch request in flight at once (the scheduler still caps the total)
+VISION_BATCH_CONCURRENCY = int(os.getenv("VISION_BATCH_CONCURRENCY", "4"))
+# Largest number of (image, prompt) pairs accepted in one batch
+VISION_BATCH_MAX_ITEMS = int(os.getenv("VISION_BATCH_MAX_ITEMS", "1000"))
 
 @router.post("/vision")
 async def analyze_image(
     file: UploadFile = File(...),
     prompt: str = Form("Describe this image"),
-    model: str = Form("llama3.2-vision"),
-    db: Session = Depends(get_db)
+    model: Optional[str] = Form(None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        # Save image to static folder
+        model = model or model_catalog.default_model("vision")
+        image_content = await file.read()
         file_ext = os.path.splitext(file.filename)[1] or ".jpg"
-        filename = f"{uuid.uuid4()}{file_ext}"
-        filepath = os.path.join("static", filename)
-        
-        with open(filepath, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Re-read file for Ollama (since we consumed the stream, or just read from disk)
-        with open(filepath, "rb") as f:
-            image_content = f.read()
-
-        # Call Ollama with the image
-        response = ollama.chat(
-            model=model,
-            messages=[{
-                'role': 'user',
-                'content': prompt,
-                'images': [image_content]
-            }]
-        )
+
+        def store_image():
+            # Save image to static folder
+            filename = f"{uuid.uuid4()}{file_ext}"
+            with open(os.path.join("static", filename), "wb") as buffer:
+                buffer.write(image_content)
+            return f"/static/{filename}"
+
+        async def analyze():
+            image_path = await asyncio.to_thread(store_image)
+            # Call Ollama with the image; no thread is held while queued
+            async with ollama_scheduler.aslot(CHAT, model):
+                response = await get_async_client().chat(
+                    model=model,
+                    messages=[{
+                        'role': 'user',
+                        'content': prompt,
+                        'images': [image_content]
+                    }]
+                )
+            return response, image_path
+
+        # The same image with the same prompt already being analyzed shares that
+        # call; the priority is part of the key, so this never waits behind a batch
+        key = (CHAT, hashlib.sha256(image_content).hexdigest(), normalize_text(prompt), model)
+        (response, image_path), shared = await vision_flight.do(key, analyze)
         
         response_text = response['message']['content']
 
-        # Save to DB
-        history_item = VisionHistory(
-            image_path=f"/static/{filename}",
-            prompt=prompt,
-            response=response_text
-        )
-        db.add(history_item)
-        db.commit()
-        db.refresh(history_item)
+        # Save to DB (once per model call)
+        if not shared:
+            history_item = VisionHistory(
+                image_path=image_path,
+                prompt=prompt,
+                response=response_text
+            )
+            db.add(history_item)
+            await db.commit()
+            await db.refresh(history_item)
         
         return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/vision/batch")
+async def analyze_images_batch(
+    files: List[UploadFile] = File(...),
+    prompts: List[str] = Form(["Describe this image"]),
+    model: Optional[str] = Form(None),
+):
+    """
+    Analyze every image with every prompt. Results stream back as NDJSON in
+    completion order, one "result" (or "error") line per (image, prompt)
+    pair, followed by a "done" summary. Each image is uploaded and stored
+    once however many prompts it gets.
+    """
+    model = model or model_catalog.default_model("vision")
+    prompts = [prompt for prompt in prompts if prompt.strip()]
+    if not prompts:
+        raise HTTPException(status_code=400, detail="At least one prompt is required")
+    if len(files) * len(prompts) > VISION_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch too large: {len(files)} images x {len(prompts)} prompts exceeds {VISION_BATCH_MAX_ITEMS}",
+        )
+
+    images = []
+    for upload in files:
+        content = await upload.read()
+        file_ext = os.path.splitext(upload.filename or "")[1] or ".jpg"
+        images.append((upload.filename, content, hashlib.sha256(content).hexdigest(), file_ext))
+
+    def store_images():
+        # One file per distinct image, however often it appears in the batch
+        paths = {}
+        for _, content, digest, file_ext in images:
+            if digest not in paths:
+                filename = f"{uuid.uuid4()}{file_ext}"
+                with open(os.path.join("static", filename), "wb") as buffer:
+                    buffer.write(content)
+                paths[digest] = f"/static/{filename}"
+        return paths
+
+    limit = asyncio.Semaphore(VISION_BATCH_CONCURRENCY)
+
+    async def analyze(image_index: int, prompt_index: int, image_paths: dict):
+        filename, content, digest, _ = images[image_index]
+        prompt = prompts[prompt_index]
+        result = {"image_index": image_index, "prompt_index": prompt_index, "filename": filename, "prompt": prompt}
+
+        async def call():
+            # Bulk work: BATCH priority, so interactive vision and chat go first
+            async with ollama_scheduler.aslot(BATCH, model):
+                response = await get_async_client().chat(
+                    model=model,
+                    messages=[{'role': 'user', 'content': prompt, 'images': [content]}]
+                )
+            return response, image_paths[digest]
+
+        try:
+            async with limit:
+                # Shares the model call with an identical pair of any batch in flight
+                key = (BATCH, digest, normalize_text(prompt), model)
+                (response, image_path), shared = await vision_flight.do(key, call)
+            return {**result, "event": "result", "image_path": image_path,
+                    "response": response['message']['content'], "shared": shared}
+        except Exception as e:
+            detail = e.detail if isinstance(e, HTTPException) else str(e)
+            return {**result, "event": "error", "detail": detail}
+
+    async def ndjson():
+        image_paths = await asyncio.to_thread(store_images)
+        tasks = [
+            asyncio.ensure_future(analyze(i, j, image_paths))
+            for i in range(len(images)) for j in range(len(prompts))
+        ]
+        failed = 0
+        try:
+            async with AsyncSessionLocal() as db:
+                for next_done in asyncio.as_completed(tasks):
+                    result = await next_done
+                    if result["event"] == "error":
+                        failed += 1
+                    elif not result.pop("shared"):
+                        # Save to DB (once per model call)
+                        history_item = VisionHistory(
+                            image_path=result["image_path"],
+                            prompt=result["prompt"],
+                            response=result["response"]
+                        )
+                        db.add(history_item)
+                        await db.commit()
+                        result["history_id"] = history_item.id
+                    yield json.dumps(result) + "\n"
+            yield json.dumps({"event": "done", "total": len(tasks), "failed": failed, "model": model}) + "\n"
+        finally:
+            # Client went away: drop the pairs not analyzed yet
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @router.get("/vision/history")
-async def list_vision_history(db: Session = Depends(get_db)):
-    history = db.query(VisionHistory).order_by(VisionHistory.created_at.desc()).all()
+async def list_vision_history(db: AsyncSession = Depends(get_async_db)):
+    history = (await db.scalars(select(VisionHistory).order_by(VisionHistory.created_at.desc()))).all()
     return history
 
 @router.get("/vision/history/{history_id}")
-async def get_vision_history_item(history_id: int, db: Session = Depends(get_db)):
-    item = db.query(VisionHistory).filter(VisionHistory.id == history_id).first()
+async def get_vision_history_item(history_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.get(VisionHistory, history_id)
     if not item:
         raise HTTPException(status_code=404, detail="History item not found")
     return item
 
 @router.delete("/vision/history/{history_id}")
-async def delete_vision_history(history_id: int, db: Session = Depends(get_db)):
-    item = db.query(VisionHistory).filter(VisionHistory.id == history_id).first()
+async def delete_vision_history(history_id: int, db: AsyncSession = Depends(get_async_db)):
+    item = await db.get(VisionHistory, history_id)
     if not item:
         raise HTTPException(status_code=404, detail="History item not found")
     
@@ -82,18 +202,15 @@ async def delete_vision_history(history_id: int, db: Session = Depends(get_db)):
     #     if os.path.exists(file_path):
     #         os.remove(file_path)
 
-    db.delete(item)
-    db.commit()
+    await db.delete(item)
+    await db.commit()
     return {"status": "success"}
 
 @router.get("/vision/models")
 async def list_vision_models():
-    # In a real scenario, we might want to filter for models that support vision
-    # For now, we'll just return all models or a hardcoded list of known vision models
-    # if we want to be specific.
+    """Models that accept images, from the cached catalog."""
     try:
-        models = ollama.list()
-        # Simple heuristic: prioritize known vision models if present, otherwise return all
-        return models
+        models = await asyncio.to_thread(model_catalog.models, "vision")
+        return {"models": models, "default": model_catalog.default_model("vision")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,80 +1,135 @@
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Depends, Request, BackgroundTasks, Response
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import func, select
+from sqlalchemy.orm import selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, AsyncSessionLocal
 from models import VoiceSession, VoiceMessage
-import ollama
-import shutil
+import asyncio
+import re
 import os
+import time
 import uuid
+import numpy as np
 import soundfile as sf
-import io
+from speech_models import WHISPER_AVAILABLE, KOKORO_AVAILABLE, transcribe, synthesize
+from audio_io import decode_upload, archive_upload
+from ollama_scheduler import ollama_scheduler, get_async_client, VOICE
+from model_catalog import model_catalog
+import cancellation
+from cancellation import Interrupted, cancellable
+from tracing import span
+import quality
 
-# Import existing utilities
-try:
-    from faster_whisper import WhisperModel
-    WHISPER_AVAILABLE = True
-except ImportError:
-    WHISPER_AVAILABLE = False
+router = APIRouter()
 
-try:
-    from kokoro_onnx import Kokoro
-    KOKORO_AVAILABLE = True
-except ImportError:
-    KOKORO_AVAILABLE = False
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def _split_sentences(text: str):
+    """Complete sentences in text, and the unfinished rest."""
+    parts = _SENTENCE_END.split(text)
+    return parts[:-1], parts[-1]
 
-router = APIRouter()
 
-# Lazy load models
-_whisper_model = None
-_kokoro_instance = None
+async def _archive_or_clear(path: str, data: bytes, message_id: int):
+    """Archive the upload; clear the message's audio path if that fails, so it never points at a missing file."""
+    if await asyncio.to_thread(archive_upload, path, data):
+        return
+    async with AsyncSessionLocal() as db:
+        message = await db.get(VoiceMessage, message_id)
+        if message:
+            message.user_audio_path = None
+            await db.commit()
+    print(f"Warning: Cleared the user audio of voice message {message_id}: it could not be archived")
 
-WHISPER_MODEL_SIZE = "tiny"
-WHISPER_DEVICE = "cpu"
-WHISPER_COMPUTE_TYPE = "int8"
 
-KOKORO_MODEL_PATH = "models/kokoro-v0_19.onnx"
-KOKORO_VOICES_BIN = "models/voices.bin"
+async def _respond(token, model: str, user_text: str, voice: str, speed: float, options: dict):
+    """
+    Stream the LLM answer and synthesize each sentence as soon as it is
+    complete. If the token is cancelled, generation stops and queued sentences
+    are dropped. Returns (answer text so far, list of (samples, sample_rate)).
+    """
+    sentences = asyncio.Queue()
+    audio = []
 
+    async def speak():
+        while True:
+            sentence = await sentences.get()
+            if sentence is None or token.cancelled:
+                return
+            with span("tts", chars=len(sentence)), quality.tts_quality.track():
+                audio.append(await asyncio.to_thread(synthesize, sentence, voice=voice, speed=speed, lang="en-us"))
 
-def get_whisper_model():
-    global _whisper_model
-    if _whisper_model is None:
-        if not WHISPER_AVAILABLE:
-            raise RuntimeError("faster-whisper not installed")
-        print(f"Loading Whisper model: {WHISPER_MODEL_SIZE}")
-        _whisper_model = WhisperModel(WHISPER_MODEL_SIZE, device=WHISPER_DEVICE, compute_type=WHISPER_COMPUTE_TYPE)
-    return _whisper_model
+    async def ollama_stream():
+        stream = await get_async_client().chat(
+            model=model,
+            messages=[{
+                "role": "user",
+                "content": user_text
+            }],
+            options=options or None,
+            stream=True
+        )
+        async for chunk in stream:
+            yield chunk["message"]["content"]
 
+    speaker = asyncio.ensure_future(speak())
+    token.attach(speaker)
+    ai_text = ""
+    pending = ""
+    started = time.perf_counter()
+    try:
+        async with ollama_scheduler.aslot(VOICE, model):
+            with span("llm", model=model):
+                async for piece in cancellable(token, ollama_stream()):
+                    if started is not None:
+                        # Time to first token, queue wait included
+                        quality.llm_quality.observe((time.perf_counter() - started) * 1000)
+                        started = None
+                    ai_text += piece
+                    complete, pending = _split_sentences(pending + piece)
+                    for sentence in complete:
+                        sentences.put_nowait(sentence)
+        if pending.strip():
+            sentences.put_nowait(pending)
+    except Interrupted:
+        pass
+    finally:
+        sentences.put_nowait(None)
+        await asyncio.wait([speaker])
 
-def get_kokoro():
-    global _kokoro_instance
-    if _kokoro_instance is None:
-        if not KOKORO_AVAILABLE:
-            raise RuntimeError("Kokoro not installed")
-        if not os.path.exists(KOKORO_MODEL_PATH):
-            raise RuntimeError("Kokoro model files not found")
-        print("Loading Kokoro TTS model")
-        _kokoro_instance = Kokoro(KOKORO_MODEL_PATH, KOKORO_VOICES_BIN)
-    return _kokoro_instance
+    if not speaker.cancelled() and speaker.exception() is not None:
+        raise speaker.exception()
+    return ai_text.strip(), audio
 
 
 @router.post("/voice/chat")
 async def voice_chat(
+    http_request: Request,
+    background_tasks: BackgroundTasks,
+    response: Response,
     audio_file: UploadFile = File(...),
     session_id: int = Form(None),
     voice: str = Form("af_sarah"),
-    model: str = Form("llama3.2-vision:latest"),
+    model: str = Form(None),
     speed: float = Form(1.0),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Voice chat endpoint: Audio in -> Audio out.
     1. Transcribe audio (STT)
     2. Get LLM response
-    3. Synthesize speech (TTS)
+    3. Synthesize speech (TTS), sentence by sentence while the answer streams
     4. Save to session
     Returns JSON with text and audio URL.
+
+    Under load, cheaper settings are used (see quality.py); the tiers that
+    served the turn are returned in "quality" and the X-Quality-Tier header.
+
+    A new request on the same session (the user spoke again), POST
+    /voice/sessions/{id}/cancel or a client disconnect stops the turn; what
+    was produced so far is saved with status "interrupted".
     """
     if not WHISPER_AVAILABLE:
         raise HTTPException(status_code=500, detail="STT not available (faster-whisper not installed)")
@@ -84,61 +139,61 @@ async def voice_chat(
     
     saved_audio_path = ""
     output_audio_path = ""
+    token = None
+    watcher = None
     
     try:
+        model = model or model_catalog.default_model("chat")
+
         # Step 1: Get or create session
         if session_id:
-            session = db.query(VoiceSession).filter(VoiceSession.id == session_id).first()
+            session = await db.get(VoiceSession, session_id)
             if not session:
                 raise HTTPException(status_code=404, detail="Session not found")
         else:
             # Create new session
             session = VoiceSession(title="Voice Conversation")
             db.add(session)
-            db.commit()
-            db.refresh(session)
+            with span("db.commit"):
+                await db.commit()
+                await db.refresh(session)
         
-        # Step 2: Save uploaded audio
+        # Step 2: Read uploaded audio (archived to static/ after the response, see Step 6)
+        with span("upload.read"):
+            audio_data = await audio_file.read()
         file_ext = os.path.splitext(audio_file.filename)[1] or ".wav"
         audio_filename = f"{uuid.uuid4()}{file_ext}"
         saved_audio_path = os.path.join("static", audio_filename)
         
-        with open(saved_audio_path, "wb") as buffer:
-            shutil.copyfileobj(audio_file.file, buffer)
-        
-        # Step 3: Transcribe (STT)
-        whisper = get_whisper_model()
-        segments, info = whisper.transcribe(saved_audio_path, beam_size=5)
-        user_text = "".join([segment.text for segment in segments]).strip()
+        # A new turn on this session interrupts the one still running (barge-in)
+        token = cancellation.register(("voice", session.id))
+        watcher = asyncio.ensure_future(cancellation.watch_disconnect(http_request, token))
+
+        # Step 3: Transcribe (STT), decoding the upload in memory
+        stt_tier, stt_options = quality.stt_settings()
+        with span("stt", bytes=len(audio_data), tier=stt_tier), quality.stt_quality.track():
+            info = await asyncio.to_thread(lambda: transcribe(decode_upload(audio_data), **stt_options))
+        user_text = info.text
         
         if not user_text:
             raise HTTPException(status_code=400, detail="Could not transcribe audio. Please speak clearly.")
         
-        # Step 4: Get LLM response
-        response = ollama.chat(
-            model=model,
-            messages=[{
-                "role": "user",
-                "content": user_text
-            }],
-            stream=False
-        )
-        
-        ai_text = response["message"]["content"]
-        
-        # Step 5: Synthesize speech (TTS)
-        kokoro = get_kokoro()
-        samples, sample_rate = kokoro.create(
-            ai_text,
-            voice=voice,
-            speed=speed,
-            lang="en-us"
-        )
+        # Step 4 + 5: Get LLM response and synthesize speech (TTS)
+        llm_tier, model, llm_options = quality.llm_settings(model, voice=True)
+        tts_tier, tts_speed = quality.tts_speed(speed)
+        ai_text, audio = "", []
+        if not token.cancelled:
+            ai_text, audio = await _respond(token, model, user_text, voice, tts_speed, llm_options)
+        status = "interrupted" if token.cancelled else "complete"
         
         # Save output audio
-        output_filename = f"{uuid.uuid4()}.wav"
-        output_audio_path = os.path.join("static", output_filename)
-        sf.write(output_audio_path, samples, sample_rate, format='WAV')
+        output_filename = None
+        if audio:
+            output_filename = f"{uuid.uuid4()}.wav"
+            output_audio_path = os.path.join("static", output_filename)
+            with span("file.write"):
+                samples = np.concatenate([chunk for chunk, _ in audio])
+                sf.write(output_audio_path, samples, audio[0][1], format='WAV')
         
         # Step 6: Save message to session
         message = VoiceMessage(
@@ -146,28 +201,39 @@ async def voice_chat(
             user_audio_path=f"/static/{audio_filename}",
             user_text=user_text,
             ai_text=ai_text,
-            ai_audio_path=f"/static/{output_filename}",
+            ai_audio_path=f"/static/{output_filename}" if output_filename else None,
             language=info.language,
-            language_probability=info.language_probability
+            language_probability=info.language_probability,
+            status=status
         )
-        db.add(message)
         
         # Update session title with first user message
-        if len(session.messages) == 0:
+        previous_messages = await db.scalar(
+            select(func.count()).select_from(VoiceMessage).where(VoiceMessage.session_id == session.id)
+        )
+        db.add(message)
+        if previous_messages == 0:
             session.title = user_text[:50] if len(user_text) > 50 else user_text
         
-        db.commit()
-        db.refresh(message)
+        with span("db.commit"):
+            await db.commit()
+            await db.refresh(message)
+        background_tasks.add_task(_archive_or_clear, saved_audio_path, audio_data, message.id)
         
         # Return response
+        tiers = {"stt": stt_tier, "llm": llm_tier, "tts": tts_tier}
+        response.headers["X-Quality-Tier"] = quality.header(**tiers)
         return {
             "session_id": session.id,
             "message_id": message.id,
             "user_text": user_text,
             "ai_text": ai_text,
-            "audio_url": f"/static/{output_filename}",
+            "audio_url": f"/static/{output_filename}" if output_filename else None,
             "language": info.language,
-            "language_probability": info.language_probability
+            "language_probability": info.language_probability,
+            "status": status,
+            "model": model,
+            "quality": quality.report(**tiers)
         }
         
     except HTTPException:
@@ -176,19 +242,32 @@ async def voice_chat(
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Voice chat failed: {str(e)}")
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+        if token is not None:
+            cancellation.unregister(token)
+
+
+@router.post("/voice/sessions/{session_id}/cancel")
+async def cancel_voice_turn(session_id: int):
+    """Stop the turn in progress, e.g. when the user starts speaking again."""
+    if not cancellation.cancel(("voice", session_id)):
+        raise HTTPException(status_code=404, detail="No turn in progress")
+    return {"status": "cancelled"}
 
 
 @router.get("/voice/sessions")
-async def get_voice_sessions(db: Session = Depends(get_db)):
+async def get_voice_sessions(db: AsyncSession = Depends(get_async_db)):
     """Get all voice sessions"""
-    sessions = db.query(VoiceSession).order_by(VoiceSession.created_at.desc()).all()
+    sessions = (await db.scalars(select(VoiceSession).order_by(VoiceSession.created_at.desc()))).all()
     return sessions
 
 
 @router.get("/voice/sessions/{session_id}")
-async def get_voice_session(session_id: int, db: Session = Depends(get_db)):
+async def get_voice_session(session_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get specific voice session with all messages"""
-    session = db.query(VoiceSession).filter(VoiceSession.id == session_id).first()
+    session = await db.get(VoiceSession, session_id, options=[selectinload(VoiceSession.messages)])
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -206,6 +285,7 @@ async def get_voice_session(session_id: int, db: Session = Depends(get_db)):
                 "ai_audio_path": msg.ai_audio_path,
                 "language": msg.language,
                 "language_probability": msg.language_probability,
+                "status": msg.status,
                 "created_at": msg.created_at
             }
             for msg in session.messages
@@ -214,9 +294,9 @@ async def get_voice_session(session_id: int, db: Session = Depends(get_db)):
 
 
 @router.delete("/voice/sessions/{session_id}")
-async def delete_voice_session(session_id: int, db: Session = Depends(get_db)):
+async def delete_voice_session(session_id: int, db: AsyncSession = Depends(get_async_db)):
     """Delete a voice session and all its messages"""
-    session = db.query(VoiceSession).filter(VoiceSession.id == session_id).first()
+    session = await db.get(VoiceSession, session_id, options=[selectinload(VoiceSession.messages)])
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
     
@@ -230,6 +310,6 @@ async def delete_voice_session(session_id: int, db: Session = Depends(get_db)):
         except Exception as e:
             print(f"Warning: Could not delete audio files: {e}")
     
-    db.delete(session)
-    db.commit()
+    await db.delete(session)
+    await db.commit()
     return {"status": "success"}
@@ -0,0 +1,108 @@
+"""
+Full-text search over all history tables (SQLite FTS5).
+
+Each searchable table gets an external-content FTS5 index ("<table>_fts")
+that stores only the index, not a second copy of the text, and is kept in
+sync by insert/update/delete triggers. Results from all tables are ranked
+together by bm25 and returned with highlighted snippets.
+
+Indexes are created at startup; a newly created index is filled from the
+existing rows. migrate_search_index.py rebuilds them all.
+"""
+import re
+from typing import List, Optional
+
+# type -> (table, indexed columns, column linking the row to its session or None)
+SOURCES = {
+    "chat": ("chat_messages", ("content",), "session_id"),
+    "translate": ("translate_history", ("source_text", "translated_text"), None),
+    "stt": ("stt_history", ("transcript",), None),
+    "vision": ("vision_history", ("prompt", "response"), None),
+    "voice": ("voice_messages", ("user_text", "ai_text"), "session_id"),
+}
+SESSION_TABLES = {"chat": "chat_sessions", "voice": "voice_sessions"}
+
+SNIPPET_TOKENS = 12
+MAX_TERMS = 16
+
+
+def _index_ddl(table: str, columns: tuple) -> List[str]:
+    fts = f"{table}_fts"
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    return [
+        # prefix indexes make search-as-you-type ("transl*") cheap
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{cols}, content='{table}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_update AFTER UPDATE ON {table} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new}); END",
+    ]
+
+
+def ensure_search_index(connection, rebuild: bool = False) -> List[str]:
+    """
+    Create missing indexes and triggers on a sync SQLAlchemy connection.
+    New indexes (or all of them, with rebuild=True) are filled from the
+    existing rows. Returns the tables that were (re)indexed.
+    """
+    existing = {
+        row[0] for row in connection.exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%\\_fts' ESCAPE '\\'"
+        )
+    }
+    indexed = []
+    for table, columns, _ in SOURCES.values():
+        fts = f"{table}_fts"
+        for statement in _index_ddl(table, columns):
+            connection.exec_driver_sql(statement)
+        if rebuild or fts not in existing:
+            connection.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            indexed.append(table)
+    return indexed
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    FTS5 query for free text: every word must match, the last one as a prefix.
+    Words are quoted, so FTS5 operators and punctuation in user input are inert.
+    """
+    terms = re.findall(r"\w+", query)[:MAX_TERMS]
+    if not terms:
+        return None
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def search_sql(types: List[str]) -> str:
+    """UNION of one ranked query per source; bind :match, :limit and :offset."""
+    parts = []
+    for kind in types:
+        table, _, parent = SOURCES[kind]
+        fts = f"{table}_fts"
+        session_table = SESSION_TABLES.get(kind)
+        title = "s.title" if session_table else "NULL"
+        join = f"LEFT JOIN {session_table} s ON s.id = t.{parent}" if session_table else ""
+        parts.append(
+            f"SELECT '{kind}' AS type, t.id AS id, {f't.{parent}' if parent else 'NULL'} AS session_id, "
+            f"{title} AS title, t.created_at AS created_at, "
+            f"snippet({fts}, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) AS snippet, "
+            f"bm25({fts}) AS rank "
+            f"FROM {fts} JOIN {table} t ON t.id = {fts}.rowid {join} "
+            f"WHERE {fts} MATCH :match"
+        )
+    return " UNION ALL ".join(parts) + " ORDER BY rank LIMIT :limit OFFSET :offset"
+
+
+def count_sql(types: List[str]) -> str:
+    return "SELECT " + " + ".join(
+        f"(SELECT count(*) FROM {SOURCES[kind][0]}_fts WHERE {SOURCES[kind][0]}_fts MATCH :match)"
+        for kind in types
+    )
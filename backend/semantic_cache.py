@@ -0,0 +1,171 @@
+"""
+Semantic answer cache for RAG chat.
+
+Answers are stored under (question embedding, doc_id, model). A new question
+is a hit when a stored question for the same doc_id and model has cosine
+similarity above the threshold, so rephrasings of a frequent question are
+answered without retrieval or generation.
+
+Entries for a document are dropped when it is deleted or re-ingested; entries
+that searched all documents (doc_id None) or the document's namespace are
+dropped on any change to it.
+The cache lives in process memory, so each API worker keeps its own. To keep
+workers from serving answers about documents another worker changed, every
+entry carries the generation of its scope (a counter in the database, bumped
+with each change, see generation_keys()); a lookup only matches entries of the
+current generation.
+Entries also expire after a TTL and the least recently used ones are evicted
+beyond max_entries.
+
+Configuration (environment variables):
+    RAG_CACHE_ENABLED       1 to enable the cache
+    RAG_CACHE_THRESHOLD     minimum cosine similarity for a hit
+    RAG_CACHE_TTL_SECONDS   lifetime of an entry
+    RAG_CACHE_MAX_ENTRIES   LRU size limit
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+
+RAG_CACHE_ENABLED = os.getenv("RAG_CACHE_ENABLED", "1") == "1"
+RAG_CACHE_THRESHOLD = float(os.getenv("RAG_CACHE_THRESHOLD", "0.95"))
+RAG_CACHE_TTL_SECONDS = float(os.getenv("RAG_CACHE_TTL_SECONDS", "3600"))
+RAG_CACHE_MAX_ENTRIES = int(os.getenv("RAG_CACHE_MAX_ENTRIES", "1000"))
+ALL_DOCUMENTS = "*"
+
+
+def namespace_scope(namespace: Optional[str]) -> Optional[str]:
+    """Cache key used in place of doc_id for questions scoped to a namespace."""
+    return f"ns:{namespace}" if namespace else None
+
+
+def generation_key(scope: Optional[str]) -> str:
+    """Database key of a cache scope's generation."""
+    return scope or ALL_DOCUMENTS
+
+
+def generation_keys(doc_id: str, namespace: Optional[str] = None) -> List[str]:
+    """Generations to bump when doc_id changes (the scopes invalidate_document drops)."""
+    keys = [doc_id, ALL_DOCUMENTS]
+    if namespace:
+        keys.append(namespace_scope(namespace))
+    return keys
+
+
+class SemanticCache:
+    def __init__(self, threshold: float, ttl_seconds: float, max_entries: int):
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # entry id -> entry, in LRU order
+        self._buckets = {}             # (doc_id, model) -> {"ids": [...], "matrix": ndarray or None}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) + 1e-12)
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        bucket = self._buckets.get(entry["bucket"])
+        if bucket:
+            bucket["ids"].remove(entry_id)
+            bucket["matrix"] = None
+            if not bucket["ids"]:
+                del self._buckets[entry["bucket"]]
+
+    def _matrix(self, bucket: dict) -> np.ndarray:
+        if bucket["matrix"] is None:
+            bucket["matrix"] = np.stack([self._entries[i]["vector"] for i in bucket["ids"]])
+        return bucket["matrix"]
+
+    def lookup(self, embedding: List[float], doc_id: Optional[str], model: str, generation: int = 0) -> Optional[dict]:
+        """Stored response of the given scope generation for a similar enough question, or None."""
+        vector = self._normalize(embedding)
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get((doc_id, model))
+            if bucket:
+                expired = [i for i in bucket["ids"] if self._entries[i]["expires_at"] <= now]
+                for entry_id in expired:
+                    self._remove(entry_id)
+                    self._evictions += 1
+                # Documents changed since, possibly through another worker
+                stale = [i for i in bucket["ids"] if self._entries[i]["generation"] != generation]
+                for entry_id in stale:
+                    self._remove(entry_id)
+                    self._invalidations += 1
+                bucket = self._buckets.get((doc_id, model))
+            if bucket:
+                scores = self._matrix(bucket) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry_id = bucket["ids"][best]
+                    self._entries.move_to_end(entry_id)
+                    self._hits += 1
+                    return {**self._entries[entry_id]["response"], "cache_similarity": float(scores[best])}
+            self._misses += 1
+            return None
+
+    def store(self, embedding: List[float], doc_id: Optional[str], model: str, response: dict, generation: int = 0):
+        entry_id = uuid.uuid4().hex
+        key = (doc_id, model)
+        with self._lock:
+            self._entries[entry_id] = {
+                "vector": self._normalize(embedding),
+                "bucket": key,
+                "response": response,
+                "generation": generation,
+                "expires_at": time.time() + self.ttl_seconds,
+            }
+            bucket = self._buckets.setdefault(key, {"ids": [], "matrix": None})
+            bucket["ids"].append(entry_id)
+            bucket["matrix"] = None
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self._evictions += 1
+
+    def invalidate_document(self, doc_id: str, namespace: str = None):
+        """Drop answers that may depend on doc_id: its own, its namespace's and all-document ones."""
+        scopes = {doc_id, None, namespace_scope(namespace)}
+        with self._lock:
+            stale = [i for i, e in self._entries.items() if e["bucket"][0] in scopes]
+            for entry_id in stale:
+                self._remove(entry_id)
+            self._invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": RAG_CACHE_ENABLED,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "threshold": self.threshold,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+rag_answer_cache = SemanticCache(RAG_CACHE_THRESHOLD, RAG_CACHE_TTL_SECONDS, RAG_CACHE_MAX_ENTRIES)
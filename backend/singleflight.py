@@ -0,0 +1,132 @@
+"""
+Request coalescing ("single flight") for identical in-flight inference calls.
+
+When several requests with the same key arrive while the first one is still
+being computed (front-end retries, many users sending the same prompt), they
+attach to that computation and share its result or its exception instead of
+running their own. Nothing is kept once the computation finishes; this is not
+a cache.
+
+If every waiter goes away (client disconnects), the computation is cancelled.
+Work already handed to a thread (asyncio.to_thread) runs to completion, but
+nothing waits for it or uses its result.
+
+Streams can be shared too: late joiners first get the items produced so far,
+then follow the live stream.
+"""
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Hashable, Tuple
+
+
+class _Call:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class _SharedStream:
+    def __init__(self, source: AsyncIterator):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.consumers = 0
+        self._changed = asyncio.Event()
+        self.task = asyncio.ensure_future(self._produce(source))
+
+    async def _produce(self, source: AsyncIterator):
+        try:
+            async for item in source:
+                self.items.append(item)
+                self._changed.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._changed.set()
+
+    async def follow(self) -> AsyncIterator:
+        position = 0
+        while True:
+            while position < len(self.items):
+                yield self.items[position]
+                position += 1
+            if self.done:
+                if self.error is not None:
+                    raise self.error
+                return
+            self._changed.clear()
+            if position < len(self.items) or self.done:
+                continue
+            await self._changed.wait()
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._streams = {}
+        self._leaders = 0
+        self._joined = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+        """
+        Await fn() once per key among concurrent callers.
+        Returns (result, shared); shared is False for the caller that started the work.
+        """
+        call = self._calls.get(key)
+        shared = call is not None
+        if call is None:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(self._calls, key, call))
+            self._leaders += 1
+        else:
+            self._joined += 1
+
+        call.waiters += 1
+        try:
+            # shield: one waiter being cancelled must not cancel the others' work
+            return await asyncio.shield(call.task), shared
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                call.task.cancel()
+
+    async def stream(self, key: Hashable, source: Callable[[], AsyncIterator]) -> AsyncIterator:
+        """Iterate source() once per key among concurrent consumers."""
+        shared_stream = self._streams.get(key)
+        if shared_stream is None:
+            shared_stream = _SharedStream(source())
+            self._streams[key] = shared_stream
+            shared_stream.task.add_done_callback(lambda _: self._forget(self._streams, key, shared_stream))
+            self._leaders += 1
+        else:
+            self._joined += 1
+
+        shared_stream.consumers += 1
+        try:
+            async for item in shared_stream.follow():
+                yield item
+        finally:
+            shared_stream.consumers -= 1
+            if shared_stream.consumers == 0 and not shared_stream.task.done():
+                shared_stream.task.cancel()
+
+    @staticmethod
+    def _forget(registry: dict, key: Hashable, entry):
+        if registry.get(key) is entry:
+            del registry[key]
+
+    def stats(self) -> dict:
+        total = self._leaders + self._joined
+        return {
+            "in_flight": len(self._calls) + len(self._streams),
+            "computed": self._leaders,
+            "coalesced": self._joined,
+            "coalesced_ratio": self._joined / total if total else 0.0,
+        }
+
+
+def normalize_text(text: str) -> str:
+    """Key form of free text: surrounding and repeated whitespace does not matter."""
+    return " ".join(text.split())
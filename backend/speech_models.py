@@ -0,0 +1,138 @@
+"""
+Shared Faster-Whisper and Kokoro models.
+The STT, TTS and voice chat routers all go through transcribe()/synthesize(),
+so each model is loaded (and warmed up) once per process instead of once per
+router. When INFERENCE_SERVER_ADDRESS is set the models live in a separate
+inference_server.py process instead, shared by every API worker.
+"""
+import importlib.util
+import io
+import os
+import threading
+from typing import NamedTuple
+from kokoro_runtime import VoiceStyleCache, load_kokoro
+
+INFERENCE_SERVER_ADDRESS = os.getenv("INFERENCE_SERVER_ADDRESS") or None
+INFERENCE_CLIENT_CONNECTIONS = int(os.getenv("INFERENCE_CLIENT_CONNECTIONS", "8"))
+
+# The model libraries pull in CTranslate2/PyAV and ONNX Runtime, so only check
+# that they are installed here and import them when a model is first loaded.
+WHISPER_INSTALLED = importlib.util.find_spec("faster_whisper") is not None
+KOKORO_INSTALLED = importlib.util.find_spec("kokoro_onnx") is not None
+# With a dedicated inference server the libraries only need to be installed there
+WHISPER_AVAILABLE = WHISPER_INSTALLED or INFERENCE_SERVER_ADDRESS is not None
+KOKORO_AVAILABLE = KOKORO_INSTALLED or INFERENCE_SERVER_ADDRESS is not None
+if not WHISPER_AVAILABLE:
+    print("faster-whisper not installed.")
+if not KOKORO_AVAILABLE:
+    print("Kokoro-onnx not installed.")
+
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "tiny")  # or "base", "small", "medium", "large-v3" based on hardware
+WHISPER_DEVICE = os.getenv("WHISPER_DEVICE", "cpu")  # or "cuda"
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")  # or "float16" for cuda
+# Number of transcriptions one Whisper instance can run in parallel
+WHISPER_NUM_WORKERS = int(os.getenv("WHISPER_NUM_WORKERS", "1"))
+
+# Model path and ONNX Runtime session settings are configured in kokoro_runtime.py
+KOKORO_VOICES_BIN = "models/voices.bin"
+KOKORO_VOICES_JSON = "models/voices.json"
+
+_whisper_model = None
+# Other Whisper sizes, e.g. the smaller one used under load (see quality.py)
+_extra_whisper_models = {}
+_kokoro_instance = None
+_inference_client = None
+_whisper_lock = threading.Lock()
+_kokoro_lock = threading.Lock()
+_voice_styles = VoiceStyleCache()
+
+
+def _load_whisper(model_size: str):
+    if not WHISPER_INSTALLED:
+        raise RuntimeError("faster-whisper library not installed.")
+    from faster_whisper import WhisperModel
+    print(f"Loading Faster-Whisper model: {model_size} on {WHISPER_DEVICE}...")
+    model = WhisperModel(
+        model_size,
+        device=WHISPER_DEVICE,
+        compute_type=WHISPER_COMPUTE_TYPE,
+        num_workers=WHISPER_NUM_WORKERS,
+    )
+    print("Faster-Whisper model loaded.")
+    return model
+
+
+def get_whisper_model(model_size: str = None):
+    """The WHISPER_MODEL_SIZE model, or another size if given (each loaded once)."""
+    global _whisper_model
+    if model_size and model_size != WHISPER_MODEL_SIZE:
+        if model_size not in _extra_whisper_models:
+            with _whisper_lock:
+                if model_size not in _extra_whisper_models:
+                    _extra_whisper_models[model_size] = _load_whisper(model_size)
+        return _extra_whisper_models[model_size]
+    if _whisper_model is None:
+        with _whisper_lock:
+            if _whisper_model is None:
+                _whisper_model = _load_whisper(WHISPER_MODEL_SIZE)
+    return _whisper_model
+
+
+def get_kokoro():
+    global _kokoro_instance
+    if _kokoro_instance is None:
+        with _kokoro_lock:
+            if _kokoro_instance is None:
+                if not KOKORO_INSTALLED:
+                    raise RuntimeError("Kokoro-onnx library not installed.")
+                if not os.path.exists(KOKORO_VOICES_BIN):
+                    raise RuntimeError("Kokoro model files not found in models/")
+                print("Loading Kokoro TTS model...")
+                _kokoro_instance = load_kokoro(KOKORO_VOICES_BIN)
+                print("Kokoro TTS model loaded.")
+    return _kokoro_instance
+
+
+class Transcription(NamedTuple):
+    text: str
+    language: str
+    language_probability: float
+
+
+def get_inference_client():
+    global _inference_client
+    if _inference_client is None:
+        from inference_server import InferenceClient
+        _inference_client = InferenceClient(INFERENCE_SERVER_ADDRESS, max_connections=INFERENCE_CLIENT_CONNECTIONS)
+    return _inference_client
+
+
+def transcribe_local(audio, beam_size: int = 5, model_size: str = None) -> Transcription:
+    if isinstance(audio, (bytes, bytearray)):
+        audio = io.BytesIO(audio)
+    segments, info = get_whisper_model(model_size).transcribe(audio, beam_size=beam_size)
+    text = "".join([segment.text for segment in segments]).strip()
+    return Transcription(text, info.language, info.language_probability)
+
+
+def synthesize_local(text: str, voice: str, speed: float = 1.0, lang: str = "en-us"):
+    kokoro = get_kokoro()
+    return kokoro.create(text, voice=_voice_styles.get(kokoro, voice), speed=speed, lang=lang)
+
+
+def transcribe(audio, beam_size: int = 5, model_size: str = None) -> Transcription:
+    """
+    Transcribe a file path, file-like object, encoded audio bytes or a
+    16 kHz float32 NumPy buffer. model_size picks a Whisper size other than
+    WHISPER_MODEL_SIZE.
+    """
+    if INFERENCE_SERVER_ADDRESS:
+        return Transcription(*get_inference_client().transcribe(audio, beam_size=beam_size, model_size=model_size))
+    return transcribe_local(audio, beam_size=beam_size, model_size=model_size)
+
+
+def synthesize(text: str, voice: str, speed: float = 1.0, lang: str = "en-us"):
+    """Returns (samples, sample_rate)."""
+    if INFERENCE_SERVER_ADDRESS:
+        return get_inference_client().synthesize(text, voice=voice, speed=speed, lang=lang)
+    return synthesize_local(text, voice=voice, speed=speed, lang=lang)
@@ -0,0 +1,92 @@
+"""
+Startup-time instrumentation.
+
+timed_import() records how long each module takes to import so main.py can
+report where cold-start time goes. Run this file directly to get a full
+per-module breakdown of `import main` via `python -X importtime`:
+
+    python startup.py               # top 25 modules by cumulative import time
+    python startup.py --budget 1.0  # exit 1 if importing main takes over a second
+"""
+import argparse
+import importlib
+import subprocess
+import sys
+import time
+
+# module name -> seconds spent importing it (cumulative, including its dependencies)
+IMPORT_TIMES = {}
+# phase name -> seconds, filled in by the app's lifespan handler
+STARTUP_PHASES = {}
+
+
+def timed_import(name: str):
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    return module
+
+
+class timed_phase:
+    """Context manager recording the duration of a startup phase."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STARTUP_PHASES[self.name] = time.perf_counter() - self.start
+
+
+def startup_report() -> dict:
+    return {
+        "imports": {k: round(v, 4) for k, v in sorted(IMPORT_TIMES.items(), key=lambda kv: -kv[1])},
+        "phases": {k: round(v, 4) for k, v in STARTUP_PHASES.items()},
+    }
+
+
+def profile_imports(target: str = "main"):
+    """
+    Import `target` in a fresh interpreter with -X importtime and return
+    (total_seconds, [(module, self_seconds, cumulative_seconds), ...]).
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, self_us, cumulative_us, module = [p.strip() for p in line.replace("import time:", "|").split("|")]
+        rows.append((module.strip(), int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    total = next((cum for mod, _, cum in rows if mod == target), 0.0)
+    return total, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report per-module import cost of the API")
+    parser.add_argument("--target", default="main", help="Module to import (default: main)")
+    parser.add_argument("--top", type=int, default=25, help="Number of modules to show")
+    parser.add_argument("--budget", type=float, help="Fail if the total import time exceeds this many seconds")
+    args = parser.parse_args()
+
+    total, rows = profile_imports(args.target)
+    print(f"{'cumulative':>11} {'self':>9}  module")
+    for module, self_s, cumulative_s in sorted(rows, key=lambda r: -r[2])[:args.top]:
+        print(f"{cumulative_s * 1000:>9.1f}ms {self_s * 1000:>7.1f}ms  {module}")
+    print(f"\nTotal import time for {args.target}: {total:.3f}s")
+
+    if args.budget is not None and total > args.budget:
+        print(f"Over budget ({args.budget:.3f}s)")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
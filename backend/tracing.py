@@ -0,0 +1,193 @@
+"""
+Per-request trace spans.
+
+Every HTTP request gets a root span; code on the request path opens child
+spans around its steps (upload save, STT, LLM, TTS, file write, DB commit):
+
+    with span("stt"):
+        info = await asyncio.to_thread(transcribe, audio)
+
+Spans follow the request through awaits and into asyncio.to_thread /
+run_in_threadpool (which copy the context). Outside a request, span() is a
+no-op. When the request ends, its span tree is appended as one JSON line to
+a rotating trace file. A client that sends "X-Debug-Trace: 1" also gets the
+span timings back in a Server-Timing header (browser dev tools show it in
+the request's Timing tab). For streamed responses, the header only covers
+steps that finished before the first byte; the trace file has all of them.
+Responses carry X-Trace-Id to find the request in the file.
+
+Configuration (environment variables):
+    TRACE_ENABLED          record request traces (default 1)
+    TRACE_FILE             trace file (default traces/requests.jsonl)
+    TRACE_FILE_MAX_BYTES   size at which the file is rotated
+    TRACE_FILE_BACKUPS     rotated files kept
+    TRACE_MIN_MS           only write requests slower than this
+    TRACE_DEBUG_HEADER     honour X-Debug-Trace (default 1)
+"""
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+TRACE_ENABLED = os.getenv("TRACE_ENABLED", "1") == "1"
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join("traces", "requests.jsonl"))
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(10 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+TRACE_MIN_MS = float(os.getenv("TRACE_MIN_MS", "0"))
+TRACE_DEBUG_HEADER = os.getenv("TRACE_DEBUG_HEADER", "1") == "1"
+# Paths not worth a trace line
+TRACE_SKIP_PREFIXES = ("/static", "/health", "/ready")
+
+_current: ContextVar[Optional["Span"]] = ContextVar("trace_span", default=None)
+_logger = None
+
+
+class Span:
+    __slots__ = ("name", "attrs", "start", "end", "children")
+
+    def __init__(self, name: str, attrs: dict = None):
+        self.name = name
+        self.attrs = attrs or {}
+        self.start = time.perf_counter()
+        self.end = None
+        self.children = []
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end or time.perf_counter()) - self.start) * 1000
+
+    def to_dict(self, origin: float) -> dict:
+        entry = {
+            "name": self.name,
+            "start_ms": round((self.start - origin) * 1000, 2),
+            "duration_ms": round(self.duration_ms, 2),
+        }
+        if self.attrs:
+            entry["attrs"] = self.attrs
+        if self.children:
+            entry["children"] = [child.to_dict(origin) for child in list(self.children)]
+        return entry
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a step of the current request as a child of the innermost open span."""
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.attrs["error"] = type(e).__name__
+        raise
+    finally:
+        child.end = time.perf_counter()
+        try:
+            _current.reset(token)
+        except ValueError:
+            # A generator closed from another context (e.g. a dropped stream)
+            pass
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def server_timing(root: Span) -> str:
+    """Server-Timing value: total duration per span name (repeated steps summed)."""
+    totals, counts = {}, {}
+
+    def walk(node):
+        for child in list(node.children):
+            if child.end is not None:
+                totals[child.name] = totals.get(child.name, 0.0) + child.duration_ms
+                counts[child.name] = counts.get(child.name, 0) + 1
+            walk(child)
+
+    walk(root)
+    metrics = [
+        f'{name};dur={total:.1f}' + (f';desc="x{counts[name]}"' if counts[name] > 1 else "")
+        for name, total in totals.items()
+    ]
+    metrics.append(f"total;dur={root.duration_ms:.1f}")
+    return ", ".join(metrics)
+
+
+def _get_logger():
+    global _logger
+    if _logger is None:
+        directory = os.path.dirname(TRACE_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logger = logging.getLogger("ai_playground.trace")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(TRACE_FILE, maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUPS)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _logger = logger
+    return _logger
+
+
+def write_trace(trace_id: str, root: Span, status: Optional[int]):
+    if root.duration_ms < TRACE_MIN_MS:
+        return
+    record = {
+        "trace_id": trace_id,
+        "time": datetime.now(timezone.utc).isoformat(),
+        "status": status,
+        **root.to_dict(root.start),
+    }
+    try:
+        _get_logger().info(json.dumps(record, default=str))
+    except Exception as e:
+        print(f"Warning: Could not write trace: {e}")
+
+
+class TraceMiddleware:
+    """ASGI middleware opening the root span of each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if not TRACE_ENABLED or scope["type"] != "http" or scope["path"].startswith(TRACE_SKIP_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = uuid.uuid4().hex[:16]
+        root = Span(f"{scope['method']} {scope['path']}")
+        debug = TRACE_DEBUG_HEADER and (b"x-debug-trace", b"1") in scope.get("headers", [])
+        status = None
+
+        async def traced_send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-trace-id", trace_id.encode()))
+                if debug:
+                    headers.append((b"server-timing", server_timing(root).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = _current.set(root)
+        try:
+            await self.app(scope, receive, traced_send)
+        except BaseException as e:
+            root.attrs["error"] = type(e).__name__
+            raise
+        finally:
+            root.end = time.perf_counter()
+            _current.reset(token)
+            write_trace(trace_id, root, status)
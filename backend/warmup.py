@@ -0,0 +1,146 @@
+"""
+Model preloading and warm-up.
+
+Runs once when the app starts (on a background thread, so /health answers
+immediately): loads the configured models, pushes a tiny dummy input through
+each one so first-inference allocations and JIT happen before real traffic,
+and asks Ollama to keep the chat model resident. /ready reports the result.
+
+A failed step is retried (Ollama may not be up yet) unless the error won't go
+away by itself, such as a model that isn't pulled. Steps for the optional
+cheaper models used under load (quality.py) are then reported as skipped and
+don't hold /ready back. Shutdown stops the retries (stop()).
+
+Configuration (environment variables):
+    PRELOAD_MODELS          comma-separated subset of whisper,kokoro,ollama ("" disables warm-up)
+    WARMUP_OLLAMA_MODELS    Ollama models to load and keep resident
+    OLLAMA_KEEP_ALIVE       how long Ollama keeps warmed models loaded (e.g. "30m", "-1" for forever)
+    WARMUP_RETRY_SECONDS    delay before retrying a failed step (e.g. Ollama not up yet)
+    WARMUP_MAX_ATTEMPTS     attempts per step before giving up
+"""
+import os
+import threading
+import time
+
+PRELOAD_MODELS = [m.strip() for m in os.getenv("PRELOAD_MODELS", "whisper,kokoro,ollama").split(",") if m.strip()]
+WARMUP_OLLAMA_MODELS = [m.strip() for m in os.getenv("WARMUP_OLLAMA_MODELS", "llama3.2-vision:latest").split(",") if m.strip()]
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "10"))
+WARMUP_MAX_ATTEMPTS = int(os.getenv("WARMUP_MAX_ATTEMPTS", "30"))
+WARMUP_VOICE = "af_sarah"
+
+# step name -> {"status": pending|running|ready|skipped|failed, "seconds": float, "error": str}
+_steps = {}
+_state_lock = threading.Lock()
+_finished = threading.Event()
+_stop = threading.Event()
+
+
+def stop():
+    """Abandon warm-up at shutdown instead of sleeping through the remaining retries."""
+    _stop.set()
+
+
+def _permanent(error: Exception) -> bool:
+    """Errors a retry won't fix: bad configuration, or Ollama refusing the model (e.g. 404 not pulled)."""
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return 400 <= status < 500 and status != 429
+    return isinstance(error, ValueError)
+
+
+def _set_step(name: str, **fields):
+    with _state_lock:
+        _steps.setdefault(name, {"status": "pending"}).update(fields)
+
+
+def _warm_whisper(model_size: str = None):
+    def run():
+        import numpy as np
+        import speech_models
+        if not speech_models.WHISPER_AVAILABLE:
+            return "skipped"
+        # One second of silence at 16 kHz (goes to the inference server if one is configured)
+        speech_models.transcribe(np.zeros(16000, dtype=np.float32), beam_size=1, model_size=model_size)
+        return "ready"
+    return run
+
+
+def _warm_kokoro():
+    import speech_models
+    if not speech_models.KOKORO_AVAILABLE:
+        return "skipped"
+    speech_models.synthesize("Hello.", voice=WARMUP_VOICE, speed=1.0, lang="en-us")
+    return "ready"
+
+
+def _warm_ollama(model: str):
+    import ollama
+    from ollama_scheduler import ollama_scheduler, BATCH
+
+    def run():
+        # A one-token generation loads the weights and runs a forward pass;
+        # keep_alive keeps the model resident between requests.
+        with ollama_scheduler.slot(BATCH, model):
+            ollama.generate(model=model, prompt="Hi", options={"num_predict": 1}, keep_alive=OLLAMA_KEEP_ALIVE)
+        return "ready"
+    return run
+
+
+def _plan():
+    """[(name, step, optional)]"""
+    steps = []
+    # The cheaper models used under load (quality.py) are loaded up front too,
+    # so degrading doesn't start with a model load
+    from quality import QUALITY_ADAPTIVE, QUALITY_STT_MINIMAL_MODEL, QUALITY_VOICE_MINIMAL_MODEL
+    if "whisper" in PRELOAD_MODELS:
+        steps.append(("whisper", _warm_whisper(), False))
+        if QUALITY_ADAPTIVE and QUALITY_STT_MINIMAL_MODEL:
+            steps.append((f"whisper:{QUALITY_STT_MINIMAL_MODEL}", _warm_whisper(QUALITY_STT_MINIMAL_MODEL), True))
+    if "kokoro" in PRELOAD_MODELS:
+        steps.append(("kokoro", _warm_kokoro, False))
+    if "ollama" in PRELOAD_MODELS:
+        steps.extend((f"ollama:{m}", _warm_ollama(m), False) for m in WARMUP_OLLAMA_MODELS)
+        if QUALITY_ADAPTIVE and QUALITY_VOICE_MINIMAL_MODEL and QUALITY_VOICE_MINIMAL_MODEL not in WARMUP_OLLAMA_MODELS:
+            steps.append((f"ollama:{QUALITY_VOICE_MINIMAL_MODEL}", _warm_ollama(QUALITY_VOICE_MINIMAL_MODEL), True))
+    return steps
+
+
+def run_warmup():
+    """Load and warm every configured model. Blocking; call from a background thread."""
+    steps = _plan()
+    for name, _, _ in steps:
+        _set_step(name, status="pending")
+
+    for name, step, optional in steps:
+        for attempt in range(1, WARMUP_MAX_ATTEMPTS + 1):
+            if _stop.is_set():
+                return
+            _set_step(name, status="running", attempts=attempt)
+            start = time.perf_counter()
+            try:
+                status = step()
+                _set_step(name, status=status, seconds=round(time.perf_counter() - start, 3), error=None)
+                print(f"Warm-up {name}: {status} in {time.perf_counter() - start:.2f}s")
+                break
+            except Exception as e:
+                permanent = _permanent(e)
+                # An optional model that can't be loaded is done without, not a failure
+                gave_up = permanent or attempt == WARMUP_MAX_ATTEMPTS
+                status = "skipped" if optional and gave_up else "failed"
+                _set_step(name, status=status, seconds=round(time.perf_counter() - start, 3), error=str(e))
+                print(f"Warm-up {name} {status} (attempt {attempt}/{WARMUP_MAX_ATTEMPTS}): {e}")
+                if permanent:
+                    break
+                # Returns early if the app is shutting down
+                if attempt < WARMUP_MAX_ATTEMPTS and _stop.wait(WARMUP_RETRY_SECONDS):
+                    return
+    _finished.set()
+
+
+def readiness() -> tuple[bool, dict]:
+    """(ready, details). Ready once warm-up has finished and no step failed."""
+    with _state_lock:
+        steps = {name: dict(info) for name, info in _steps.items()}
+    ready = _finished.is_set() and all(s["status"] in ("ready", "skipped") for s in steps.values())
+    return ready, {"status": "ready" if ready else "warming_up", "steps": steps}
@@ -64,7 +64,8 @@ export function ChatInterface({ initialModel = "llama3.2" }: ChatInterfaceProps)
                     const modelNames = data.models.map((m: any) => m.model);
                     setAvailableModels(modelNames);
                     if (modelNames.length > 0 && !modelNames.includes(model)) {
-                        setModel(modelNames[0]);
+                        // The backend default prefers a model that is already loaded
+                        setModel(modelNames.includes(data.default) ? data.default : modelNames[0]);
                     }
                 }
             })
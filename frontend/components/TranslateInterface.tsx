@@ -45,7 +45,8 @@ export function TranslateInterface() {
                     const modelNames = data.models.map((m: any) => m.model);
                     setAvailableModels(modelNames);
                     if (modelNames.length > 0) {
-                        setModel(modelNames[0]);
+                        // The backend default prefers a model that is already loaded
+                        setModel(modelNames.includes(data.default) ? data.default : modelNames[0]);
                     }
                 }
             })
@@ -57,6 +58,54 @@ export function TranslateInterface() {
         "Russian", "Japanese", "Chinese", "Hindi", "Arabic"
     ];
 
+    // Long texts are translated paragraph by paragraph and shown as paragraphs finish
+    const LONG_TEXT_CHARS = 2000;
+
+    const translateDocument = async () => {
+        const response = await fetch("http://localhost:8000/api/translate/document", {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+            },
+            body: JSON.stringify({
+                text: text,
+                target_lang: targetLang,
+                model: model
+            }),
+        });
+
+        if (!response.ok || !response.body) {
+            const errorData = await response.json().catch(() => ({}));
+            throw new Error(errorData.detail || "Translation failed");
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        const segments: string[] = [];
+        let buffered = "";
+
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split("\n");
+            buffered = lines.pop() ?? "";
+            for (const line of lines) {
+                if (!line.trim()) continue;
+                const event = JSON.parse(line);
+                if (event.event === "segment") {
+                    segments[event.index] = event.before + event.text;
+                    setTranslation(Array.from(segments, (segment) => segment ?? "").join(""));
+                } else if (event.event === "done") {
+                    setTranslation(event.text);
+                } else if (event.event === "error") {
+                    throw new Error(event.detail || "Translation failed");
+                }
+            }
+        }
+    };
+
     const handleTranslate = async () => {
         if (!text.trim() || isLoading) return;
 
@@ -64,6 +113,11 @@ export function TranslateInterface() {
         setTranslation("");
 
         try {
+            if (text.length > LONG_TEXT_CHARS) {
+                await translateDocument();
+                return;
+            }
+
             const response = await fetch("http://localhost:8000/api/translate", {
                 method: "POST",
                 headers: {
@@ -46,12 +46,16 @@ export function VisionInterface({ initialModel = "llama3.2-vision" }: VisionInte
 
     useEffect(() => {
         // Fetch available models
-        fetch("http://localhost:8000/api/models")
+        // Only models that accept images
+        fetch("http://localhost:8000/api/vision/models")
             .then((res) => res.json())
             .then((data) => {
                 if (data && data.models) {
                     const modelNames = data.models.map((m: any) => m.model);
                     setAvailableModels(modelNames);
+                    if (modelNames.length > 0 && !modelNames.includes(model)) {
+                        setModel(modelNames.includes(data.default) ? data.default : modelNames[0]);
+                    }
                 }
             })
             .catch((err) => console.error("Failed to fetch models:", err));
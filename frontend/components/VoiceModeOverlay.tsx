@@ -35,6 +35,17 @@ export function VoiceModeOverlay({
     const abortControllerRef = useRef<AbortController | null>(null);
 
     const startListening = async () => {
+        // Barge-in: speaking again stops the previous answer (the backend
+        // cancels the turn when its request is aborted)
+        if (abortControllerRef.current) {
+            abortControllerRef.current.abort();
+            abortControllerRef.current = null;
+        }
+        if (audioRef.current) {
+            audioRef.current.pause();
+            audioRef.current = null;
+        }
+
         try {
             setState("listening");
             setIsRecording(true);
@@ -117,6 +128,12 @@ export function VoiceModeOverlay({
             setUserText(data.user_text);
             setAiText(data.ai_text);
 
+            // An interrupted turn may have no audio
+            if (!data.audio_url) {
+                setState("idle");
+                return;
+            }
+
             // Play AI response
             setState("speaking");
             const audio = new Audio(`http://localhost:8000${data.audio_url}`);